@@ -0,0 +1,102 @@
+# chat/access.py
+
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ChatRoom
+
+logger = logging.getLogger(__name__)
+
+ACCESS_CACHE_DEFAULTS = {
+    'LOCAL_ALIAS': 'default',
+    'LOCAL_TIMEOUT': 5,
+    'SHARED_ALIAS': 'chat',
+    'SHARED_TIMEOUT': 300,
+}
+
+
+def _config():
+    config = dict(ACCESS_CACHE_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_ACCESS_CACHE', {}))
+    return config
+
+
+def _tiers():
+    """Local-memory tier (по процес, краток TTL) па Redis tier (заеднички за сите процеси)"""
+    config = _config()
+    tiers = []
+    for alias, timeout in ((config['LOCAL_ALIAS'], config['LOCAL_TIMEOUT']),
+                           (config['SHARED_ALIAS'], config['SHARED_TIMEOUT'])):
+        if alias and alias in settings.CACHES:
+            tiers.append((caches[alias], timeout))
+    return tiers
+
+
+def _access_key(room_id, user_id):
+    return f'chat:access:{room_id}:{user_id}'
+
+
+def _cache_call(method, *args):
+    # Недостапен Redis не смее да го сруши чатот - се паѓа назад на базата
+    try:
+        return method(*args)
+    except Exception:
+        logger.warning('Chat access кешот не е достапен', exc_info=True)
+        return None
+
+
+def has_room_access(room_id, user_id):
+    """Провери дали корисникот е учесник во собата (кеширано по room_id, user_id)"""
+    key = _access_key(room_id, user_id)
+    tiers = _tiers()
+
+    missed = []
+    value = None
+    for cache, timeout in tiers:
+        value = _cache_call(cache.get, key)
+        if value is not None:
+            break
+        missed.append((cache, timeout))
+
+    if value is None:
+        value = int(ChatRoom.participants.through.objects.filter(
+            chatroom_id=room_id,
+            user_id=user_id
+        ).exists())
+
+    for cache, timeout in missed:
+        _cache_call(cache.set, key, value, timeout)
+
+    return bool(value)
+
+
+def authorize_room(room, user):
+    """
+    Провери пристап до собата. Инструкторот и активно запишаните студенти
+    автоматски се додаваат во курс собата при првата посета.
+    """
+    if has_room_access(room.id, user.id):
+        return True
+
+    if room.room_type == 'course' and room.course:
+        if (user == room.course.instructor or
+                room.course.enrollments.filter(student=user, is_active=True).exists()):
+            room.participants.add(user)
+            return True
+
+    return False
+
+
+def invalidate_room_access(room_ids, user_ids):
+    """Избриши ги кешираните одлуки за сите комбинации соба/корисник"""
+    keys = [
+        _access_key(room_id, user_id)
+        for room_id in room_ids
+        for user_id in user_ids
+    ]
+    if not keys:
+        return
+    for cache, _ in _tiers():
+        _cache_call(cache.delete_many, keys)
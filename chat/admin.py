@@ -1,12 +1,20 @@
 from django.contrib import admin
-from .models import ChatRoom, Message, MessageRead, UserChatSettings
+from .membership import sync_course_rooms
+from .models import ArchivedMessage, ChatRoom, ChatUpload, Message, MessageRead, RoomReadState, UserChatSettings
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
-    list_display = ('name', 'room_type', 'created_by', 'is_active', 'created_at')
+    list_display = ('name', 'room_type', 'created_by', 'is_active', 'retention_days', 'created_at')
     list_filter = ('room_type', 'is_active', 'created_at')
     search_fields = ('name', 'created_by__username')
     filter_horizontal = ('participants',)
+    actions = ['sync_course_participants']
+
+    @admin.action(description='Синхронизирај учесници според запишувањата')
+    def sync_course_participants(self, request, queryset):
+        course_ids = list(queryset.filter(course__isnull=False).values_list('course_id', flat=True))
+        added, removed = sync_course_rooms(course_ids) if course_ids else (0, 0)
+        self.message_user(request, f'Додадени {added}, отстранети {removed} учесници.')
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -15,11 +23,29 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ('sender__username', 'content', 'room__name')
     readonly_fields = ('timestamp',)
 
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sender', 'room', 'message_type', 'timestamp', 'archived_at')
+    list_filter = ('message_type', 'archived_at')
+    search_fields = ('sender__username', 'room__name')
+    readonly_fields = ('id', 'timestamp', 'archived_at')
+
 @admin.register(MessageRead)
 class MessageReadAdmin(admin.ModelAdmin):
     list_display = ('user', 'message', 'read_at')
     list_filter = ('read_at',)
 
+@admin.register(RoomReadState)
+class RoomReadStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'room', 'last_read_message_id', 'unread_count', 'updated_at')
+    search_fields = ('user__username', 'room__name')
+
+@admin.register(ChatUpload)
+class ChatUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'room', 'uploader', 'status', 'received_size', 'total_size', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('filename', 'uploader__username', 'room__name')
+
 @admin.register(UserChatSettings)
 class UserChatSettingsAdmin(admin.ModelAdmin):
     list_display = ('user', 'notifications_enabled', 'sound_enabled', 'show_online_status')
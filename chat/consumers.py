@@ -1,195 +1,453 @@
 # chat/consumers.py
 
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import ChatRoom, Message, MessageRead
+from .access import has_room_access
+from .encoding import frame_event
+from .models import UserChatSettings
+from .outbound import OutboundQueue, get_outbound_config
+from .persistence import MessageDraft, delete_message, edit_message, get_message_writer, write_messages
+from .presence import get_presence
+from .ratelimit import get_rate_limiter
+from .resume import missed_messages, read_resume_token
+from .typing_indicators import get_typing_aggregator
+from .unread import mark_read
 
 User = get_user_model()
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
-        self.user = self.scope['user']
+class RoomSubscription:
+    """Состојба на една конекција во една соба"""
 
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.group_name = f'chat_{room_id}'
+        self.pending_read_id = 0
+        self.persisted_read_id = 0
+        self.read_flush_task = None
+        self.tracks_presence = False
 
-        if not self.user.is_authenticated:
-            await self.close()
+
+class ChatRoomMixin:
+    """
+    Влез/излез од соба и обработка на фрејмовите (порака, пишување, прочитано).
+    Заедничко за ChatConsumer (една соба) и MultiplexChatConsumer (повеќе соби).
+    """
+
+    def init_rooms(self):
+        self.user = self.scope['user']
+        self.subscriptions = {}
+        self.online_status = None
+        self.outbound = OutboundQueue(self, get_outbound_config())
+        self.resume_cursors = {}
+
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('resume')
+        if token and self.user.is_authenticated:
+            self.resume_cursors = read_resume_token(token[0], self.user.id) or {}
+
+    async def join_room(self, room_id):
+        if room_id in self.subscriptions:
+            return True
+        if not await self.user_has_access(room_id):
+            return False
+
+        subscription = RoomSubscription(room_id)
+        self.subscriptions[room_id] = subscription
+        await self.channel_layer.group_add(subscription.group_name, self.channel_name)
+        return True
+
+    async def activate_room(self, room_id):
+        """По accept: присуство и, ако конекцијата е обновена со токен, replay од неговиот курсор"""
+        if room_id in self.resume_cursors:
+            await self.replay_room(room_id, self.resume_cursors.pop(room_id))
+
+        # Корисниците со исклучен online статус не се појавуваат во присуството
+        if self.online_status is None:
+            self.online_status = await self.shows_online_status()
+        subscription = self.subscriptions[room_id]
+        if self.online_status:
+            subscription.tracks_presence = True
+            await get_presence().connect(room_id, self.user, self.channel_name)
+
+    async def leave_room(self, room_id):
+        subscription = self.subscriptions.pop(room_id, None)
+        if subscription is None:
             return
 
+        get_typing_aggregator().stop(room_id, self.user.id, self.channel_name)
+        if subscription.read_flush_task is not None:
+            subscription.read_flush_task.cancel()
+            subscription.read_flush_task = None
+        await self.flush_read_receipt(subscription)
 
-        if not await self.user_has_access():
-            await self.close()
+        if subscription.tracks_presence:
+            await get_presence().disconnect(room_id, self.user, self.channel_name)
+
+        await self.channel_layer.group_discard(subscription.group_name, self.channel_name)
+
+    async def leave_all_rooms(self):
+        for room_id in list(getattr(self, 'subscriptions', {})):
+            await self.leave_room(room_id)
+        if hasattr(self, 'outbound'):
+            self.outbound.close()
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Секој фрејм се брои за потврдите од клиентот (OutboundQueue.ack)"""
+        if text_data is not None or bytes_data is not None:
+            self.outbound.sent += 1
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    def handle_ack(self, data):
+        try:
+            self.outbound.ack(int(data.get('received')))
+        except (TypeError, ValueError):
+            pass
+
+    async def handle_room_frame(self, subscription, data):
+        message_type = data.get('type', 'message')
+
+        if message_type == 'message':
+            await self.handle_message(subscription, data)
+        elif message_type == 'typing':
+            await self.handle_typing(subscription, data)
+        elif message_type in ('read_up_to', 'message_read'):
+            await self.handle_read_up_to(subscription, data)
+        elif message_type == 'resume':
+            await self.handle_resume(subscription, data)
+        elif message_type == 'edit_message':
+            await self.handle_edit(subscription, data)
+        elif message_type == 'delete_message':
+            await self.handle_delete(subscription, data)
+
+    async def handle_message(self, subscription, data):
+        content = data.get('message', '').strip()
+        reply_to_id = data.get('reply_to')
+
+        if not content:
             return
 
+        if not await self.within_rate_limit(subscription, message=content):
+            return
 
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
+        draft = MessageDraft(subscription.room_id, self.user, content, reply_to_id)
+        writer = get_message_writer()
+        message_id = None
+
+        if writer is None:
+            message = await self.save_message(draft)
+            message_id = message.id
+            payload = draft.as_payload(message.id)
+            payload['reply_to'] = message.reply_to_id
+        elif writer.durability == 'committed':
+            try:
+                message = await writer.submit(draft)
+            except Exception:
+                # Неуспешен пакет не смее да ја затвори конекцијата; текстот се враќа за повторно праќање
+                await self.send_error(
+                    'Пораката не е зачувана. Обидете се повторно.',
+                    subscription.room_id,
+                    code='save_failed',
+                    message=content
+                )
+                return
+            message_id = message.id
+            payload = draft.as_payload(message.id)
+            payload['reply_to'] = message.reply_to_id
+        else:
+            # Write-behind: испрати веднаш со привремен ID, потврдата доаѓа со message_saved
+            writer.submit(draft)
+            payload = draft.as_payload()
+            payload['provisional'] = True
+
+        await self.channel_layer.group_send(
+            subscription.group_name,
+            frame_event('chat_message', {
+                'type': 'message',
+                'room_id': subscription.room_id,
+                'message': payload
+            }, message_id=message_id)
         )
 
-        await self.accept()
+    async def within_rate_limit(self, subscription, **details):
+        """
+        Token bucket за нови и изменети пораки. Одбиениот фрејм добива error со деталите
+        (на пр. текстот) за клиентот да може повторно да го испрати.
+        """
+        limited_by, retry_after = await get_rate_limiter().check_message(self.user.id, subscription.room_id)
+        if not limited_by:
+            return True
+        await self.send_error(
+            'Испраќате пораки пребрзо. Обидете се повторно наскоро.',
+            subscription.room_id,
+            code='rate_limited',
+            limited_by=limited_by,
+            retry_after_ms=int(retry_after * 1000) + 1,
+            **details
+        )
+        return False
 
+    async def handle_edit(self, subscription, data):
+        content = data.get('message', '').strip()
+        if not content:
+            return
+
+        if not await self.within_rate_limit(subscription, message_id=data.get('message_id')):
+            return
 
+        message = await self.save_edit(subscription.room_id, data.get('message_id'), content)
+        if message is None:
+            await self.send_error('Пораката не може да се измени', subscription.room_id, code='edit_rejected')
+            return
+
+        # Само разликата, не целата порака
         await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_joined',
-                'username': self.user.username,
-                'user_id': self.user.id
-            }
+            subscription.group_name,
+            frame_event('message_edited', {
+                'type': 'message_edited',
+                'room_id': subscription.room_id,
+                'message_id': message.id,
+                'content': message.content,
+                'edited_at': message.edited_at.isoformat(),
+            })
         )
 
-    async def disconnect(self, close_code):
+    async def handle_delete(self, subscription, data):
+        message = await self.save_delete(subscription.room_id, data.get('message_id'))
+        if message is None:
+            await self.send_error('Пораката не може да се избрише', subscription.room_id, code='delete_rejected')
+            return
 
         await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_left',
-                'username': self.user.username,
-                'user_id': self.user.id
-            }
+            subscription.group_name,
+            frame_event('message_deleted', {
+                'type': 'message_deleted',
+                'room_id': subscription.room_id,
+                'message_id': message.id,
+            })
         )
 
-
-        await self.channel_layer.group_discard(
-            self.room_group_name,
+    async def handle_typing(self, subscription, data):
+        get_typing_aggregator().update(
+            subscription.room_id,
+            self.user.id,
+            self.user.username,
+            bool(data.get('is_typing', False)),
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def handle_resume(self, subscription, data):
+        """Повторно поврзување: клиентот ја кажува последната порака што ја има"""
         try:
-            text_data_json = json.loads(text_data)
-            message_type = text_data_json.get('type', 'message')
+            last_id = int(data.get('last_id'))
+        except (TypeError, ValueError):
+            last_id = None
+        await self.replay_room(subscription.room_id, last_id)
+
+    async def replay_room(self, room_id, after_id):
+        """Испрати ја само празнината по after_id (прстен во Redis/меморија или база)"""
+        if not after_id:
+            self.outbound.request_resync(room_id)
+            return
 
-            if message_type == 'message':
-                await self.handle_message(text_data_json)
-            elif message_type == 'typing':
-                await self.handle_typing(text_data_json)
-            elif message_type == 'message_read':
-                await self.handle_message_read(text_data_json)
+        messages, complete = await self.load_missed_messages(room_id, after_id)
+        self.outbound.register(room_id, after_id)
+        if messages:
+            self.outbound.put(frame_event('replay', {
+                'type': 'replay',
+                'room_id': room_id,
+                'messages': messages,
+            }, message_id=messages[-1]['id']))
+        if not complete:
+            self.outbound.request_resync(room_id)
+
+    async def handle_read_up_to(self, subscription, data):
+        """Прочитано до пораката X; се запишува најмногу еднаш по debounce интервал"""
+        try:
+            message_id = int(data.get('message_id'))
+        except (TypeError, ValueError):
+            return
 
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Невалиден JSON формат'
-            }))
+        if message_id > subscription.pending_read_id:
+            subscription.pending_read_id = message_id
+        if subscription.read_flush_task is None:
+            subscription.read_flush_task = asyncio.ensure_future(
+                self._flush_read_receipt_later(subscription)
+            )
 
-    async def handle_message(self, data):
-        content = data.get('message', '').strip()
-        reply_to_id = data.get('reply_to')
+    async def _flush_read_receipt_later(self, subscription):
+        await asyncio.sleep(getattr(settings, 'CHAT_READ_RECEIPT_DEBOUNCE_MS', 1000) / 1000)
+        subscription.read_flush_task = None
+        await self.flush_read_receipt(subscription)
+
+    async def flush_read_receipt(self, subscription):
+        message_id = subscription.pending_read_id
+        if message_id > subscription.persisted_read_id:
+            subscription.persisted_read_id = message_id
+            await self.save_read_receipt(subscription.room_id, message_id)
+
+    async def send_error(self, error, room_id=None, **details):
+        frame = {'type': 'error', 'error': error, **details}
+        if room_id is not None:
+            frame['room_id'] = room_id
+        await self.send(text_data=json.dumps(frame))
+
+    async def forward_frame(self, event):
+        """
+        Фрејмот е серијализиран еднаш кај испраќачот (frame_event); оди во ограничениот
+        излезен ред за бавен клиент да не го задржува channel layer-от
+        """
+        self.outbound.put(event)
+
+    chat_message = forward_frame
+    message_saved = forward_frame
+    message_failed = forward_frame
+    message_edited = forward_frame
+    message_deleted = forward_frame
+    presence_update = forward_frame
+    typing_update = forward_frame
 
-        if not content:
-            return
+    @database_sync_to_async
+    def user_has_access(self, room_id):
+        """Провери дали корисникот има пристап до собата"""
+        return has_room_access(room_id, self.user.id)
 
+    @database_sync_to_async
+    def shows_online_status(self):
+        show = UserChatSettings.objects.filter(
+            user=self.user
+        ).values_list('show_online_status', flat=True).first()
+        return show is not False
+
+    @database_sync_to_async
+    def load_missed_messages(self, room_id, after_id):
+        return missed_messages(room_id, after_id)
 
-        message = await self.save_message(content, reply_to_id)
+    @database_sync_to_async
+    def save_message(self, draft):
+        """Зачувај порака во базата"""
+        return write_messages([draft])[0]
 
+    @database_sync_to_async
+    def save_edit(self, room_id, message_id, content):
+        return edit_message(room_id, message_id, self.user, content)
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': message.id,
-                    'content': message.content,
-                    'sender': message.sender.username,
-                    'sender_id': message.sender.id,
-                    'timestamp': message.timestamp.isoformat(),
-                    'reply_to': message.reply_to.id if message.reply_to else None,
-                    'message_type': message.message_type
-                }
-            }
-        )
+    @database_sync_to_async
+    def save_delete(self, room_id, message_id):
+        return delete_message(room_id, message_id, self.user)
 
-    async def handle_typing(self, data):
-        is_typing = data.get('is_typing', False)
+    @database_sync_to_async
+    def save_read_receipt(self, room_id, message_id):
+        """Помести го курсорот за читање на корисникот во собата"""
+        mark_read(self.user.id, room_id, message_id)
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing_indicator',
-                'username': self.user.username,
-                'user_id': self.user.id,
-                'is_typing': is_typing
-            }
-        )
 
-    async def handle_message_read(self, data):
-        message_id = data.get('message_id')
-        if message_id:
-            await self.mark_message_as_read(message_id)
+class ChatConsumer(ChatRoomMixin, AsyncWebsocketConsumer):
+    """
+    ws/chat/<room_id>/ - една конекција за една соба. Клиентот може да праќа
+    {"type": "ack", "received": N} (вкупно примени фрејмови на конекцијата); по
+    првата потврда серверот не праќа повеќе од ACK_WINDOW непотврдени фрејмови.
+    """
 
-    async def chat_message(self, event):
-        message = event['message']
+    async def connect(self):
+        self.init_rooms()
+        self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
 
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'message': message
-        }))
+        if not self.user.is_authenticated:
+            await self.close()
+            return
 
-    async def user_joined(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'user_joined',
-            'username': event['username'],
-            'user_id': event['user_id']
-        }))
+        if not await self.join_room(self.room_id):
+            await self.close()
+            return
 
-    async def user_left(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'user_left',
-            'username': event['username'],
-            'user_id': event['user_id']
-        }))
+        await self.accept()
+        await self.activate_room(self.room_id)
 
-    async def typing_indicator(self, event):
+    async def disconnect(self, close_code):
+        await self.leave_all_rooms()
 
-        if event['user_id'] != self.user.id:
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
-                'type': 'typing',
-                'username': event['username'],
-                'is_typing': event['is_typing']
+                'error': 'Невалиден JSON формат'
             }))
+            return
 
-    @database_sync_to_async
-    def user_has_access(self):
-        """Провери дали корисникот има пристап до собата"""
-        try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            return room.participants.filter(id=self.user.id).exists()
-        except ChatRoom.DoesNotExist:
-            return False
+        if data.get('type') == 'ack':
+            self.handle_ack(data)
+            return
+        await self.handle_room_frame(self.subscriptions[self.room_id], data)
 
-    @database_sync_to_async
-    def save_message(self, content, reply_to_id=None):
-        """Зачувај порака во базата"""
-        room = ChatRoom.objects.get(id=self.room_id)
-        reply_to = None
 
-        if reply_to_id:
-            try:
-                reply_to = Message.objects.get(id=reply_to_id, room=room)
-            except Message.DoesNotExist:
-                pass
-
-        message = Message.objects.create(
-            room=room,
-            sender=self.user,
-            content=content,
-            reply_to=reply_to
-        )
-        return message
+class MultiplexChatConsumer(ChatRoomMixin, AsyncWebsocketConsumer):
+    """
+    ws/chat/ - една конекција за повеќе соби. Клиентот праќа
+    {"type": "subscribe"/"unsubscribe", "room_id": X} (subscribe може да носи и "last_id"
+    за replay); секој друг фрејм мора да има room_id, а сите фрејмови од серверот се
+    означени со room_id. Исклучок е {"type": "ack", "received": N} - без room_id,
+    вкупно примени фрејмови на конекцијата; по првата потврда серверот не праќа
+    повеќе од ACK_WINDOW непотврдени фрејмови.
+    """
 
-    @database_sync_to_async
-    def mark_message_as_read(self, message_id):
-        """Означи порака како прочитана"""
+    async def connect(self):
+        self.init_rooms()
+
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.leave_all_rooms()
+
+    async def receive(self, text_data):
         try:
-            message = Message.objects.get(id=message_id)
-            MessageRead.objects.get_or_create(
-                message=message,
-                user=self.user
-            )
-        except Message.DoesNotExist:
-            pass
\ No newline at end of file
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error('Невалиден JSON формат')
+            return
+
+        if data.get('type') == 'ack':
+            self.handle_ack(data)
+            return
+
+        try:
+            room_id = int(data.get('room_id'))
+        except (TypeError, ValueError):
+            await self.send_error('Недостасува room_id')
+            return
+
+        message_type = data.get('type')
+        if message_type == 'subscribe':
+            await self.subscribe(room_id, data)
+        elif message_type == 'unsubscribe':
+            await self.leave_room(room_id)
+            await self.send(text_data=json.dumps({'type': 'unsubscribed', 'room_id': room_id}))
+        elif room_id in self.subscriptions:
+            await self.handle_room_frame(self.subscriptions[room_id], data)
+        else:
+            await self.send_error('Не сте претплатени на оваа соба', room_id)
+
+    async def subscribe(self, room_id, data):
+        max_rooms = getattr(settings, 'CHAT_MULTIPLEX_MAX_ROOMS', 50)
+        if room_id not in self.subscriptions and len(self.subscriptions) >= max_rooms:
+            await self.send_error('Премногу отворени соби', room_id)
+            return
+
+        is_new = room_id not in self.subscriptions
+        if not await self.join_room(room_id):
+            await self.send_error('Немате пристап до оваа соба', room_id)
+            return
+        await self.send(text_data=json.dumps({'type': 'subscribed', 'room_id': room_id}))
+        if is_new:
+            await self.activate_room(room_id)
+        if data.get('last_id'):
+            await self.handle_resume(self.subscriptions[room_id], data)
@@ -0,0 +1,38 @@
+# chat/encoding.py
+
+import json
+
+from django.conf import settings
+
+_encoder = None
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj)
+
+
+def _load_encoder():
+    """CHAT_JSON_ENCODER = 'orjson' ако е инсталиран, инаку стандардниот json"""
+    if getattr(settings, 'CHAT_JSON_ENCODER', 'json') == 'orjson':
+        try:
+            import orjson
+        except ImportError:
+            return _stdlib_dumps
+        return lambda obj: orjson.dumps(obj).decode()
+    return _stdlib_dumps
+
+
+def encode(obj):
+    global _encoder
+    if _encoder is None:
+        _encoder = _load_encoder()
+    return _encoder(obj)
+
+
+def frame_event(handler, frame, **meta):
+    """
+    Настан за group_send со веќе серијализиран WebSocket фрејм. Се енкодира еднаш
+    кај испраќачот; секој consumer во групата го проследува текстот без json.dumps.
+    meta (на пр. message_id) е за излезниот ред и не се праќа до клиентот.
+    """
+    return {'type': handler, 'text': encode(frame), 'room_id': frame.get('room_id'), **meta}
@@ -0,0 +1,123 @@
+# chat/history.py
+
+from .models import ArchivedMessage, Message
+
+HISTORY_FIELDS = (
+    'id',
+    'content',
+    'message_type',
+    'timestamp',
+    'reply_to_id',
+    'sender_id',
+    'sender__username',
+    'sender__first_name',
+    'sender__last_name',
+    'attachment',
+    'is_edited',
+    'is_deleted',
+)
+
+MAX_PAGE_SIZE = 100
+
+
+def _serialize_row(row):
+    full_name = f"{row['sender__first_name']} {row['sender__last_name']}".strip()
+    return {
+        'id': row['id'],
+        'content': row['content'],
+        'message_type': row['message_type'],
+        'timestamp': row['timestamp'],
+        'reply_to': row['reply_to_id'],
+        'sender': row['sender__username'],
+        'sender_id': row['sender_id'],
+        'sender_name': full_name or row['sender__username'],
+        'attachment': row['attachment'],
+        'is_edited': row['is_edited'],
+        'is_deleted': row['is_deleted'],
+    }
+
+
+def serialize_message(message):
+    """Message инстанца во истата форма како редовите од fetch_messages"""
+    return _serialize_row({
+        'id': message.id,
+        'content': message.content,
+        'message_type': message.message_type,
+        'timestamp': message.timestamp,
+        'reply_to_id': message.reply_to_id,
+        'sender_id': message.sender_id,
+        'sender__username': message.sender.username,
+        'sender__first_name': message.sender.first_name,
+        'sender__last_name': message.sender.last_name,
+        'attachment': message.attachment,
+        'is_edited': message.is_edited,
+        'is_deleted': message.is_deleted,
+    })
+
+
+def _cursor_timestamp(room_id, message_id):
+    """(timestamp, табела) на курсорот или (None, None)"""
+    for model in (Message, ArchivedMessage):
+        timestamp = model.objects.filter(
+            room_id=room_id,
+            id=message_id
+        ).values_list('timestamp', flat=True).first()
+        if timestamp is not None:
+            return timestamp, model
+    return None, None
+
+
+def _page(model, room_id, timestamp, before_id, after_id, count):
+    queryset = model.objects.filter(room_id=room_id)
+    if after_id:
+        queryset = queryset.filter(timestamp__gte=timestamp).exclude(
+            timestamp=timestamp, id__lte=after_id
+        ).order_by('timestamp', 'id')
+    else:
+        if before_id:
+            queryset = queryset.filter(timestamp__lte=timestamp).exclude(
+                timestamp=timestamp, id__gte=before_id
+            )
+        queryset = queryset.order_by('-timestamp', '-id')
+    return list(queryset.values(*HISTORY_FIELDS)[:count])
+
+
+def fetch_messages(room_id, before_id=None, after_id=None, limit=20):
+    """
+    Keyset страница пораки по индексот (room, timestamp, id).
+    Архивираните пораки се постари од сите во Message, па кога страницата ќе
+    стигне до крајот на едната табела продолжува во другата.
+    Враќа (пораки во хронолошки ред, has_more).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    tables = (ArchivedMessage, Message) if after_id else (Message, ArchivedMessage)
+    timestamp = None
+    cursor_id = after_id or before_id
+    if cursor_id:
+        timestamp, model = _cursor_timestamp(room_id, cursor_id)
+        if timestamp is None:
+            return [], False
+        # Од табелата на курсорот понатаму - претходната нема што да додаде
+        tables = tables[tables.index(model):]
+
+    rows = []
+    for model in tables:
+        rows += _page(model, room_id, timestamp, before_id, after_id, limit + 1 - len(rows))
+        if len(rows) > limit:
+            break
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after_id:
+        rows.reverse()
+
+    return [_serialize_row(row) for row in rows], has_more
+
+
+def message_to_json(message, user_id):
+    """Порака од fetch_messages во форма за JsonResponse"""
+    data = dict(message)
+    data['timestamp'] = message['timestamp'].isoformat()
+    data['is_own'] = message['sender_id'] == user_id
+    return data
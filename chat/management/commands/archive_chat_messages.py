@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from chat.retention import archive_rooms
+
+
+class Command(BaseCommand):
+    help = 'Премести ги пораките постари од полисата за задржување во архивата'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, action='append', dest='rooms', help='ID на соба (може повеќе пати)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Пораки по трансакција')
+        parser.add_argument('--dry-run', action='store_true', help='Само изброј ги пораките за архивирање')
+
+    def handle(self, *args, **options):
+        results = archive_rooms(options['rooms'], batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for room_id, count in results.items():
+            self.stdout.write(f'Соба {room_id}: {count} пораки')
+
+        total = sum(results.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'За архивирање: {total} пораки.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Архивирани {total} пораки.'))
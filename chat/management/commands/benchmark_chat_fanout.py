@@ -0,0 +1,75 @@
+import json
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from online_course_platform.benchmarking import Timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Command(BaseCommand):
+    help = 'CPU за fan-out на една порака: json.dumps по consumer наспроти фрејм енкодиран еднаш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,500,1000')
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        encoders = {'json': json.dumps}
+        if orjson is not None:
+            encoders['orjson'] = lambda obj: orjson.dumps(obj).decode()
+        else:
+            self.stdout.write('orjson не е инсталиран - се мери само json')
+
+        payload = {
+            'id': 123456,
+            'content': 'Здраво на сите, дали некој ја реши третата задача од домашната?',
+            'sender': 'student_42',
+            'sender_id': 42,
+            'timestamp': timezone.now().isoformat(),
+            'reply_to': None,
+            'message_type': 'text',
+        }
+
+        columns = ['по consumer'] + [f'еднаш ({name})' for name in encoders]
+        self.stdout.write(f'µs по порака, {options["messages"]} пораки, медијана од {options["repeat"]}')
+        self.stdout.write(f'{"членови":>8} ' + ' '.join(f'{column:>16}' for column in columns))
+        for size in sizes:
+            results = [self._measure(options, lambda: self._per_consumer(payload, size))]
+            for encode in encoders.values():
+                results.append(self._measure(options, lambda: self._pre_encoded(payload, size, encode)))
+            self.stdout.write(f'{size:>8} ' + ' '.join(f'{value:>16.1f}' for value in results))
+
+    @staticmethod
+    def _per_consumer(payload, size):
+        # Претходно: секој consumer во групата го серијализира истиот настан
+        event = {'type': 'chat_message', 'message': payload}
+        sent = []
+        for _ in range(size):
+            sent.append(json.dumps({'type': 'message', 'message': event['message']}))
+        return sent
+
+    @staticmethod
+    def _pre_encoded(payload, size, encode):
+        event = {'type': 'chat_message', 'text': encode({'type': 'message', 'room_id': 1, 'message': payload})}
+        sent = []
+        for _ in range(size):
+            sent.append(event['text'])
+        return sent
+
+    @staticmethod
+    def _measure(options, func):
+        samples = []
+        for _ in range(options['repeat']):
+            with Timer() as timer:
+                for _ in range(options['messages']):
+                    func()
+            samples.append(timer.elapsed * 1e6 / options['messages'])
+        return statistics.median(samples)
@@ -0,0 +1,73 @@
+import statistics
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.history import fetch_messages
+from chat.models import ChatRoom, Message
+from online_course_platform.benchmarking import Timer, isolated_database
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Латенција на историја на чет: OFFSET страници наспроти keyset курсор на различни длабочини'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        total = options['messages']
+        limit = options['page_size']
+
+        with isolated_database():
+            room = self._setup(total)
+            ids = list(Message.objects.filter(room=room).order_by('-timestamp', '-id').values_list('id', flat=True))
+
+            self.stdout.write(f'{total} пораки, страница од {limit}')
+            self.stdout.write(f'{"длабочина":>10} {"OFFSET ms":>12} {"keyset ms":>12}')
+            for fraction in (0, 0.1, 0.5, 0.9, 0.99):
+                depth = int((total - limit - 1) * fraction)
+                offset_ms = self._median(options['repeat'], lambda: list(
+                    Message.objects.filter(room=room).select_related('sender')
+                    .order_by('-timestamp')[depth:depth + limit]
+                ))
+                cursor = ids[depth - 1] if depth else None
+                keyset_ms = self._median(options['repeat'], lambda: fetch_messages(
+                    room.id, before_id=cursor, limit=limit
+                ))
+                self.stdout.write(f'{depth:>10} {offset_ms:>12.3f} {keyset_ms:>12.3f}')
+
+    def _setup(self, total):
+        users = [User.objects.create_user(username=f'bench_{index}') for index in range(20)]
+        room = ChatRoom.objects.create(name='Benchmark', room_type='group', created_by=users[0])
+        other = ChatRoom.objects.create(name='Other', room_type='group', created_by=users[0])
+
+        start = timezone.now() - timezone.timedelta(days=365)
+        batch = []
+        for index in range(total):
+            # Секоја втора порака во друга соба за да индексот мора да ја филтрира собата
+            for target in (room, other):
+                batch.append(Message(
+                    room=target,
+                    sender=users[index % len(users)],
+                    content=f'Порака {index}',
+                    timestamp=start + timezone.timedelta(seconds=index),
+                ))
+            if len(batch) >= 10000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+        return room
+
+    @staticmethod
+    def _median(repeat, func):
+        samples = []
+        for _ in range(repeat):
+            with Timer() as timer:
+                func()
+            samples.append(timer.elapsed * 1000)
+        return statistics.median(samples)
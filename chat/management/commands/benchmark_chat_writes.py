@@ -0,0 +1,95 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from chat.models import ChatRoom, Message, MessageRead
+from chat.persistence import MessageDraft, MessageWriteBehind, get_write_behind_config, write_messages
+from online_course_platform.benchmarking import Timer, isolated_database
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Споредба на пораки/секунда: постоечко запишување, директно и write-behind'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--senders', type=int, default=50, help='Паралелни конекции што праќаат')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--flush-ms', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Само базата: без Redis за споделена состојба, кеш на последни пораки и пристап
+        overrides = override_settings(
+            CHAT_SHARED_STATE={'BACKEND': 'memory'},
+            CHAT_RECENT_CACHE={'ALIAS': None},
+            CHAT_ACCESS_CACHE={'SHARED_ALIAS': None},
+        )
+        with isolated_database(), overrides:
+            room, users = self._setup(options['senders'])
+            per_sender = max(1, options['messages'] // options['senders'])
+            total = per_sender * len(users)
+
+            config = get_write_behind_config()
+            config.update({
+                'BATCH_SIZE': options['batch_size'],
+                'FLUSH_INTERVAL_MS': options['flush_ms'],
+                'DURABILITY': 'committed',
+            })
+
+            results = [
+                ('оригинално (get + create + MessageRead)', self._legacy_sender),
+                ('директно (write_messages)', self._direct_sender),
+                ('write-behind strict', MessageWriteBehind(dict(config, ORDERING='strict'))),
+                ('write-behind relaxed', MessageWriteBehind(dict(config, ORDERING='relaxed'))),
+            ]
+
+            self.stdout.write(f'{total} пораки, {len(users)} испраќачи')
+            for label, path in results:
+                with Timer() as timer:
+                    asyncio.run(self._run(path, room, users, per_sender))
+                rate = total / timer.elapsed
+                self.stdout.write(f'{label:<40} {timer.elapsed:8.3f}s {rate:10.0f} пораки/s')
+
+            self.stdout.write(f'Вкупно зачувани пораки: {Message.objects.count()}')
+
+    def _setup(self, senders):
+        users = [
+            User.objects.create_user(username=f'bench_{index}', password='bench')
+            for index in range(senders)
+        ]
+        room = ChatRoom.objects.create(name='Benchmark', room_type='group', created_by=users[0])
+        room.participants.add(*users)
+        return room, users
+
+    async def _run(self, path, room, users, per_sender):
+        async def sender(user):
+            for index in range(per_sender):
+                draft = MessageDraft(room.id, user, f'Порака {index} од {user.username}')
+                if isinstance(path, MessageWriteBehind):
+                    await path.submit(draft)
+                else:
+                    await path(draft)
+
+        await asyncio.gather(*(sender(user) for user in users))
+
+    @staticmethod
+    @database_sync_to_async
+    def _legacy_sender(draft):
+        """
+        Оригиналното запишување: ChatRoom.get, INSERT на пораката и MessageRead за
+        испраќачот (стариот post_save сигнал). bulk_create за новите сигнали
+        (преглед, непрочитани, replay) да не влезат во мерењето.
+        """
+        room = ChatRoom.objects.get(id=draft.room_id)
+        message = Message.objects.bulk_create([Message(room=room, sender=draft.sender, content=draft.content)])[0]
+        MessageRead.objects.create(message=message, user=draft.sender)
+        return message
+
+    @staticmethod
+    @database_sync_to_async
+    def _direct_sender(draft):
+        return write_messages([draft])[0]
@@ -0,0 +1,224 @@
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from channels.testing import WebsocketCommunicator
+
+from chat import metrics
+from chat.models import ChatRoom, Message
+from online_course_platform.benchmarking import QueryCounter, isolated_database, percentile
+
+User = get_user_model()
+
+
+class LoadClient:
+    def __init__(self, room, user, cookie):
+        self.room = room
+        self.user = user
+        self.communicator = WebsocketCommunicator(
+            self.application, f'/ws/chat/{room.id}/',
+            headers=[(b'cookie', cookie.encode())]
+        )
+        self.last_id = 0
+        self.received = 0
+        self.reader = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test на чет WebSocket патеката: N соби × M учесници преку ASGI application '
+        'во процесот, со in-memory channel layer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10)
+        parser.add_argument('--participants', type=int, default=10, help='Учесници по соба')
+        parser.add_argument('--messages', type=int, default=5, help='Пораки по учесник')
+        parser.add_argument('--interval-ms', type=int, default=20, help='Пауза меѓу пораките на еден учесник')
+        parser.add_argument('--no-typing', action='store_true')
+        parser.add_argument('--no-reads', action='store_true')
+        parser.add_argument('--write-behind', action='store_true')
+        parser.add_argument('--rate-limit', action='store_true', help='Вклучи го CHAT_RATE_LIMIT (инаку исклучен)')
+        parser.add_argument('--timeout', type=float, default=120)
+
+    def handle(self, *args, **options):
+        from online_course_platform.asgi import application
+        LoadClient.application = application
+
+        overrides = override_settings(
+            CHANNEL_LAYERS={'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {'capacity': 10000},
+            }},
+            CHAT_SHARED_STATE={'BACKEND': 'memory'},
+            CHAT_RECENT_CACHE={'ALIAS': None},
+            CHAT_ACCESS_CACHE={'SHARED_ALIAS': None},
+            CHAT_WRITE_BEHIND=dict(settings.CHAT_WRITE_BEHIND, ENABLED=options['write_behind']),
+            CHAT_RATE_LIMIT=settings.CHAT_RATE_LIMIT if options['rate_limit'] else {'USER_RATE': None, 'ROOM_RATE': None},
+        )
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        try:
+            with isolated_database(), overrides:
+                clients = self._setup(options['rooms'], options['participants'])
+                metrics.reset()
+                report = asyncio.run(self._run(clients, options, counter))
+                report['saved'] = Message.objects.count()
+        finally:
+            connection_created.disconnect(counter.install)
+
+        self._print(report, options)
+
+    def _setup(self, rooms, participants):
+        users = User.objects.bulk_create([
+            User(username=f'load_{index}', password=make_password(None))
+            for index in range(rooms * participants)
+        ])
+        clients = []
+        for room_index in range(rooms):
+            members = users[room_index * participants:(room_index + 1) * participants]
+            room = ChatRoom.objects.create(name=f'Load {room_index}', room_type='group', created_by=members[0])
+            room.participants.add(*members)
+            for user in members:
+                # Вистинска сесија - handshake-от минува низ AuthMiddlewareStack
+                client = Client()
+                client.force_login(user)
+                cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+                clients.append(LoadClient(room, user, cookie))
+        return clients
+
+    async def _run(self, clients, options, counter):
+        report = {'connections': len(clients), 'frames': Counter()}
+        sent_at = {}
+        latencies = []
+        expected = len(clients) * options['messages'] * options['participants']
+        done = asyncio.Event()
+
+        # Конекции: време за handshake, прашања и меморија по конекција
+        gc.collect()
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        queries_before = counter.count
+        connect_times = []
+
+        async def connect(client):
+            started = time.perf_counter()
+            connected, _ = await client.communicator.connect(timeout=options['timeout'])
+            connect_times.append(time.perf_counter() - started)
+            if not connected:
+                raise RuntimeError(f'Конекцијата за {client.user.username} е одбиена')
+
+        await asyncio.gather(*(connect(client) for client in clients))
+        gc.collect()
+        report['memory_per_connection'] = (tracemalloc.get_traced_memory()[0] - memory_before) / len(clients)
+        tracemalloc.stop()
+        report['connect_queries'] = counter.count - queries_before
+        report['connect_times'] = connect_times
+
+        async def read(client):
+            while True:
+                output = await client.communicator.output_queue.get()
+                if output['type'] != 'websocket.send':
+                    continue
+                # Потврди како кај браузерот, инаку OutboundQueue застанува на ACK_WINDOW
+                client.received += 1
+                if client.received % 16 == 0:
+                    await client.communicator.send_json_to({'type': 'ack', 'received': client.received})
+                frame = json.loads(output['text'])
+                report['frames'][frame.get('type')] += 1
+                if frame.get('type') == 'message':
+                    message = frame['message']
+                    started = sent_at.get(message['content'])
+                    if started is not None:
+                        latencies.append(time.perf_counter() - started)
+                    if isinstance(message['id'], int):
+                        client.last_id = max(client.last_id, message['id'])
+                    if len(latencies) >= expected:
+                        done.set()
+                elif frame.get('type') == 'message_saved':
+                    for item in frame['messages']:
+                        client.last_id = max(client.last_id, item['id'])
+
+        for client in clients:
+            client.reader = asyncio.ensure_future(read(client))
+
+        # Пораки (и индикатор за пишување пред секоја порака)
+        async def participate(client):
+            for index in range(options['messages']):
+                if not options['no_typing']:
+                    await client.communicator.send_json_to({'type': 'typing', 'is_typing': True})
+                content = f'load:{client.user.id}:{index}'
+                sent_at[content] = time.perf_counter()
+                await client.communicator.send_json_to({'type': 'message', 'message': content})
+                await asyncio.sleep(options['interval_ms'] / 1000)
+
+        queries_before = counter.count
+        started = time.perf_counter()
+        await asyncio.gather(*(participate(client) for client in clients))
+        try:
+            await asyncio.wait_for(done.wait(), options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+        report['elapsed'] = time.perf_counter() - started
+        report['message_queries'] = counter.count - queries_before
+        report['sent'] = len(sent_at)
+        report['expected'] = expected
+        report['latencies'] = latencies
+
+        # Потврди за прочитано: секоја конекција до последната порака што ја видела
+        if not options['no_reads']:
+            queries_before = counter.count
+            for client in clients:
+                if client.last_id:
+                    await client.communicator.send_json_to({'type': 'read_up_to', 'message_id': client.last_id})
+            await asyncio.sleep(getattr(settings, 'CHAT_READ_RECEIPT_DEBOUNCE_MS', 1000) / 1000 + 0.5)
+            report['read_queries'] = counter.count - queries_before
+
+        for client in clients:
+            client.reader.cancel()
+        for client in clients:
+            try:
+                await client.communicator.disconnect()
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+        report['metrics'] = metrics.snapshot()['counters']
+        return report
+
+    def _print(self, report, options):
+        latencies_ms = [value * 1000 for value in report['latencies']]
+        connect_ms = [value * 1000 for value in report['connect_times']]
+        sent = report['sent'] or 1
+
+        self.stdout.write(
+            f'{options["rooms"]} соби × {options["participants"]} учесници = {report["connections"]} конекции, '
+            f'{report["sent"]} пораки, write-behind {"вклучен" if options["write_behind"] else "исклучен"}'
+        )
+        self.stdout.write(
+            f'Handshake (под tracemalloc): p50 {percentile(connect_ms, 50):.1f} ms, p99 {percentile(connect_ms, 99):.1f} ms, '
+            f'{report["connect_queries"] / report["connections"]:.1f} прашања по конекција'
+        )
+        self.stdout.write(f'Меморија по конекција: {report["memory_per_connection"] / 1024:.1f} KiB')
+        self.stdout.write(
+            f'Fan-out латенција: p50 {percentile(latencies_ms, 50):.1f} ms, '
+            f'p99 {percentile(latencies_ms, 99):.1f} ms, max {max(latencies_ms, default=0):.1f} ms'
+        )
+        self.stdout.write(
+            f'Испорачани {len(latencies_ms)}/{report["expected"]} за {report["elapsed"]:.2f}s '
+            f'({report["sent"] / report["elapsed"]:.0f} пораки/s, {len(latencies_ms) / report["elapsed"]:.0f} испораки/s)'
+        )
+        self.stdout.write(f'DB прашања по порака: {report["message_queries"] / sent:.2f}')
+        if 'read_queries' in report:
+            self.stdout.write(f'DB прашања по конекција за прочитано: {report["read_queries"] / report["connections"]:.2f}')
+        self.stdout.write(f'Зачувани пораки: {report["saved"]}')
+        self.stdout.write(f'Фрејмови: {dict(report["frames"])}')
+        self.stdout.write(f'Метрики: {report["metrics"]}')
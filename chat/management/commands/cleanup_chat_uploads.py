@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from chat.uploads import cleanup_uploads
+
+
+class Command(BaseCommand):
+    help = 'Избриши ги напуштените и неуспешните прикачувања и ослободи ги заглавените во обработка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Само изброј ги прикачувањата за чистење')
+
+    def handle(self, *args, **options):
+        results = cleanup_uploads(dry_run=options['dry_run'])
+        self.stdout.write(f'Напуштени прикачувања: {results["expired"]}')
+        self.stdout.write(f'Заглавени во обработка: {results["stuck"]}')
+        self.stdout.write(f'Стари неуспешни: {results["purged"]}')
+
+        total = sum(results.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'За чистење: {total} прикачувања.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исчистени {total} прикачувања.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Пресметај ги од почеток последната порака, бројот на пораки и учесници за чет собите'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, action='append', dest='rooms', help='ID на соба (може повеќе пати)')
+
+    def handle(self, *args, **options):
+        updated = rebuild_summaries(options['rooms'])
+        self.stdout.write(self.style.SUCCESS(f'Ажурирани {updated} соби.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.membership import sync_course_rooms
+
+
+class Command(BaseCommand):
+    help = 'Усогласи ги учесниците на курс собите со инструкторот и активните запишувања'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='ID на курс (може повеќе пати)')
+
+    def handle(self, *args, **options):
+        added, removed = sync_course_rooms(options['courses'])
+        self.stdout.write(self.style.SUCCESS(f'Додадени {added}, отстранети {removed} учесници.'))
@@ -0,0 +1,160 @@
+# chat/membership.py
+
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from courses.models import Course, Enrollment
+
+from . import summary, unread
+from .access import invalidate_room_access
+from .models import ChatRoom
+
+User = get_user_model()
+Participant = ChatRoom.participants.through
+
+DELETE_BATCH_SIZE = 500
+
+# Над толку допрени студенти се синхронизира целиот курс наместо само нивните редови
+FULL_SYNC_THRESHOLD = 1000
+
+_pending = threading.local()
+
+
+def course_room_name(course):
+    return f'Чет за {course.title}'
+
+
+def desired_members(course_ids=None, user_ids=None):
+    """{course_id: {user_id}} - инструкторот и активно запишаните студенти (од user_ids)"""
+    courses = Course.objects.all()
+    enrollments = Enrollment.objects.filter(is_active=True)
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+        enrollments = enrollments.filter(course_id__in=course_ids)
+    if user_ids is not None:
+        enrollments = enrollments.filter(student_id__in=user_ids)
+
+    members = {}
+    for course_id, instructor_id in courses.values_list('id', 'instructor_id'):
+        members[course_id] = {instructor_id}
+    for course_id, student_id in enrollments.values_list('course_id', 'student_id'):
+        members.setdefault(course_id, set()).add(student_id)
+    return members
+
+
+def _course_rooms(course_ids, members):
+    """{course_id: room_id}; курс со активни студенти добива соба ако ја нема"""
+    rooms = ChatRoom.objects.filter(course__isnull=False)
+    if course_ids is not None:
+        rooms = rooms.filter(course_id__in=course_ids)
+    room_by_course = dict(rooms.values_list('course_id', 'id'))
+
+    missing = [
+        course_id for course_id, user_ids in members.items()
+        if course_id not in room_by_course and len(user_ids) > 1
+    ]
+    for course in Course.objects.filter(id__in=missing):
+        room = ChatRoom.objects.create(
+            name=course_room_name(course),
+            room_type='course',
+            course=course,
+            created_by_id=course.instructor_id
+        )
+        room_by_course[course.id] = room.id
+    return room_by_course
+
+
+def sync_course_rooms(course_ids=None, user_ids=None):
+    """
+    Доведи ги учесниците на курс собите до инструкторот + активно запишаните студенти.
+    Разликата се применува со неколку bulk прашања за сите соби наеднаш, наместо
+    participants.add/remove по запишување. Отстрануваат се само студенти - рачно
+    додадените инструктори и администратори остануваат. Со user_ids се споредуваат
+    само редовите на тие корисници. Враќа (додадени, отстранети).
+    """
+    members = desired_members(course_ids, user_ids)
+    room_by_course = _course_rooms(course_ids, members)
+    if not room_by_course:
+        return 0, 0
+
+    current = {room_id: {} for room_id in room_by_course.values()}
+    participants = Participant.objects.filter(chatroom_id__in=current)
+    if user_ids is not None:
+        participants = participants.filter(user_id__in=set(user_ids).union(*members.values()))
+    for row_id, room_id, user_id in participants.values_list('id', 'chatroom_id', 'user_id'):
+        current[room_id][user_id] = row_id
+
+    added = {}
+    removed = {}
+    for course_id, room_id in room_by_course.items():
+        desired = members.get(course_id, set())
+        if desired - current[room_id].keys():
+            added[room_id] = desired - current[room_id].keys()
+        if current[room_id].keys() - desired:
+            removed[room_id] = current[room_id].keys() - desired
+
+    if removed:
+        # Staff со user_type 'student' исто останува
+        students = set(User.objects.filter(
+            id__in=set().union(*removed.values()),
+            user_type='student',
+            is_staff=False,
+            is_superuser=False
+        ).values_list('id', flat=True))
+        removed = {room_id: user_ids & students for room_id, user_ids in removed.items() if user_ids & students}
+
+    with transaction.atomic():
+        Participant.objects.bulk_create(
+            [
+                Participant(chatroom_id=room_id, user_id=user_id)
+                for room_id, user_ids in added.items()
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True
+        )
+        row_ids = [current[room_id][user_id] for room_id, user_ids in removed.items() for user_id in user_ids]
+        for start in range(0, len(row_ids), DELETE_BATCH_SIZE):
+            Participant.objects.filter(id__in=row_ids[start:start + DELETE_BATCH_SIZE]).delete()
+
+        # Истото што m2m_changed го прави за participants.add/remove
+        for room_id, user_ids in added.items():
+            unread.ensure_read_states([room_id], user_ids)
+        for room_id, user_ids in removed.items():
+            unread.remove_read_states([room_id], user_ids)
+        summary.refresh_participant_counts(list(added.keys() | removed.keys()))
+
+    for room_id, user_ids in (*added.items(), *removed.items()):
+        invalidate_room_access([room_id], user_ids)
+
+    return sum(map(len, added.values())), sum(map(len, removed.values()))
+
+
+def schedule_course_sync(course_id, user_id=None):
+    """
+    Синхронизација по commit за допрените студенти (user_id=None - целиот курс).
+    Масовно запишување во една трансакција (увоз на генерација) завршува со еден
+    sync за сите допрени курсеви.
+    """
+    if not hasattr(_pending, 'courses'):
+        _pending.courses = {}
+    users = _pending.courses.setdefault(course_id, set())
+    if user_id is None or users is None:
+        _pending.courses[course_id] = None
+    else:
+        users.add(user_id)
+
+    def run():
+        courses, _pending.courses = _pending.courses, {}
+        full = [course_id for course_id, users in courses.items() if users is None]
+        partial = {course_id: users for course_id, users in courses.items() if users is not None}
+        user_ids = set().union(*partial.values())
+        if len(user_ids) > FULL_SYNC_THRESHOLD:
+            full.extend(partial)
+        elif partial:
+            sync_course_rooms(list(partial), user_ids)
+        if full:
+            sync_course_rooms(full)
+
+    transaction.on_commit(run)
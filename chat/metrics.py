@@ -0,0 +1,29 @@
+# chat/metrics.py
+
+from collections import defaultdict
+
+# Бројачи по процес (ASGI worker); се читаат преку chat:metrics
+_counters = defaultdict(int)
+# Највисоки забележани вредности (на пр. длабочина на излезен ред)
+_high_water = {}
+
+
+def incr(name, amount=1):
+    _counters[name] += amount
+
+
+def high_water(name, value):
+    if value > _high_water.get(name, 0):
+        _high_water[name] = value
+
+
+def snapshot():
+    return {
+        'counters': dict(_counters),
+        'high_water': dict(_high_water),
+    }
+
+
+def reset():
+    _counters.clear()
+    _high_water.clear()
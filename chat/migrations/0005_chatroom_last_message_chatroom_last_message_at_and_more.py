@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_summaries(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+
+    for room in ChatRoom.objects.all():
+        last = Message.objects.filter(room=room).select_related('sender').order_by('-timestamp', '-id').first()
+        room.message_count = Message.objects.filter(room=room).count()
+        room.participant_count = room.participants.count()
+        if last:
+            full_name = f'{last.sender.first_name} {last.sender.last_name}'.strip()
+            room.last_message = last
+            room.last_message_preview = last.content[:200]
+            room.last_message_sender = full_name or last.sender.username
+            room.last_message_at = last.timestamp
+        room.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_chat_message_room_ts_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_sender',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_read_states(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    MessageRead = apps.get_model('chat', 'MessageRead')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    states = []
+    for room in ChatRoom.objects.all():
+        for user_id in room.participants.values_list('id', flat=True):
+            last_read = MessageRead.objects.filter(
+                message__room=room,
+                user_id=user_id
+            ).aggregate(last=Max('message_id'))['last'] or 0
+            unread = Message.objects.filter(room=room, id__gt=last_read).exclude(sender_id=user_id).count()
+            states.append(RoomReadState(
+                room=room,
+                user_id=user_id,
+                last_read_message_id=last_read,
+                unread_count=unread
+            ))
+    RoomReadState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chatroom_last_message_chatroom_last_message_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'room')},
+            },
+        ),
+        migrations.RunPython(create_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def compact_message_reads(apps, schema_editor):
+    """Сведи ги MessageRead редовите на еден курсор по (корисник, соба) и избриши ги"""
+    Message = apps.get_model('chat', 'Message')
+    MessageRead = apps.get_model('chat', 'MessageRead')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    watermarks = MessageRead.objects.values('user_id', 'message__room_id').annotate(
+        last=Max('message_id')
+    )
+    for row in watermarks.iterator():
+        room_id, user_id, last = row['message__room_id'], row['user_id'], row['last']
+        # Курсори само за сегашните учесници (0006 ги креира); поранешните се прескокнуваат
+        state = RoomReadState.objects.filter(room_id=room_id, user_id=user_id).first()
+        if state is not None and last > state.last_read_message_id:
+            state.last_read_message_id = last
+            state.unread_count = Message.objects.filter(
+                room_id=room_id,
+                id__gt=last
+            ).exclude(sender_id=user_id).count()
+            state.save(update_fields=['last_read_message_id', 'unread_count'])
+
+    MessageRead.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_roomreadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_message_reads, migrations.RunPython.noop),
+    ]
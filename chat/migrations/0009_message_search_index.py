@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:31
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    SQLite: FTS5 табела (rowid = message id) што ја одржува chat.search од патеката
+    за запишување. remove_diacritics 0 - ѓ/ќ се посебни букви, не г/к со дијакритик.
+    Postgres: GIN индекс врз to_tsvector, базата сама го одржува.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+            "content, room_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 0')"
+        )
+        schema_editor.execute(
+            "INSERT INTO chat_message_fts (rowid, content, room_id) "
+            "SELECT id, content, room_id FROM chat_message"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS chat_message_search_idx ON chat_message "
+            "USING GIN (to_tsvector('simple', content))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS chat_message_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS chat_message_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_attachment_chatupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='chat.message'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('message_type', models.CharField(choices=[('text', 'Текст'), ('file', 'Фајл'), ('image', 'Слика'), ('system', 'Системска')], default='text', max_length=20)),
+                ('file_attachment', models.FileField(blank=True, null=True, upload_to='chat_files/')),
+                ('attachment', models.JSONField(blank=True, null=True)),
+                ('reply_to_id', models.BigIntegerField(blank=True, null=True)),
+                ('is_edited', models.BooleanField(default=False)),
+                ('edited_at', models.DateTimeField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='chat.chatroom')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'timestamp', 'id'], name='chat_archive_room_ts_id_idx')],
+            },
+        ),
+    ]
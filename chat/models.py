@@ -1,7 +1,10 @@
 # chat/models.py
 
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from courses.models import Course
 
 
@@ -33,6 +36,22 @@ class ChatRoom(models.Model):
     )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Пораки постари од ова се преместуваат во ArchivedMessage; празно - CHAT_RETENTION['DEFAULT_DAYS']
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+
+    # Денормализиран преглед за листата на соби (го одржува chat/summary.py)
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_preview = models.CharField(max_length=200, blank=True)
+    last_message_sender = models.CharField(max_length=150, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    participant_count = models.PositiveIntegerField(default=0)
 
     def get_room_group_name(self):
         """WebSocket group name за оваа соба"""
@@ -42,9 +61,7 @@ class ChatRoom(models.Model):
         return self.messages.order_by('-timestamp').first()
 
     def get_unread_count(self, user):
-        return self.messages.filter(
-            timestamp__gt=user.last_seen.get(str(self.id), self.created_at)
-        ).exclude(sender=user).count()
+        return self.read_states.filter(user=user).values_list('unread_count', flat=True).first() or 0
 
     def __str__(self):
         return f"{self.name} ({self.get_room_type_display()})"
@@ -67,25 +84,100 @@ class Message(models.Model):
     content = models.TextField()
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPE_CHOICES, default='text')
     file_attachment = models.FileField(upload_to='chat_files/', blank=True, null=True)
+    # Метаподатоци за обработениот прилог: име, големина, тип, димензии, thumbnail
+    attachment = models.JSONField(null=True, blank=True)
+    # Без constraint во базата: одговорот може да покажува кон архивирана порака
     reply_to = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
         null=True,
         blank=True,
-        related_name='replies'
+        related_name='replies',
+        db_constraint=False
     )
     is_edited = models.BooleanField(default=False)
     edited_at = models.DateTimeField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Избришаната порака останува како ред (без содржина) за reply_to да не се прекине
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_message_room_ts_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}..."
 
 
+class ArchivedMessage(models.Model):
+    """Стара порака преместена од Message (chat/retention.py); истиот id, се чита со историјата"""
+    id = models.BigIntegerField(primary_key=True)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    content = models.TextField()
+    message_type = models.CharField(max_length=20, choices=Message.MESSAGE_TYPE_CHOICES, default='text')
+    file_attachment = models.FileField(upload_to='chat_files/', blank=True, null=True)
+    attachment = models.JSONField(null=True, blank=True)
+    reply_to_id = models.BigIntegerField(null=True, blank=True)
+    is_edited = models.BooleanField(default=False)
+    edited_at = models.DateTimeField(null=True, blank=True)
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_archive_room_ts_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender_id}: {self.content[:50]}..."
+
+
+class ChatUpload(models.Model):
+    """Прикачување во делови; пораката се креира и објавува дури по обработката"""
+    STATUS_CHOICES = (
+        ('uploading', 'Се прикачува'),
+        ('processing', 'Се обработува'),
+        ('done', 'Готово'),
+        ('failed', 'Неуспешно'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='uploads')
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chat_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    caption = models.TextField(blank=True)
+    file = models.FileField(upload_to='chat_files/', max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error = models.CharField(max_length=255, blank=True)
+    message = models.OneToOneField(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+
 class MessageRead(models.Model):
+    """Стар запис за прочитаност по порака; новите потврди одат во RoomReadState"""
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reads')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     read_at = models.DateTimeField(auto_now_add=True)
@@ -97,6 +189,25 @@ class MessageRead(models.Model):
         return f"{self.user.username} прочита: {self.message.content[:30]}..."
 
 
+class RoomReadState(models.Model):
+    """Курсор за читање по корисник и соба: последна прочитана порака и број непрочитани"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='room_read_states'
+    )
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_states')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'room']
+
+    def __str__(self):
+        return f"{self.user.username} во {self.room.name}: {self.unread_count} непрочитани"
+
+
 class UserChatSettings(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
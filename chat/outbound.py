@@ -0,0 +1,197 @@
+# chat/outbound.py
+
+import asyncio
+import logging
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+from .encoding import encode
+from .resume import make_resume_token
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_DEFAULTS = {
+    'MAX_FRAMES': 256,
+    # Над оваа длабочина новите typing/presence фрејмови веднаш се фрлаат
+    'EPHEMERAL_LIMIT': 32,
+    # 'coalesce' - пораките на собата се заменуваат со еден resync фрејм;
+    # 'disconnect' - конекцијата се затвора со resume токен
+    'OVERFLOW': 'coalesce',
+    'CLOSE_TIMEOUT_S': 2,
+    # Најмногу толку фрејмови без потврда ({"type": "ack"}) од клиентот; send() кај
+    # Daphne не чека мрежа, па без ова редот никогаш не се полни. Важи само за
+    # конекции што испратиле барем една потврда; None - без потврди за сите
+    'ACK_WINDOW': 128,
+}
+
+# Код за затворање кога клиентот не стигнува да ги прими фрејмовите
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+EPHEMERAL_EVENTS = {'typing_update', 'presence_update'}
+# message_edited/message_deleted не се спојуваат во resync - тој ги вчитува само новите пораки
+MESSAGE_EVENTS = {'chat_message', 'message_saved', 'message_failed'}
+
+
+def get_outbound_config():
+    config = dict(OUTBOUND_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_OUTBOUND', {}))
+    return config
+
+
+class OutboundQueue:
+    """
+    Ограничен ред на излезни фрејмови за една конекција. Настаните од channel layer-от
+    само се ставаат во редот, а посебна задача ги праќа со темпото на клиентот, па
+    бавен клиент не го блокира примањето ниту троши неограничена меморија.
+
+    Темпото го даваат потврдите: клиентот повремено го праќа бројот на примени
+    фрејмови, а задачата застанува кога ACK_WINDOW фрејмови се непотврдени. Клиент
+    што никогаш не потврдува ги добива фрејмовите без чекање, како досега.
+    """
+
+    def __init__(self, consumer, config):
+        self.consumer = consumer
+        self.max_frames = config['MAX_FRAMES']
+        self.ephemeral_limit = config['EPHEMERAL_LIMIT']
+        self.overflow = config['OVERFLOW']
+        self.close_timeout = config['CLOSE_TIMEOUT_S']
+        self.ack_window = config['ACK_WINDOW']
+        self.sent = 0  # сите фрејмови испратени на конекцијата (види ChatRoomMixin.send)
+        self.acked = 0
+        self.acking = False  # клиентот праќа потврди - од првата натаму
+        self._acked = asyncio.Event()
+        self.delivered = {}  # room_id -> последен испратен message id
+        self.closed = False
+        self._frames = deque()
+        self._resync = set()  # соби со resync фрејм во редот
+        self._task = None
+
+    def put(self, event):
+        if self.closed:
+            return
+
+        handler = event['type']
+        if handler in EPHEMERAL_EVENTS and len(self._frames) >= self.ephemeral_limit:
+            metrics.incr('outbound.dropped')
+            return
+        if handler in MESSAGE_EVENTS and event.get('room_id') in self._resync:
+            # Клиентот и онака ќе ја вчита собата од историјата
+            metrics.incr('outbound.coalesced')
+            return
+        if len(self._frames) >= self.max_frames:
+            if not self._make_room():
+                self._close_slow_consumer()
+                return
+            if handler in MESSAGE_EVENTS and event.get('room_id') in self._resync:
+                metrics.incr('outbound.coalesced')
+                return
+
+        self._frames.append(event)
+        metrics.incr('outbound.queued')
+        metrics.incr('outbound.depth')
+        metrics.high_water('outbound.max_depth', len(self._frames))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._send_all())
+
+    def register(self, room_id, message_id):
+        """Почетен курсор за собата (на пр. од resume токен)"""
+        if message_id and message_id > (self.delivered.get(room_id) or 0):
+            self.delivered[room_id] = message_id
+
+    def ack(self, received):
+        """Клиентот примил received фрејмови од почетокот на конекцијата"""
+        self.acking = True
+        if received > self.acked:
+            self.acked = min(received, self.sent)
+            self._acked.set()
+
+    def unacked(self):
+        return self.sent - self.acked
+
+    def request_resync(self, room_id):
+        if room_id not in self._resync:
+            self._resync.add(room_id)
+            self._frames.append({'type': 'resync', 'room_id': room_id})
+            metrics.incr('outbound.resyncs')
+            metrics.incr('outbound.depth')
+            if self._task is None or self._task.done():
+                self._task = asyncio.ensure_future(self._send_all())
+
+    def close(self):
+        self.closed = True
+        self._replace(deque())
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def _replace(self, frames):
+        metrics.incr('outbound.depth', len(frames) - len(self._frames))
+        self._frames = frames
+
+    def _make_room(self):
+        """Прво се фрлаат typing/presence, па (coalesce) пораките се спојуваат во resync"""
+        kept = deque(event for event in self._frames if event['type'] not in EPHEMERAL_EVENTS)
+        metrics.incr('outbound.dropped', len(self._frames) - len(kept))
+        self._replace(kept)
+        if len(self._frames) < self.max_frames:
+            return True
+        if self.overflow != 'coalesce':
+            return False
+
+        frames = deque()
+        for event in self._frames:
+            room_id = event.get('room_id')
+            if event['type'] not in MESSAGE_EVENTS:
+                frames.append(event)
+            elif room_id in self._resync:
+                metrics.incr('outbound.coalesced')
+            else:
+                self._resync.add(room_id)
+                frames.append({'type': 'resync', 'room_id': room_id})
+                metrics.incr('outbound.coalesced')
+                metrics.incr('outbound.resyncs')
+        self._replace(frames)
+        return len(self._frames) < self.max_frames
+
+    async def _wait_for_ack(self):
+        while self.acking and self.ack_window and self.unacked() >= self.ack_window:
+            self._acked.clear()
+            await self._acked.wait()
+
+    async def _send_all(self):
+        while self._frames:
+            # Додека чека, новите фрејмови остануваат во редот и важат MAX_FRAMES/OVERFLOW
+            await self._wait_for_ack()
+            if not self._frames:
+                return
+            event = self._frames.popleft()
+            metrics.incr('outbound.depth', -1)
+            room_id = event.get('room_id')
+
+            if event['type'] == 'resync':
+                self._resync.discard(room_id)
+                text = encode({'type': 'resync', 'room_id': room_id, 'after_id': self.delivered.get(room_id)})
+            else:
+                text = event['text']
+
+            await self.consumer.send(text_data=text)
+            metrics.incr('outbound.sent')
+            self.register(room_id, event.get('message_id'))
+
+    def _close_slow_consumer(self):
+        metrics.incr('outbound.disconnects')
+        metrics.incr('outbound.dropped', len(self._frames))
+        self.close()
+        asyncio.ensure_future(self._send_token_and_close())
+
+    async def _send_token_and_close(self):
+        token = make_resume_token(self.consumer.user.id, self.delivered)
+        try:
+            await asyncio.wait_for(
+                self.consumer.send(text_data=encode({'type': 'resume_token', 'token': token})),
+                self.close_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.info('Resume токенот не стигна до бавниот клиент %s', self.consumer.user.id)
+        await self.consumer.close(code=SLOW_CONSUMER_CLOSE_CODE)
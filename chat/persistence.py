@@ -0,0 +1,314 @@
+# chat/persistence.py
+
+import asyncio
+import logging
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .encoding import frame_event
+from .models import Message
+from .signals import message_changed, messages_created
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_DEFAULTS = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 50,
+    'BATCH_SIZE': 100,
+    # 'buffered' - испрати веднаш со привремен ID; 'committed' - испрати по commit.
+    # Со 'buffered' пораките што се уште се во редот (до FLUSH_INTERVAL_MS) се губат ако
+    # процесот умре; при уредно гасење ги запишува lifespan (uvicorn, hypercorn), но
+    # Daphne не праќа lifespan настани, па таму прозорецот останува
+    'DURABILITY': 'buffered',
+    # 'strict' - еден пакет во лет; 'relaxed' - до MAX_INFLIGHT паралелни пакети
+    'ORDERING': 'strict',
+    'MAX_INFLIGHT': 4,
+}
+
+
+def get_write_behind_config():
+    config = dict(WRITE_BEHIND_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_WRITE_BEHIND', {}))
+    return config
+
+
+class MessageDraft:
+    """Порака што сè уште не е запишана во базата"""
+
+    def __init__(self, room_id, sender, content, reply_to_id=None, message_type='text',
+                 file_attachment=None, attachment=None):
+        self.room_id = int(room_id)
+        self.sender = sender
+        self.content = content
+        self.reply_to_id = _clean_id(reply_to_id)
+        self.message_type = message_type
+        self.file_attachment = file_attachment
+        self.attachment = attachment
+        self.timestamp = timezone.now()
+        self.provisional_id = f'p-{uuid.uuid4().hex}'
+
+    def as_payload(self, message_id=None):
+        return {
+            'id': message_id if message_id is not None else self.provisional_id,
+            'content': self.content,
+            'sender': self.sender.username,
+            'sender_id': self.sender.id,
+            'timestamp': self.timestamp.isoformat(),
+            'reply_to': self.reply_to_id,
+            'message_type': self.message_type,
+            'attachment': self.attachment,
+        }
+
+
+def _changeable_message(room_id, message_id, user, allow_staff=False):
+    message = Message.objects.filter(
+        id=_clean_id(message_id),
+        room_id=room_id,
+        is_deleted=False
+    ).exclude(message_type='system').first()
+    if message is None or (message.sender_id != user.id and not (allow_staff and user.is_staff)):
+        return None
+    return message
+
+
+def edit_message(room_id, message_id, user, content):
+    """Измени сопствена порака со едно UPDATE; враќа ја пораката или None ако не смее"""
+    with transaction.atomic():
+        message = _changeable_message(room_id, message_id, user)
+        if message is None:
+            return None
+        message.content = content
+        message.is_edited = True
+        message.edited_at = timezone.now()
+        message.save(update_fields=['content', 'is_edited', 'edited_at'])
+        message_changed.send(sender=Message, message=message)
+    return message
+
+
+def delete_message(room_id, message_id, user):
+    """
+    Меко бришење (испраќачот или staff): редот останува без содржина, па одговорите
+    што покажуваат кон него не се менуваат. Прикачениот фајл се брише по commit -
+    неговиот јавен URL инаку би продолжил да се сервира.
+    """
+    from .uploads import remove_message_files
+
+    with transaction.atomic():
+        message = _changeable_message(room_id, message_id, user, allow_staff=True)
+        if message is None:
+            return None
+        file_name = message.file_attachment.name if message.file_attachment else None
+        message.content = ''
+        message.attachment = None
+        message.file_attachment = None
+        message.is_deleted = True
+        message.deleted_at = timezone.now()
+        message.save(update_fields=['content', 'attachment', 'file_attachment', 'is_deleted', 'deleted_at'])
+        message_changed.send(sender=Message, message=message)
+        transaction.on_commit(lambda: remove_message_files(message.id, file_name))
+    return message
+
+
+def _clean_id(value):
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def write_messages(drafts):
+    """Зачувај пакет пораки со едно bulk_create"""
+    reply_ids = {draft.reply_to_id for draft in drafts if draft.reply_to_id}
+    valid_replies = set()
+    if reply_ids:
+        valid_replies = set(
+            Message.objects.filter(id__in=reply_ids).values_list('id', 'room_id')
+        )
+
+    messages = [
+        Message(
+            room_id=draft.room_id,
+            sender=draft.sender,
+            content=draft.content,
+            message_type=draft.message_type,
+            file_attachment=draft.file_attachment,
+            attachment=draft.attachment,
+            reply_to_id=draft.reply_to_id if (draft.reply_to_id, draft.room_id) in valid_replies else None,
+            timestamp=draft.timestamp,
+        )
+        for draft in drafts
+    ]
+
+    # Изведените ажурирања (преглед, непрочитани) во истата трансакција - еден commit по пакет
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        messages_created.send(sender=Message, messages=messages)
+    return messages
+
+
+# Маркер во редот: тековниот пакет се запишува веднаш (drain)
+_FLUSH_NOW = object()
+
+
+class MessageWriteBehind:
+    """Per-process ред кој ги запишува пораките во пакети на секои N ms или M пораки"""
+
+    def __init__(self, config):
+        self.flush_interval = config['FLUSH_INTERVAL_MS'] / 1000
+        self.batch_size = config['BATCH_SIZE']
+        self.durability = config['DURABILITY']
+        self.strict = config['ORDERING'] == 'strict'
+        self.max_inflight = 1 if self.strict else config['MAX_INFLIGHT']
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'failed': 0}
+        self._loop = None
+        self._queue = None
+        self._inflight = None
+        self._task = None
+        # Референци до паралелните flush-ови (relaxed), за GC да не ги собере во лет
+        self._flushes = set()
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._task = loop.create_task(self._run())
+
+    def submit(self, draft):
+        """Стави порака во редот; враќа future што се разрешува со зачуваната порака"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((draft, future))
+        self.stats['queued'] += 1
+        return future
+
+    async def drain(self):
+        """Запиши ги веднаш пораките во редот (без чекање на FLUSH_INTERVAL_MS) и почекај ги"""
+        if self._queue is not None:
+            self._queue.put_nowait(_FLUSH_NOW)
+            await self._queue.join()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _FLUSH_NOW:
+                self._queue.task_done()
+                continue
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _FLUSH_NOW:
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            await self._inflight.acquire()
+            if self.strict:
+                await self._flush(batch)
+            else:
+                flush = loop.create_task(self._flush(batch))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        drafts = [draft for draft, _ in batch]
+        try:
+            messages = await database_sync_to_async(write_messages)(drafts)
+        except Exception as exc:
+            logger.exception('Неуспешно запишување на пакет од %s пораки', len(batch))
+            self.stats['failed'] += len(batch)
+            for _, future in batch:
+                if future.done():
+                    continue
+                if self.durability == 'buffered':
+                    # Никој не го чека future-от; клиентите добиваат message_failed
+                    future.set_result(None)
+                else:
+                    future.set_exception(exc)
+            if self.durability == 'buffered':
+                await self._notify(drafts, None)
+        else:
+            self.stats['written'] += len(messages)
+            self.stats['batches'] += 1
+            for (_, future), message in zip(batch, messages):
+                if not future.done():
+                    future.set_result(message)
+            if self.durability == 'buffered':
+                await self._notify(drafts, messages)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+            self._inflight.release()
+
+    async def _notify(self, drafts, messages):
+        """Една потврда по соба за пакетот: привремен ID -> вистински ID"""
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+
+        by_room = {}
+        for index, draft in enumerate(drafts):
+            by_room.setdefault(draft.room_id, []).append({
+                'provisional_id': draft.provisional_id,
+                'id': messages[index].id if messages else None,
+            })
+
+        event_type = 'message_saved' if messages else 'message_failed'
+        for room_id, items in by_room.items():
+            saved_ids = [item['id'] for item in items if item['id'] is not None]
+            await channel_layer.group_send(f'chat_{room_id}', frame_event(event_type, {
+                'type': event_type,
+                'room_id': room_id,
+                'messages': items,
+            }, message_id=max(saved_ids, default=None)))
+
+
+_writer = None
+
+
+def get_message_writer():
+    """Врати го write-behind редот за процесот или None ако е исклучен"""
+    global _writer
+    config = get_write_behind_config()
+    if not config['ENABLED']:
+        return None
+    if _writer is None:
+        _writer = MessageWriteBehind(config)
+    return _writer
+
+
+async def drain_message_writer():
+    """Запиши ги пораките што чекаат во редот (гасење на процесот)"""
+    if _writer is None or _writer._loop is not asyncio.get_running_loop():
+        return
+    logger.info('Write-behind: се запишуваат %s пораки пред гасење', _writer._queue.qsize())
+    await _writer.drain()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan: при shutdown се празни write-behind редот"""
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await drain_message_writer()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,259 @@
+# chat/presence.py
+
+import asyncio
+import logging
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import metrics
+from .encoding import frame_event
+from .shared_state import get_redis, get_sync_redis, use_redis
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_DEFAULTS = {
+    'TICK_MS': 1000,
+    'HEARTBEAT_S': 15,
+    'TTL_S': 45,
+}
+
+
+def get_presence_config():
+    config = dict(PRESENCE_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_PRESENCE', {}))
+    return config
+
+
+def _member(user_id, username, channel_name):
+    return f'{user_id}:{username}:{channel_name}'
+
+
+def _parse_member(member):
+    user_id, username, _ = member.split(':', 2)
+    return int(user_id), username
+
+
+def _unique_users(members):
+    users = {}
+    for member in members:
+        user_id, username = _parse_member(member)
+        users[user_id] = username
+    return users
+
+
+class MemoryPresenceStore:
+    """Stand-in за еден процес: room_id -> {member: истекува_во}"""
+
+    def __init__(self):
+        self._rooms = {}
+
+    def _live(self, room_id, now):
+        return [member for member, expires in self._rooms.get(room_id, {}).items() if expires > now]
+
+    def _user_connections(self, room_id, user_id, now):
+        return sum(1 for member in self._live(room_id, now) if _parse_member(member)[0] == user_id)
+
+    async def add(self, room_id, member, ttl):
+        now = time.time()
+        user_id = _parse_member(member)[0]
+        first = self._user_connections(room_id, user_id, now) == 0
+        self._rooms.setdefault(room_id, {})[member] = now + ttl
+        return first
+
+    async def remove(self, room_id, member):
+        room = self._rooms.get(room_id, {})
+        if room.pop(member, None) is None:
+            return False
+        return self._user_connections(room_id, _parse_member(member)[0], time.time()) == 0
+
+    async def refresh(self, entries, ttl):
+        expires = time.time() + ttl
+        for room_id, member in entries:
+            self._rooms.setdefault(room_id, {})[member] = expires
+
+    async def sweep(self, room_id):
+        now = time.time()
+        room = self._rooms.get(room_id, {})
+        expired = [member for member, expires in room.items() if expires <= now]
+        for member in expired:
+            del room[member]
+        live_users = _unique_users(self._live(room_id, now))
+        return {
+            user_id: username
+            for user_id, username in _unique_users(expired).items()
+            if user_id not in live_users
+        }
+
+    def members(self, room_id):
+        return _unique_users(self._live(room_id, time.time()))
+
+
+class RedisPresenceStore:
+    """ZSET chat:presence:<room> со член user_id:username:channel и score = време на истек"""
+
+    @staticmethod
+    def _key(room_id):
+        return f'chat:presence:{room_id}'
+
+    @staticmethod
+    def _count_user(members, user_id):
+        return sum(1 for member in members if _parse_member(member)[0] == user_id)
+
+    async def add(self, room_id, member, ttl):
+        now = time.time()
+        key = self._key(room_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.zrangebyscore(key, now, '+inf')
+            pipe.zadd(key, {member: now + ttl})
+            pipe.expire(key, int(ttl * 2))
+            before, _, _ = await pipe.execute()
+        return self._count_user(before, _parse_member(member)[0]) == 0
+
+    async def remove(self, room_id, member):
+        key = self._key(room_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.zrem(key, member)
+            pipe.zrangebyscore(key, time.time(), '+inf')
+            removed, after = await pipe.execute()
+        return bool(removed) and self._count_user(after, _parse_member(member)[0]) == 0
+
+    async def refresh(self, entries, ttl):
+        expires = time.time() + ttl
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for room_id, member in entries:
+                pipe.zadd(self._key(room_id), {member: expires})
+                pipe.expire(self._key(room_id), int(ttl * 2))
+            await pipe.execute()
+
+    async def sweep(self, room_id):
+        now = time.time()
+        key = self._key(room_id)
+        client = get_redis()
+        expired = await client.zrangebyscore(key, '-inf', now)
+        if not expired:
+            return {}
+        # Само процесот чиј ZREM успеал ја објавува промената
+        async with client.pipeline(transaction=True) as pipe:
+            for member in expired:
+                pipe.zrem(key, member)
+            pipe.zrangebyscore(key, now, '+inf')
+            results = await pipe.execute()
+        removed = [member for member, ok in zip(expired, results[:-1]) if ok]
+        live_users = _unique_users(results[-1])
+        return {
+            user_id: username
+            for user_id, username in _unique_users(removed).items()
+            if user_id not in live_users
+        }
+
+    def members(self, room_id):
+        return _unique_users(get_sync_redis().zrangebyscore(self._key(room_id), time.time(), '+inf'))
+
+
+class PresenceService:
+    """
+    Брои конекции по корисник по соба. Се објавуваат само вистинските премини
+    (прва конекција / последна конекција), спакувани по соба на секој tick.
+    """
+
+    def __init__(self, config, store):
+        self.tick = config['TICK_MS'] / 1000
+        self.heartbeat = config['HEARTBEAT_S']
+        self.ttl = config['TTL_S']
+        self.store = store
+        self._local = {}    # (room_id, channel_name) -> member
+        self._pending = {}  # room_id -> {'joined': {user_id: username}, 'left': {...}}
+        self._task = None
+        self._loop = None
+
+    async def connect(self, room_id, user, channel_name):
+        member = _member(user.id, user.username, channel_name)
+        self._local[(room_id, channel_name)] = member
+        metrics.incr('presence.connects')
+        if await self.store.add(room_id, member, self.ttl):
+            self._queue(room_id, 'joined', user.id, user.username)
+        self._ensure_running()
+
+    async def disconnect(self, room_id, user, channel_name):
+        member = self._local.pop((room_id, channel_name), None)
+        if member is None:
+            return
+        if await self.store.remove(room_id, member):
+            self._queue(room_id, 'left', user.id, user.username)
+        self._ensure_running()
+
+    def online_users(self, room_id):
+        """{user_id: username} за корисниците со жива конекција во собата"""
+        try:
+            return self.store.members(room_id)
+        except Exception:
+            logger.warning('Присуството не е достапно', exc_info=True)
+            return {}
+
+    def _queue(self, room_id, kind, user_id, username):
+        metrics.incr('presence.transitions')
+        pending = self._pending.setdefault(room_id, {'joined': {}, 'left': {}})
+        opposite = 'left' if kind == 'joined' else 'joined'
+        if user_id in pending[opposite]:
+            # Влез и излез во ист tick (reload, нов таб) - нема што да се објави
+            del pending[opposite][user_id]
+            metrics.incr('presence.coalesced')
+        else:
+            pending[kind][user_id] = username
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_heartbeat = loop.time() + self.heartbeat
+        while self._local or self._pending:
+            await asyncio.sleep(self.tick)
+            try:
+                if loop.time() >= next_heartbeat:
+                    next_heartbeat = loop.time() + self.heartbeat
+                    await self._heartbeat()
+                await self._flush()
+            except Exception:
+                logger.exception('Грешка при ажурирање на присуството')
+
+    async def _heartbeat(self):
+        await self.store.refresh(
+            [(room_id, member) for (room_id, _), member in self._local.items()],
+            self.ttl
+        )
+        for room_id in {room_id for room_id, _ in self._local}:
+            for user_id, username in (await self.store.sweep(room_id)).items():
+                self._queue(room_id, 'left', user_id, username)
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        channel_layer = get_channel_layer()
+        for room_id, changes in pending.items():
+            joined = [{'user_id': user_id, 'username': name} for user_id, name in changes['joined'].items()]
+            left = [{'user_id': user_id, 'username': name} for user_id, name in changes['left'].items()]
+            if not joined and not left:
+                continue
+            metrics.incr('presence.broadcasts')
+            await channel_layer.group_send(f'chat_{room_id}', frame_event('presence_update', {
+                'type': 'presence',
+                'room_id': room_id,
+                'joined': joined,
+                'left': left,
+            }))
+
+
+_presence = None
+
+
+def get_presence():
+    global _presence
+    if _presence is None:
+        store = RedisPresenceStore() if use_redis() else MemoryPresenceStore()
+        _presence = PresenceService(get_presence_config(), store)
+    return _presence
@@ -0,0 +1,139 @@
+# chat/ratelimit.py
+
+import logging
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .shared_state import get_redis, use_redis
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_DEFAULTS = {
+    # Пораки во секунда и најголем налет; RATE 0 или None - без ограничување
+    'USER_RATE': 1.0,
+    'USER_BURST': 10,
+    'ROOM_RATE': 20.0,
+    'ROOM_BURST': 60,
+}
+
+# Сите корпи се проверуваат и трошат атомски: одбиена порака не троши токен
+# од другите корпи. Времето е од Redis за сите процеси да имаат ист часовник.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local wait = 0
+local limited = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 and (1 - tokens) / rate > wait then
+        wait = (1 - tokens) / rate
+        limited = i
+    end
+end
+if limited > 0 then
+    return {limited, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {0, '0'}
+"""
+
+
+def get_rate_limit_config():
+    config = dict(RATE_LIMIT_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_RATE_LIMIT', {}))
+    return config
+
+
+class MemoryTokenBuckets:
+    """Stand-in за еден процес; consumer-ите се во истиот event loop, па нема потреба од lock"""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated)
+
+    async def take(self, buckets):
+        now = time.monotonic()
+        levels = []
+        wait, limited = 0, 0
+        for index, (key, rate, burst) in enumerate(buckets, 1):
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            levels.append(tokens)
+            if tokens < 1 and (1 - tokens) / rate > wait:
+                wait, limited = (1 - tokens) / rate, index
+        if limited:
+            return limited, wait
+
+        for (key, _, _), tokens in zip(buckets, levels):
+            self._buckets[key] = (tokens - 1, now)
+        return 0, 0
+
+
+class RedisTokenBuckets:
+    """Корпите во Redis-от од channel layer-от, заеднички за сите worker процеси"""
+
+    async def take(self, buckets):
+        script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+        args = []
+        for _, rate, burst in buckets:
+            args.extend((rate, burst))
+        limited, wait = await script(keys=[key for key, _, _ in buckets], args=args)
+        return int(limited), float(wait)
+
+
+class RateLimiter:
+    """Token bucket по корисник (низ сите соби) и по соба за нови пораки"""
+
+    def __init__(self, config, store):
+        self.store = store
+        self.scopes = [
+            (scope, config[f'{scope.upper()}_RATE'], config[f'{scope.upper()}_BURST'])
+            for scope in ('user', 'room')
+            if config[f'{scope.upper()}_RATE']
+        ]
+
+    async def check_message(self, user_id, room_id):
+        """(None, 0) ако пораката е дозволена, инаку ('user' или 'room', секунди до следен токен)"""
+        if not self.scopes:
+            return None, 0
+
+        ids = {'user': user_id, 'room': room_id}
+        buckets = [(f'chat:ratelimit:{scope}:{ids[scope]}', rate, burst) for scope, rate, burst in self.scopes]
+        try:
+            limited, wait = await self.store.take(buckets)
+        except Exception:
+            # Недостапен Redis не смее да го запре четот
+            logger.warning('Rate limit проверката не успеа', exc_info=True)
+            metrics.incr('ratelimit.errors')
+            return None, 0
+
+        if not limited:
+            return None, 0
+        scope = self.scopes[limited - 1][0]
+        metrics.incr('ratelimit.rejected')
+        metrics.incr(f'ratelimit.rejected.{scope}')
+        return scope, wait
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        store = RedisTokenBuckets() if use_redis() else MemoryTokenBuckets()
+        _limiter = RateLimiter(get_rate_limit_config(), store)
+    return _limiter
@@ -0,0 +1,123 @@
+# chat/recent.py
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+from .history import MAX_PAGE_SIZE, fetch_messages, serialize_message
+
+logger = logging.getLogger(__name__)
+
+RECENT_CACHE_DEFAULTS = {
+    'ALIAS': 'chat',
+    'SIZE': 50,
+    'TIMEOUT': 600,
+    # По грешка кешот се прескокнува толку секунди (едно предупредување наместо по барање)
+    'RETRY_AFTER_S': 30,
+}
+
+# time.monotonic() до кога кешот се смета за недостапен
+_unavailable_until = 0
+
+
+def get_recent_config():
+    config = dict(RECENT_CACHE_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_RECENT_CACHE', {}))
+    return config
+
+
+def _cache():
+    alias = get_recent_config()['ALIAS']
+    if alias and alias in settings.CACHES and time.monotonic() >= _unavailable_until:
+        return caches[alias]
+    return None
+
+
+def _key(room_id):
+    return f'chat:recent:{room_id}'
+
+
+def _cache_call(method, *args):
+    # Недостапен кеш значи само читање од базата до следниот обид
+    global _unavailable_until
+    if time.monotonic() < _unavailable_until:
+        return None
+    try:
+        return method(*args)
+    except Exception as error:
+        retry_after = get_recent_config()['RETRY_AFTER_S']
+        _unavailable_until = time.monotonic() + retry_after
+        logger.warning('Кешот за последни пораки не е достапен (%s); нов обид за %s s', error, retry_after)
+        return None
+
+
+def recent_messages(room_id, last_message_id, message_count, limit):
+    """
+    Најновите limit пораки на собата (како fetch_messages). Записот во кешот важи само
+    ако одговара на прегледот на собата (last_message_id, message_count), па пропуштено
+    додавање или паралелно запишување значи промашување, а не застарени пораки.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    config = get_recent_config()
+    cache = _cache()
+    if cache is None or limit > config['SIZE']:
+        return fetch_messages(room_id, limit=limit)
+
+    entry = _cache_call(cache.get, _key(room_id))
+    if entry and entry['last_id'] == last_message_id and entry['count'] == message_count:
+        metrics.incr('recent.hits')
+        messages = entry['messages']
+        return messages[-limit:], entry['has_more'] or len(messages) > limit
+
+    metrics.incr('recent.misses')
+    messages, has_more = fetch_messages(room_id, limit=config['SIZE'])
+    _cache_call(cache.set, _key(room_id), {
+        'last_id': messages[-1]['id'] if messages else None,
+        'count': message_count,
+        'messages': messages,
+        'has_more': has_more,
+    }, config['TIMEOUT'])
+    return messages[-limit:], has_more or len(messages) > limit
+
+
+def append_messages(messages):
+    """Додади ги новите пораки на постоечките записи по commit (празен запис се полни при читање)"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message)
+
+    def append():
+        config = get_recent_config()
+        cache = _cache()
+        if cache is None:
+            return
+        for room_id, room_messages in by_room.items():
+            entry = _cache_call(cache.get, _key(room_id))
+            if not entry:
+                continue
+            rows = sorted(
+                entry['messages'] + [serialize_message(message) for message in room_messages],
+                key=lambda row: (row['timestamp'], row['id'])
+            )
+            entry.update({
+                'last_id': rows[-1]['id'],
+                'count': entry['count'] + len(room_messages),
+                'messages': rows[-config['SIZE']:],
+                'has_more': entry['has_more'] or len(rows) > config['SIZE'],
+            })
+            _cache_call(cache.set, _key(room_id), entry, config['TIMEOUT'])
+            metrics.incr('recent.appends')
+
+    transaction.on_commit(append)
+
+
+def invalidate_recent(room_ids):
+    cache = _cache()
+    if cache is None:
+        return
+    _cache_call(cache.delete_many, [_key(room_id) for room_id in room_ids])
+    metrics.incr('recent.invalidations', len(room_ids))
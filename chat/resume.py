@@ -0,0 +1,210 @@
+# chat/resume.py
+
+import bisect
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+
+from . import metrics
+from .history import MAX_PAGE_SIZE, fetch_messages
+from .models import Message
+from .shared_state import get_sync_redis, use_redis
+
+logger = logging.getLogger(__name__)
+
+RESUME_DEFAULTS = {
+    'TOKEN_MAX_AGE_S': 300,
+    # Последни пораки по соба што се чуваат за replay без база
+    'BUFFER_SIZE': 200,
+    'BUFFER_TTL_S': 3600,
+    # Подолга празнина се праќа делумно, а остатокот клиентот го вчитува од историјата
+    'MAX_REPLAY': 500,
+}
+
+RESUME_SALT = 'chat.resume'
+
+
+def get_resume_config():
+    config = dict(RESUME_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_RESUME', {}))
+    return config
+
+
+def make_resume_token(user_id, cursors):
+    """Потпишан токен: последната испорачана порака по соба ({room_id: message_id или None})"""
+    return signing.dumps(
+        {'u': user_id, 'r': {str(room_id): message_id for room_id, message_id in cursors.items()}},
+        salt=RESUME_SALT,
+        compress=True,
+    )
+
+
+def read_resume_token(token, user_id):
+    """{room_id: message_id} од токенот или None ако е невалиден, истечен или туѓ"""
+    try:
+        data = signing.loads(token, salt=RESUME_SALT, max_age=get_resume_config()['TOKEN_MAX_AGE_S'])
+    except signing.BadSignature:
+        return None
+    if data.get('u') != user_id:
+        return None
+    return {int(room_id): message_id for room_id, message_id in data.get('r', {}).items()}
+
+
+def message_payload(message):
+    """Порака во истата форма како во chat_message фрејмот"""
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender': message.sender.username,
+        'sender_id': message.sender_id,
+        'timestamp': message.timestamp.isoformat(),
+        'reply_to': message.reply_to_id,
+        'message_type': message.message_type,
+        'attachment': message.attachment,
+        'is_edited': message.is_edited,
+        'is_deleted': message.is_deleted,
+    }
+
+
+class MemoryReplayBuffer:
+    """Stand-in за еден процес: room_id -> подредена листа (id, payload)"""
+
+    def __init__(self, size):
+        self.size = size
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def push(self, room_id, payloads):
+        with self._lock:
+            entries = self._rooms.setdefault(room_id, [])
+            for payload in payloads:
+                bisect.insort(entries, (payload['id'], payload), key=lambda entry: entry[0])
+            del entries[:-self.size]
+
+    def after(self, room_id, after_id):
+        with self._lock:
+            entries = self._rooms.get(room_id)
+            if not entries or entries[0][0] > after_id:
+                return None
+            start = bisect.bisect_right(entries, after_id, key=lambda entry: entry[0])
+            return [payload for _, payload in entries[start:]]
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+
+class RedisReplayBuffer:
+    """ZSET chat:replay:<room> со score = message id; најстариот член е границата на покриеност"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(room_id):
+        return f'chat:replay:{room_id}'
+
+    def push(self, room_id, payloads):
+        key = self._key(room_id)
+        with get_sync_redis().pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {json.dumps(payload): payload['id'] for payload in payloads})
+            pipe.zremrangebyrank(key, 0, -self.size - 1)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def after(self, room_id, after_id):
+        key = self._key(room_id)
+        with get_sync_redis().pipeline(transaction=True) as pipe:
+            pipe.zrange(key, 0, 0, withscores=True)
+            pipe.zrangebyscore(key, f'({after_id}', '+inf')
+            oldest, newer = pipe.execute()
+        if not oldest or oldest[0][1] > after_id:
+            return None
+        return [json.loads(member) for member in newer]
+
+    def forget(self, room_id):
+        get_sync_redis().delete(self._key(room_id))
+
+
+_buffer = None
+
+
+def get_replay_buffer():
+    global _buffer
+    if _buffer is None:
+        config = get_resume_config()
+        if use_redis():
+            _buffer = RedisReplayBuffer(config['BUFFER_SIZE'], config['BUFFER_TTL_S'])
+        else:
+            _buffer = MemoryReplayBuffer(config['BUFFER_SIZE'])
+    return _buffer
+
+
+def remember_messages(messages):
+    """Додади ги новите пораки во прстенот на собата по commit"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message_payload(message))
+
+    def push():
+        buffer = get_replay_buffer()
+        for room_id, payloads in by_room.items():
+            try:
+                buffer.push(room_id, payloads)
+            except Exception:
+                # Празнина во прстенот не смее да се пропушти - следниот replay оди во база
+                logger.warning('Replay баферот за соба %s не е ажуриран', room_id, exc_info=True)
+                forget_room(room_id)
+
+    transaction.on_commit(push)
+
+
+def forget_room(room_id):
+    try:
+        get_replay_buffer().forget(room_id)
+    except Exception:
+        logger.warning('Replay баферот за соба %s не е исчистен', room_id, exc_info=True)
+
+
+def missed_messages(room_id, after_id):
+    """
+    Пораките по after_id: од прстенот ако го покрива курсорот, инаку со keyset
+    прашање по индексот. Враќа (пораки, complete); complete=False значи дека
+    клиентот треба да го вчита остатокот од историјата.
+    """
+    limit = get_resume_config()['MAX_REPLAY']
+
+    try:
+        buffered = get_replay_buffer().after(room_id, after_id)
+    except Exception:
+        logger.warning('Replay баферот не е достапен', exc_info=True)
+        buffered = None
+    if buffered is not None:
+        metrics.incr('replay.buffer_hits')
+        metrics.incr('replay.messages', len(buffered[:limit]))
+        return buffered[:limit], len(buffered) <= limit
+
+    metrics.incr('replay.db_fallbacks')
+    messages = []
+    cursor = after_id
+    while len(messages) < limit:
+        rows, has_more = fetch_messages(room_id, after_id=cursor, limit=min(MAX_PAGE_SIZE, limit - len(messages)))
+        if not rows and not messages and not Message.objects.filter(room_id=room_id, id=after_id).exists():
+            # Непознат курсор - нема од каде да се продолжи
+            return [], False
+        for row in rows:
+            row['timestamp'] = row['timestamp'].isoformat()
+            row.pop('sender_name', None)
+        messages.extend(rows)
+        if not has_more:
+            metrics.incr('replay.messages', len(messages))
+            return messages, True
+        cursor = rows[-1]['id']
+    metrics.incr('replay.messages', len(messages))
+    metrics.incr('replay.truncated')
+    return messages, False
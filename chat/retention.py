@@ -0,0 +1,116 @@
+# chat/retention.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import metrics, search
+from .models import ArchivedMessage, ChatRoom, ChatUpload, Message, MessageRead
+
+RETENTION_DEFAULTS = {
+    # None - пораките остануваат во Message засекогаш (освен ако собата има retention_days)
+    'DEFAULT_DAYS': None,
+    'BATCH_SIZE': 1000,
+}
+
+ARCHIVE_FIELDS = (
+    'id',
+    'room_id',
+    'sender_id',
+    'content',
+    'message_type',
+    'file_attachment',
+    'attachment',
+    'reply_to_id',
+    'is_edited',
+    'edited_at',
+    'is_deleted',
+    'deleted_at',
+    'timestamp',
+)
+
+
+def get_retention_config():
+    config = dict(RETENTION_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_RETENTION', {}))
+    return config
+
+
+def retention_cutoff(room, now=None):
+    """Пораките на собата пред ова време одат во архивата; None ако собата нема полиса"""
+    days = room.retention_days
+    if days is None:
+        days = get_retention_config()['DEFAULT_DAYS']
+    if not days:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _archivable(room_id, cutoff):
+    # Последната порака останува - на неа покажува прегледот на собата
+    last_message_id = ChatRoom.objects.filter(id=room_id).values_list('last_message_id', flat=True).first()
+    return Message.objects.filter(room_id=room_id, timestamp__lt=cutoff).exclude(id=last_message_id)
+
+
+def _delete_hot(message_ids):
+    """
+    Бришење без collector: post_delete по порака би го чистел кешот и replay прстенот
+    за пораки што и онака ги нема таму, а одговорите (reply_to без constraint)
+    треба да останат и да покажуваат кон архивата.
+    """
+    MessageRead.objects.filter(message_id__in=message_ids).delete()
+    ChatUpload.objects.filter(message_id__in=message_ids).update(message=None)
+    search.remove_messages(message_ids)
+    placeholders = ', '.join(['%s'] * len(message_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {Message._meta.db_table} WHERE id IN ({placeholders})', list(message_ids))
+
+
+def archive_room(room, now=None, batch_size=None):
+    """Премести ги старите пораки на собата во ArchivedMessage, во пакети; враќа број"""
+    cutoff = retention_cutoff(room, now)
+    if cutoff is None:
+        return 0
+    batch_size = batch_size or get_retention_config()['BATCH_SIZE']
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(_archivable(room.id, cutoff).order_by('timestamp', 'id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            ArchivedMessage.objects.bulk_create(
+                [ArchivedMessage(**row) for row in rows],
+                ignore_conflicts=True
+            )
+            _delete_hot([row['id'] for row in rows])
+        archived += len(rows)
+        metrics.incr('retention.archived', len(rows))
+        if len(rows) < batch_size:
+            break
+    return archived
+
+
+def archivable_count(room, now=None):
+    cutoff = retention_cutoff(room, now)
+    return _archivable(room.id, cutoff).count() if cutoff else 0
+
+
+def archive_rooms(room_ids=None, now=None, batch_size=None, dry_run=False):
+    """Примени ја полисата на сите (или избраните) соби; враќа {room_id: број пораки}"""
+    rooms = ChatRoom.objects.only('id', 'retention_days').order_by('id')
+    if room_ids:
+        rooms = rooms.filter(id__in=room_ids)
+
+    now = now or timezone.now()
+    results = {}
+    for room in rooms.iterator():
+        if dry_run:
+            count = archivable_count(room, now)
+        else:
+            count = archive_room(room, now, batch_size)
+        if count:
+            results[room.id] = count
+    return results
@@ -0,0 +1,188 @@
+# chat/search.py
+
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+from .models import ChatRoom, Message
+
+SEARCH_DEFAULTS = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 50,
+    # Број на зборови околу погодокот во snippet-от
+    'SNIPPET_WORDS': 12,
+    'MAX_TERMS': 8,
+}
+
+# Маркери за погодоците; се заменуваат со <mark> откако текстот ќе се escape-не
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def get_search_config():
+    config = dict(SEARCH_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_SEARCH', {}))
+    return config
+
+
+def search_terms(query):
+    """Зборовите од барањето (Unicode, па и кирилица); сè друго се игнорира"""
+    return _TERM_RE.findall(query.lower())[:get_search_config()['MAX_TERMS']]
+
+
+def highlight(snippet):
+    return html.escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+class SqliteSearchBackend:
+    """
+    FTS5 табела chat_message_fts (rowid = message id) со unicode61 токенизација -
+    case folding и за кирилица, без отстранување дијакритици (ќ не е к). Се одржува
+    од messages_created и post_delete.
+    """
+
+    def index(self, messages):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO chat_message_fts (rowid, content, room_id) VALUES (%s, %s, %s)',
+                [(message.id, message.content, message.room_id) for message in messages]
+            )
+
+    def remove(self, message_ids):
+        placeholders = ', '.join(['%s'] * len(message_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM chat_message_fts WHERE rowid IN ({placeholders})', list(message_ids))
+
+    def search(self, terms, room_ids, before_id, limit, snippet_words):
+        # Секој збор како префикс, сите мора да се појават
+        match = ' '.join(f'"{term}"*' for term in terms)
+        placeholders = ', '.join(['%s'] * len(room_ids))
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, '…', snippet_words, match, *room_ids]
+        cursor_filter = ''
+        if before_id:
+            cursor_filter = 'AND rowid < %s'
+            params.append(before_id)
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet(chat_message_fts, 0, %s, %s, %s, %s) FROM chat_message_fts '
+                f'WHERE chat_message_fts MATCH %s AND room_id IN ({placeholders}) {cursor_filter} '
+                f'ORDER BY rowid DESC LIMIT %s',
+                params
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend:
+    """GIN индекс врз to_tsvector('simple', content); базата сама го одржува"""
+
+    def index(self, messages):
+        pass
+
+    def remove(self, message_ids):
+        pass
+
+    def search(self, terms, room_ids, before_id, limit, snippet_words):
+        # 'simple' конфигурација - нема речник за македонски, само lowercase
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        options = (
+            f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, '
+            f'MaxWords={snippet_words}, MinWords={max(1, snippet_words // 2)}'
+        )
+        params = [options, tsquery, room_ids]
+        cursor_filter = ''
+        if before_id:
+            cursor_filter = 'AND m.id < %s'
+            params.append(before_id)
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT m.id, ts_headline('simple', m.content, q, %s) "
+                "FROM chat_message m, to_tsquery('simple', %s) q "
+                "WHERE to_tsvector('simple', m.content) @@ q AND m.room_id = ANY(%s) "
+                f"{cursor_filter} ORDER BY m.id DESC LIMIT %s",
+                params
+            )
+            return cursor.fetchall()
+
+
+_BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    """None за бази без поддржан full-text индекс"""
+    backend_class = _BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def index_messages(messages):
+    """Во истата трансакција како и запишувањето, за индексот да не заостанува"""
+    backend = get_search_backend()
+    if backend is not None and messages:
+        backend.index(messages)
+
+
+def remove_messages(message_ids):
+    backend = get_search_backend()
+    if backend is not None and message_ids:
+        backend.remove(message_ids)
+
+
+def search_messages(user, query, room_id=None, before_id=None, limit=None):
+    """
+    Пораки што ги содржат сите зборови од барањето (како префикси), само од собите на
+    корисникот, најновите прво. Враќа (резултати, next_cursor); next_cursor се праќа
+    како before_id за следната страница.
+    """
+    config = get_search_config()
+    limit = max(1, min(limit or config['PAGE_SIZE'], config['MAX_PAGE_SIZE']))
+    terms = search_terms(query)
+    backend = get_search_backend()
+    if not terms or backend is None:
+        return [], None
+
+    if room_id:
+        room_ids = [room_id]
+    else:
+        room_ids = list(ChatRoom.objects.filter(participants=user).values_list('id', flat=True))
+    if not room_ids:
+        return [], None
+
+    metrics.incr('search.queries')
+    rows = backend.search(terms, room_ids, before_id, limit + 1, config['SNIPPET_WORDS'])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    details = {
+        row['id']: row for row in Message.objects.filter(id__in=[message_id for message_id, _ in rows]).values(
+            'id', 'room_id', 'room__name', 'sender_id', 'sender__username', 'timestamp', 'message_type'
+        )
+    }
+    results = []
+    for message_id, snippet in rows:
+        row = details.get(message_id)
+        if row is None:
+            continue
+        results.append({
+            'id': message_id,
+            'room_id': row['room_id'],
+            'room_name': row['room__name'],
+            'sender': row['sender__username'],
+            'sender_id': row['sender_id'],
+            'timestamp': row['timestamp'].isoformat(),
+            'message_type': row['message_type'],
+            'snippet': highlight(snippet),
+        })
+
+    metrics.incr('search.results', len(results))
+    return results, rows[-1][0] if has_more else None
@@ -0,0 +1,54 @@
+# chat/shared_state.py
+
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_async_clients = weakref.WeakKeyDictionary()
+_sync_client = None
+
+
+def use_redis():
+    """
+    Заедничка состојба (присуство, replay, rate limit) во Redis-от од channel layer-от.
+    Со InMemoryChannelLayer (тестови, еден процес) се користи меморија во процесот.
+    """
+    backend = getattr(settings, 'CHAT_SHARED_STATE', {}).get('BACKEND')
+    if backend:
+        return backend == 'redis'
+    layer = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '')
+    return 'redis' in layer.lower()
+
+
+def _redis_url():
+    url = getattr(settings, 'CHAT_SHARED_STATE', {}).get('URL')
+    if url:
+        return url
+    hosts = settings.CHANNEL_LAYERS['default'].get('CONFIG', {}).get('hosts') or [('127.0.0.1', 6379)]
+    host = hosts[0]
+    if isinstance(host, dict):
+        host = host.get('address', ('127.0.0.1', 6379))
+    if isinstance(host, str):
+        return host
+    return f'redis://{host[0]}:{host[1]}/0'
+
+
+def get_redis():
+    """redis.asyncio клиент за тековниот event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(_redis_url(), decode_responses=True)
+        _async_clients[loop] = client
+    return client
+
+
+def get_sync_redis():
+    """Синхрон клиент за views и management команди"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(_redis_url(), decode_responses=True)
+    return _sync_client
@@ -1,12 +1,111 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Message, MessageRead
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, m2m_changed
+from django.dispatch import receiver, Signal
+from .access import invalidate_room_access
+from .models import ChatRoom, Message
+from . import recent, resume, search, summary, unread
+
+# Се праќа по секое запишување на нови пораки (поединечно или во пакет)
+messages_created = Signal()
+
+# Се праќа по измена или (меко) бришење на порака, во истата трансакција
+message_changed = Signal()
+
 
 @receiver(post_save, sender=Message)
-def create_message_read_for_sender(sender, instance, created, **kwargs):
-    """Автоматски означи ја пораката како прочитана за испраќачот"""
+def announce_created_message(sender, instance, created, **kwargs):
+    """Пораки креирани надвор од chat.persistence (admin, системски) исто поминуваат низ messages_created"""
     if created:
-        MessageRead.objects.create(
-            message=instance,
-            user=instance.sender
-        )
\ No newline at end of file
+        messages_created.send(sender=Message, messages=[instance])
+
+
+@receiver(messages_created, sender=Message)
+def update_room_summary(sender, messages, **kwargs):
+    """Ажурирај го прегледот на собата (бројач и последна порака)"""
+    summary.apply_new_messages(messages)
+
+
+@receiver(messages_created, sender=Message)
+def update_unread_counts(sender, messages, **kwargs):
+    """Ажурирај ги курсорите за читање на учесниците"""
+    unread.apply_new_messages(messages)
+
+
+@receiver(messages_created, sender=Message)
+def update_replay_buffer(sender, messages, **kwargs):
+    """Новите пораки во прстенот за replay при повторно поврзување"""
+    resume.remember_messages(messages)
+
+
+@receiver(messages_created, sender=Message)
+def update_recent_cache(sender, messages, **kwargs):
+    """Новите пораки на крајот од кешираните последни пораки на собата"""
+    recent.append_messages(messages)
+
+
+@receiver(messages_created, sender=Message)
+def update_search_index(sender, messages, **kwargs):
+    """Новите пораки во full-text индексот, во истата трансакција"""
+    search.index_messages(messages)
+
+
+@receiver(message_changed, sender=Message)
+def refresh_changed_message(sender, message, **kwargs):
+    """Кешираните страници и replay прстенот ја имаат старата содржина; индексот и прегледот се ажурираат"""
+    if message.is_deleted:
+        search.remove_messages([message.id])
+    else:
+        search.index_messages([message])
+    summary.apply_message_change(message)
+
+    def invalidate():
+        recent.invalidate_recent([message.room_id])
+        resume.forget_room(message.room_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=Message)
+def forget_deleted_message(sender, instance, **kwargs):
+    """Избришана порака не смее да остане во кешот, во replay прстенот, индексот ниту во прегледот"""
+    search.remove_messages([instance.id])
+    summary.apply_deleted_message(instance)
+    room_id = instance.room_id
+
+    def invalidate():
+        # По commit - инаку паралелно читање би го наполнило кешот со пораката пред бришењето
+        recent.invalidate_recent([room_id])
+        resume.forget_room(room_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def on_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Исчисти го кешот за пристап, ажурирај го бројот на учесници и курсорите за читање"""
+    if action == 'pre_clear':
+        # По clear веќе не знаеме кои биле учесници, па ги земаме однапред
+        if reverse:
+            instance._cleared_pks = set(instance.chat_rooms.values_list('id', flat=True))
+        else:
+            instance._cleared_pks = set(instance.participants.values_list('id', flat=True))
+        return
+
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        room_ids, user_ids = pk_set or (), [instance.pk]
+    else:
+        room_ids, user_ids = [instance.pk], pk_set or ()
+
+    # По commit - инаку паралелно читање би ја кеширало старата припадност пред commit-от
+    room_ids, user_ids = list(room_ids), list(user_ids)
+    transaction.on_commit(lambda: invalidate_room_access(room_ids, user_ids))
+    summary.refresh_participant_counts(room_ids)
+    if action == 'post_add':
+        unread.ensure_read_states(room_ids, user_ids)
+    else:
+        unread.remove_read_states(room_ids, user_ids)
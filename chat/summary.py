@@ -0,0 +1,121 @@
+# chat/summary.py
+
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ArchivedMessage, ChatRoom, Message
+
+PREVIEW_LENGTH = 200
+
+
+def _display_name(user):
+    return user.get_full_name() or user.username
+
+
+def _newer_than_current(timestamp, value, field):
+    """Запиши вредност само ако пораката е понова од тековната последна (паралелни пакети)"""
+    output_field = ChatRoom._meta.get_field(field)
+    if output_field.is_relation:
+        output_field = output_field.target_field
+    return Case(
+        When(Q(last_message_at__isnull=True) | Q(last_message_at__lte=timestamp), then=Value(value)),
+        default=F(field),
+        output_field=output_field,
+    )
+
+
+def apply_new_messages(messages):
+    """Ажурирај ги бројачот и последната порака на собите за новите пораки"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message)
+
+    for room_id, room_messages in by_room.items():
+        last = max(room_messages, key=lambda message: (message.timestamp, message.id))
+        ChatRoom.objects.filter(id=room_id).update(
+            message_count=F('message_count') + len(room_messages),
+            last_message_id=_newer_than_current(last.timestamp, last.id, 'last_message'),
+            last_message_preview=_newer_than_current(
+                last.timestamp, last.content[:PREVIEW_LENGTH], 'last_message_preview'
+            ),
+            last_message_sender=_newer_than_current(
+                last.timestamp, _display_name(last.sender), 'last_message_sender'
+            ),
+            last_message_at=_newer_than_current(last.timestamp, last.timestamp, 'last_message_at'),
+        )
+
+
+def apply_message_change(message):
+    """Изменета или избришана порака - прегледот се менува само ако е последната во собата"""
+    ChatRoom.objects.filter(id=message.room_id, last_message_id=message.id).update(
+        last_message_preview=message.content[:PREVIEW_LENGTH]
+    )
+
+
+def apply_deleted_message(message):
+    """
+    Порака избришана преку ORM (admin, бришење на корисник). Бројачот се намалува;
+    ако била последна, FK веќе е SET_NULL, па прегледот се пресметува одново.
+    """
+    ChatRoom.objects.filter(id=message.room_id).update(message_count=Greatest(F('message_count') - 1, 0))
+    if ChatRoom.objects.filter(id=message.room_id, last_message__isnull=True, last_message_at__isnull=False).exists():
+        rebuild_summaries([message.room_id])
+
+
+def _participant_count_subquery():
+    through = ChatRoom.participants.through
+    return Coalesce(Subquery(
+        through.objects.filter(chatroom_id=OuterRef('pk'))
+        .values('chatroom_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    ), 0)
+
+
+def refresh_participant_counts(room_ids):
+    """Едно UPDATE за бројот на учесници во дадените соби"""
+    if room_ids:
+        ChatRoom.objects.filter(id__in=room_ids).update(participant_count=_participant_count_subquery())
+
+
+def _message_count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(room_id=OuterRef('pk'))
+        .values('room_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    ), 0)
+
+
+def rebuild_summaries(room_ids=None, batch_size=500):
+    """Пресметај ги сите преглед полиња од почеток; враќа број на ажурирани соби"""
+    rooms = ChatRoom.objects.all()
+    if room_ids:
+        rooms = rooms.filter(id__in=room_ids)
+
+    # Бројот ги вклучува и архивираните пораки - тие се дел од историјата на собата
+    message_count = _message_count_subquery(Message) + _message_count_subquery(ArchivedMessage)
+    rooms.update(message_count=message_count, participant_count=_participant_count_subquery())
+
+    latest = Message.objects.filter(room_id=OuterRef('pk')).order_by('-timestamp', '-id').values('id')[:1]
+    updated = 0
+    room_list = list(rooms.annotate(latest_id=Subquery(latest)).order_by('id'))
+
+    for start in range(0, len(room_list), batch_size):
+        chunk = room_list[start:start + batch_size]
+        latest_messages = Message.objects.select_related('sender').in_bulk(
+            [room.latest_id for room in chunk if room.latest_id]
+        )
+        for room in chunk:
+            message = latest_messages.get(room.latest_id)
+            room.last_message = message
+            room.last_message_preview = message.content[:PREVIEW_LENGTH] if message else ''
+            room.last_message_sender = _display_name(message.sender) if message else ''
+            room.last_message_at = message.timestamp if message else None
+        ChatRoom.objects.bulk_update(
+            chunk,
+            ['last_message', 'last_message_preview', 'last_message_sender', 'last_message_at']
+        )
+        updated += len(chunk)
+
+    return updated
@@ -1,3 +1,824 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from courses.models import Category, Course, Enrollment
+
+from . import recent
+from .access import has_room_access
+from .consumers import ChatConsumer
+from .membership import sync_course_rooms
+from .encoding import frame_event
+from .history import fetch_messages
+from .models import ArchivedMessage, ChatRoom, ChatUpload, Message, RoomReadState
+from .persistence import MessageDraft, MessageWriteBehind, delete_message, get_write_behind_config, lifespan
+from .outbound import OUTBOUND_DEFAULTS, SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+from .ratelimit import MemoryTokenBuckets, RateLimiter
+from .resume import read_resume_token
+from .search import search_messages
+from .summary import rebuild_summaries
+from .unread import mark_read
+from .uploads import cleanup_uploads, process_upload, record_chunk, start_upload, write_chunk
+
+User = get_user_model()
+
+# Споделената состојба во меморија - тестовите не зависат од Redis
+LOCAL_CHAT_STATE = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'CHAT_SHARED_STATE': {'BACKEND': 'memory'},
+    'CHAT_RECENT_CACHE': {'ALIAS': None},
+    'CHAT_ACCESS_CACHE': {'SHARED_ALIAS': None},
+}
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('chat.ratelimit.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buckets = MemoryTokenBuckets()
+
+    def advance(self, seconds):
+        self.clock.return_value += seconds
+
+    async def take(self, times=1, rate=2.0, burst=3):
+        return [await self.buckets.take([('bucket', rate, burst)]) for _ in range(times)]
+
+    async def test_burst_then_retry_after(self):
+        self.assertEqual(await self.take(3), [(0, 0)] * 3)
+
+        self.assertEqual(await self.take(), [(1, 0.5)])
+        self.advance(0.2)
+        limited, retry_after = (await self.take())[0]
+        self.assertEqual(limited, 1)
+        self.assertAlmostEqual(retry_after, 0.3)
+
+    async def test_refill_after_retry_after(self):
+        await self.take(4)
+        self.advance(0.5)
+
+        self.assertEqual(await self.take(2), [(0, 0), (1, 0.5)])
+
+    async def test_refill_capped_at_burst(self):
+        await self.take(3)
+        self.advance(100)
+
+        self.assertEqual(await self.take(4), [(0, 0)] * 3 + [(1, 0.5)])
+
+    async def test_rejected_message_does_not_spend_other_buckets(self):
+        limiter = RateLimiter(
+            {'USER_RATE': 1.0, 'USER_BURST': 1, 'ROOM_RATE': 1.0, 'ROOM_BURST': 3},
+            self.buckets
+        )
+        self.assertEqual(await limiter.check_message(1, 10), (None, 0))
+        self.assertEqual(await limiter.check_message(1, 10), ('user', 1.0))
+
+        # Одбиената порака не потроши токен од собата
+        self.assertEqual(await limiter.check_message(2, 10), (None, 0))
+        self.assertEqual(await limiter.check_message(3, 10), (None, 0))
+        self.assertEqual(await limiter.check_message(4, 10), ('room', 1.0))
+
+
+class KeysetPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sender', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.user)
+
+    def create_messages(self, count, archived=0):
+        """count пораки со ист timestamp; првите archived се преместени во ArchivedMessage"""
+        timestamp = timezone.now() - timedelta(days=1)
+        messages = [Message.objects.create(room=self.room, sender=self.user, content=str(index)) for index in range(count)]
+        Message.objects.filter(room=self.room).update(timestamp=timestamp)
+        ArchivedMessage.objects.bulk_create([
+            ArchivedMessage(id=message.id, room=self.room, sender=self.user, content=message.content, timestamp=timestamp)
+            for message in messages[:archived]
+        ])
+        Message.objects.filter(id__in=[message.id for message in messages[:archived]]).delete()
+        return [message.id for message in messages]
+
+    def walk_back(self, limit):
+        pages, before_id = [], None
+        while True:
+            messages, has_more = fetch_messages(self.room.id, before_id=before_id, limit=limit)
+            pages.append([message['id'] for message in messages])
+            if not has_more:
+                return pages
+            before_id = messages[0]['id']
+
+    def walk_forward(self, after_id, limit):
+        pages = []
+        while True:
+            messages, has_more = fetch_messages(self.room.id, after_id=after_id, limit=limit)
+            pages.append([message['id'] for message in messages])
+            if not has_more:
+                return pages
+            after_id = messages[-1]['id']
+
+    def test_same_timestamp_ordered_by_id(self):
+        ids = self.create_messages(5)
+
+        self.assertEqual(self.walk_back(2), [ids[3:5], ids[1:3], ids[0:1]])
+        self.assertEqual(self.walk_forward(ids[0], 2), [ids[1:3], ids[3:5]])
+
+    def test_pages_continue_across_archive(self):
+        ids = self.create_messages(5, archived=2)
+
+        self.assertEqual(self.walk_back(2), [ids[3:5], ids[1:3], ids[0:1]])
+        self.assertEqual(self.walk_forward(ids[0], 2), [ids[1:3], ids[3:5]])
+
+    def test_page_ends_exactly_at_archive_boundary(self):
+        ids = self.create_messages(4, archived=2)
+
+        self.assertEqual(self.walk_back(2), [ids[2:4], ids[0:2]])
+        self.assertEqual(fetch_messages(self.room.id, after_id=ids[1], limit=2)[1], False)
+
+    def test_unknown_cursor_returns_empty_page(self):
+        ids = self.create_messages(2)
+
+        self.assertEqual(fetch_messages(self.room.id, before_id=ids[-1] + 100), ([], False))
+
+
+@override_settings(**LOCAL_CHAT_STATE)
+class MessageSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sender', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.user)
+        cls.room.participants.add(cls.user)
+
+    def search(self, query):
+        results, _ = search_messages(self.user, query)
+        return [result['id'] for result in results]
+
+    def send(self, content):
+        return Message.objects.create(room=self.room, sender=self.user, content=content).id
+
+    def test_case_folded_prefix_match(self):
+        message_id = self.send('Домашната задача е готова')
+
+        self.assertEqual(self.search('ДОМАШ'), [message_id])
+
+    def test_macedonian_letters_not_folded(self):
+        """ќ/ѓ се посебни букви - „ќе“ не е „ке“, „ѓон“ не е „гон“"""
+        future = self.send('ќе дојдам')
+        cake = self.send('ке')
+        self.send('ѓон')
+
+        self.assertEqual(self.search('ќе'), [future])
+        self.assertEqual(self.search('ке'), [cake])
+        self.assertEqual(self.search('гон'), [])
+
+
+class FakeConsumer:
+    """Го брои секој фрејм во outbound.sent како ChatRoomMixin.send"""
+
+    def __init__(self):
+        self.user = SimpleNamespace(id=1)
+        self.outbound = None
+        self.frames = []
+        self.close_code = None
+
+    async def send(self, text_data=None):
+        self.outbound.sent += 1
+        self.frames.append(json.loads(text_data))
+
+    async def close(self, code=None):
+        self.close_code = code
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def message_event(room_id, message_id):
+    return frame_event('chat_message', {
+        'type': 'message',
+        'room_id': room_id,
+        'message': {'id': message_id},
+    }, message_id=message_id)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def make_queue(self, acking=True, **config):
+        consumer = FakeConsumer()
+        consumer.outbound = OutboundQueue(consumer, dict(OUTBOUND_DEFAULTS, **config))
+        if acking:
+            # Првата потврда ги вклучува ACK_WINDOW ограничувањата за конекцијата
+            consumer.outbound.ack(0)
+        return consumer, consumer.outbound
+
+    async def test_sending_stops_at_ack_window(self):
+        consumer, queue = self.make_queue(ACK_WINDOW=4)
+        for message_id in range(1, 11):
+            queue.put(message_event(1, message_id))
+        await settle()
+
+        self.assertEqual(len(consumer.frames), 4)
+        self.assertEqual(len(queue._frames), 6)
+
+        queue.ack(4)
+        await settle()
+
+        self.assertEqual([frame['message']['id'] for frame in consumer.frames], list(range(1, 9)))
+
+    async def test_client_without_acks_receives_everything(self):
+        consumer, queue = self.make_queue(acking=False, ACK_WINDOW=8)
+        for message_id in range(1, 41):
+            queue.put(message_event(1, message_id))
+        await settle()
+
+        self.assertEqual([frame['message']['id'] for frame in consumer.frames], list(range(1, 41)))
+        self.assertFalse(queue.acking)
+
+    async def test_without_ack_window_sends_everything(self):
+        consumer, queue = self.make_queue(ACK_WINDOW=None)
+        for message_id in range(1, 301):
+            queue.put(message_event(1, message_id))
+            await asyncio.sleep(0)
+        await settle()
+
+        self.assertEqual(len(consumer.frames), 300)
+
+    async def test_ephemeral_frames_dropped_while_client_lags(self):
+        consumer, queue = self.make_queue(ACK_WINDOW=1, EPHEMERAL_LIMIT=2)
+        queue.put(message_event(1, 1))
+        await settle()
+        for _ in range(5):
+            queue.put(frame_event('typing_update', {'type': 'typing', 'room_id': 1}))
+
+        self.assertEqual(len(queue._frames), 2)
+
+    async def test_coalesce_replaces_messages_with_resync(self):
+        consumer, queue = self.make_queue(ACK_WINDOW=2, MAX_FRAMES=5, OVERFLOW='coalesce')
+        queue.put(message_event(1, 1))
+        queue.put(message_event(1, 2))
+        await settle()
+        # Клиентот не потврдува - редот се полни и пораките се спојуваат
+        for message_id in range(3, 13):
+            queue.put(message_event(1, message_id))
+            queue.put(message_event(2, 100 + message_id))
+        await settle()
+
+        self.assertEqual([frame['type'] for frame in queue._frames], ['resync', 'resync'])
+
+        queue.ack(2)
+        await settle()
+
+        self.assertEqual(consumer.frames[2:], [
+            {'type': 'resync', 'room_id': 1, 'after_id': 2},
+            {'type': 'resync', 'room_id': 2, 'after_id': None},
+        ])
+        self.assertIsNone(consumer.close_code)
+
+    async def test_disconnect_closes_with_resume_token(self):
+        consumer, queue = self.make_queue(ACK_WINDOW=2, MAX_FRAMES=5, OVERFLOW='disconnect')
+        queue.put(message_event(1, 1))
+        queue.put(message_event(1, 2))
+        await settle()
+        for message_id in range(3, 9):
+            queue.put(message_event(1, message_id))
+        await settle()
+
+        self.assertTrue(queue.closed)
+        self.assertEqual(consumer.close_code, SLOW_CONSUMER_CLOSE_CODE)
+        token = consumer.frames[-1]
+        self.assertEqual(token['type'], 'resume_token')
+        self.assertEqual(read_resume_token(token['token'], 1), {1: 2})
+
+
+class RecentCacheUnavailableTests(SimpleTestCase):
+    def tearDown(self):
+        recent._unavailable_until = 0
+
+    def test_failure_warns_once_and_skips_cache(self):
+        calls = []
+
+        def unreachable(key):
+            calls.append(key)
+            raise ConnectionError('Connection refused')
+
+        with self.assertLogs('chat.recent', 'WARNING') as logs:
+            for _ in range(5):
+                self.assertIsNone(recent._cache_call(unreachable, 'chat:recent:1'))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsNone(logs.records[0].exc_info)
+
+    def test_cache_retried_after_interval(self):
+        def unreachable():
+            raise ConnectionError('Connection refused')
+
+        with self.assertLogs('chat.recent', 'WARNING'):
+            recent._cache_call(unreachable)
+        recent._unavailable_until = 0
+
+        self.assertEqual(recent._cache_call(lambda: 'hit'), 'hit')
+
+
+class UploadCleanupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.user)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def upload(self, filename, data, received=None):
+        upload = start_upload(self.room, self.user, filename, len(data))
+        received = len(data) if received is None else received
+        written = write_chunk(upload, 0, BytesIO(data[:received]), received)
+        record_chunk(upload, 0, written)
+        upload.refresh_from_db()
+        return upload
+
+    def age(self, upload, seconds):
+        ChatUpload.objects.filter(id=upload.id).update(updated_at=timezone.now() - timedelta(seconds=seconds))
+
+    def files_exist(self, upload):
+        return os.path.exists(default_storage.path(f'chat_files/{upload.id}'))
+
+    def test_image_processed_into_message(self):
+        image = BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(image, 'PNG')
+        upload = self.upload('slika.png', image.getvalue())
+
+        message, payload = process_upload(upload.id)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'done')
+        self.assertEqual(upload.message, message)
+        self.assertEqual((payload['attachment']['width'], payload['attachment']['height']), (640, 480))
+        self.assertEqual(cleanup_uploads(), {'expired': 0, 'stuck': 0, 'purged': 0})
+        self.assertTrue(self.files_exist(upload))
+
+    def test_broken_image_marked_failed(self):
+        upload = self.upload('slika.png', b'not an image')
+        self.assertEqual(upload.status, 'processing')
+
+        with self.assertLogs('chat.uploads', 'WARNING'):
+            message, _ = process_upload(upload.id)
+
+        upload.refresh_from_db()
+        self.assertIsNone(message)
+        self.assertEqual(upload.status, 'failed')
+        self.assertFalse(self.files_exist(upload))
+        self.assertFalse(Message.objects.exists())
+
+    def test_abandoned_upload_removed_with_partial_file(self):
+        abandoned = self.upload('doc.pdf', b'x' * 100, received=40)
+        active = self.upload('other.pdf', b'x' * 100, received=40)
+        self.age(abandoned, 25 * 3600)
+
+        self.assertEqual(cleanup_uploads(dry_run=True)['expired'], 1)
+        self.assertEqual(cleanup_uploads()['expired'], 1)
+
+        self.assertFalse(ChatUpload.objects.filter(id=abandoned.id).exists())
+        self.assertFalse(self.files_exist(abandoned))
+        self.assertTrue(self.files_exist(active))
+
+    def test_stuck_processing_failed_then_purged(self):
+        upload = self.upload('doc.pdf', b'x' * 100)
+        self.age(upload, 3600)
+
+        self.assertEqual(cleanup_uploads()['stuck'], 1)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'failed')
+        self.assertFalse(self.files_exist(upload))
+
+        self.age(upload, 8 * 24 * 3600)
+        self.assertEqual(cleanup_uploads()['purged'], 1)
+        self.assertFalse(ChatUpload.objects.filter(id=upload.id).exists())
+
+
+@override_settings(**LOCAL_CHAT_STATE, CHAT_RATE_LIMIT={'USER_RATE': None, 'ROOM_RATE': None})
+class ConsumerTestCase(TestCase):
+    """ChatConsumer преку WebsocketCommunicator; споделената состојба е во меморија"""
+
+    def setUp(self):
+        caches['default'].clear()
+        # Singleton-ите се градат одново со горните поставки
+        for name in ('chat.ratelimit._limiter', 'chat.presence._presence', 'chat.resume._buffer',
+                     'chat.typing_indicators._aggregator', 'chat.persistence._writer'):
+            patcher = mock.patch(name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect(self, user, room):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{room.id}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'room_id': room.id}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_frame(self, communicator, frame_type):
+        """Прв фрејм од типот (присуството и слично се прескокнуваат)"""
+        while True:
+            frame = await communicator.receive_json_from(timeout=2)
+            if frame.get('type') == frame_type:
+                return frame
+
+
+class MessageChangeTests(ConsumerTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create_user(username='sender', password='test')
+        cls.other = User.objects.create_user(username='other', password='test')
+        cls.staff = User.objects.create_user(username='staff', password='test', is_staff=True)
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.sender)
+        cls.room.participants.add(cls.sender, cls.other, cls.staff)
+
+    def setUp(self):
+        super().setUp()
+        self.message = Message.objects.create(room=self.room, sender=self.sender, content='Оригинал')
+
+    async def change(self, user, frame, expected):
+        communicator = await self.connect(user, self.room)
+        await communicator.send_json_to({'message_id': self.message.id, **frame})
+        result = await self.receive_frame(communicator, expected)
+        await communicator.disconnect()
+        await self.message.arefresh_from_db()
+        return result
+
+    async def test_sender_edit_broadcasts_delta(self):
+        listener = await self.connect(self.other, self.room)
+
+        await self.change(self.sender, {'type': 'edit_message', 'message': ' Изменето '}, 'message_edited')
+        frame = await self.receive_frame(listener, 'message_edited')
+        await listener.disconnect()
+
+        self.assertEqual(frame, {
+            'type': 'message_edited',
+            'room_id': self.room.id,
+            'message_id': self.message.id,
+            'content': 'Изменето',
+            'edited_at': self.message.edited_at.isoformat(),
+        })
+        self.assertTrue(self.message.is_edited)
+
+    async def test_only_sender_can_edit(self):
+        for user in (self.other, self.staff):
+            frame = await self.change(user, {'type': 'edit_message', 'message': 'Туѓо'}, 'error')
+            self.assertEqual(frame['code'], 'edit_rejected')
+        self.assertEqual(self.message.content, 'Оригинал')
+
+    async def test_deleted_message_cannot_be_edited(self):
+        await self.change(self.sender, {'type': 'delete_message'}, 'message_deleted')
+
+        frame = await self.change(self.sender, {'type': 'edit_message', 'message': 'Пак'}, 'error')
+
+        self.assertEqual(frame['code'], 'edit_rejected')
+        self.assertEqual(self.message.content, '')
+
+    async def test_system_message_cannot_be_changed(self):
+        await Message.objects.filter(id=self.message.id).aupdate(message_type='system')
+
+        edit = await self.change(self.sender, {'type': 'edit_message', 'message': 'Системско'}, 'error')
+        delete = await self.change(self.staff, {'type': 'delete_message'}, 'error')
+
+        self.assertEqual((edit['code'], delete['code']), ('edit_rejected', 'delete_rejected'))
+        self.assertFalse(self.message.is_deleted)
+
+    async def test_sender_or_staff_can_delete(self):
+        frame = await self.change(self.other, {'type': 'delete_message'}, 'error')
+        self.assertEqual(frame['code'], 'delete_rejected')
+
+        frame = await self.change(self.staff, {'type': 'delete_message'}, 'message_deleted')
+
+        self.assertEqual(frame, {'type': 'message_deleted', 'room_id': self.room.id, 'message_id': self.message.id})
+        self.assertTrue(self.message.is_deleted)
+        self.assertEqual(self.message.content, '')
+
+        other = await Message.objects.acreate(room=self.room, sender=self.sender, content='Втора')
+        self.message = other
+        await self.change(self.sender, {'type': 'delete_message'}, 'message_deleted')
+        self.assertTrue(self.message.is_deleted)
+
+    def test_delete_removes_attachment_files(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(MEDIA_ROOT=media.name):
+            image = BytesIO()
+            Image.new('RGB', (64, 64), 'blue').save(image, 'PNG')
+            upload = start_upload(self.room, self.sender, 'slika.png', len(image.getvalue()))
+            record_chunk(upload, 0, write_chunk(upload, 0, BytesIO(image.getvalue()), len(image.getvalue())))
+            self.message, _ = process_upload(upload.id)
+            path = default_storage.path(self.message.file_attachment.name)
+            self.assertTrue(os.path.exists(path))
+
+            # Синхрон тест: on_commit на конекцијата од оваа нишка, каде тече и consumer-от
+            with self.captureOnCommitCallbacks(execute=True):
+                async_to_sync(self.change)(self.sender, {'type': 'delete_message'}, 'message_deleted')
+
+            self.assertFalse(self.message.file_attachment)
+            self.assertFalse(os.path.exists(os.path.dirname(path)))
+            self.assertFalse(ChatUpload.objects.filter(id=upload.id).exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class WriteBehindShutdownTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sender', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.user)
+
+    async def test_lifespan_shutdown_drains_queue(self):
+        # Долг интервал - без гасењето пакетот не би се запишал во тестот
+        writer = MessageWriteBehind(dict(get_write_behind_config(), FLUSH_INTERVAL_MS=60000, BATCH_SIZE=100))
+        sent = []
+        events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+
+        async def receive():
+            return next(events)
+
+        async def send(event):
+            sent.append(event['type'])
+
+        with mock.patch('chat.persistence._writer', writer):
+            for index in range(3):
+                writer.submit(MessageDraft(self.room.id, self.user, f'Порака {index}'))
+            await asyncio.sleep(0)
+            self.assertEqual(await Message.objects.acount(), 0)
+
+            await lifespan({'type': 'lifespan'}, receive, send)
+
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(await Message.objects.acount(), 3)
+
+
+@override_settings(**LOCAL_CHAT_STATE)
+@override_settings(**LOCAL_CHAT_STATE)
+class RoomSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='test')
+        cls.bob = User.objects.create_user(username='bob', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.alice)
+
+    def summary(self):
+        return ChatRoom.objects.filter(id=self.room.id).values_list(
+            'message_count', 'participant_count', 'last_message_id', 'last_message_preview'
+        ).get()
+
+    def assertNoDrift(self):
+        current = self.summary()
+        rebuild_summaries([self.room.id])
+        self.assertEqual(self.summary(), current)
+
+    def send(self, content):
+        return Message.objects.create(room=self.room, sender=self.alice, content=content)
+
+    def test_created_messages_counted(self):
+        self.send('прва')
+        last = self.send('втора')
+
+        self.assertEqual(self.summary(), (2, 0, last.id, 'втора'))
+        self.assertNoDrift()
+
+    def test_soft_delete_keeps_count(self):
+        self.send('прва')
+        last = self.send('втора')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_message(self.room.id, last.id, self.alice)
+
+        self.assertEqual(self.summary(), (2, 0, last.id, ''))
+        self.assertNoDrift()
+
+    def test_hard_delete_of_last_message(self):
+        first = self.send('прва')
+        last = self.send('втора')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            last.delete()
+
+        self.assertEqual(self.summary(), (1, 0, first.id, 'прва'))
+        self.assertNoDrift()
+
+    def test_hard_delete_of_older_message(self):
+        first = self.send('прва')
+        last = self.send('втора')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+
+        self.assertEqual(self.summary(), (1, 0, last.id, 'втора'))
+        self.assertNoDrift()
+
+    def test_participant_count_follows_membership(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.participants.add(self.alice, self.bob)
+        self.assertEqual(self.summary()[1], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.participants.remove(self.bob)
+        self.assertEqual(self.summary()[1], 1)
+        self.assertNoDrift()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.chat_rooms.clear()
+        self.assertEqual(self.summary()[1], 0)
+        self.assertNoDrift()
+
+
+class UnreadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='test')
+        cls.bob = User.objects.create_user(username='bob', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.alice)
+        cls.room.participants.add(cls.alice, cls.bob)
+
+    def send(self, user, count=1):
+        return [Message.objects.create(room=self.room, sender=user, content='-').id for _ in range(count)]
+
+    def state(self, user):
+        return RoomReadState.objects.filter(room=self.room, user=user).values_list(
+            'last_read_message_id', 'unread_count'
+        ).get()
+
+    def test_new_messages_unread_for_others_only(self):
+        ids = self.send(self.alice, 3)
+
+        self.assertEqual(self.state(self.bob), (0, 3))
+        self.assertEqual(self.state(self.alice), (ids[-1], 0))
+
+    def test_read_decrements_by_range(self):
+        ids = self.send(self.alice, 5)
+
+        self.assertTrue(mark_read(self.bob.id, self.room.id, ids[1]))
+        self.assertEqual(self.state(self.bob), (ids[1], 3))
+        mark_read(self.bob.id, self.room.id, ids[3])
+        self.assertEqual(self.state(self.bob), (ids[3], 1))
+
+    def test_own_messages_not_counted(self):
+        first, second = self.send(self.alice, 2)
+        own = self.send(self.bob)[0]
+        later = self.send(self.alice, 2)
+
+        # Сопствената порака го помести курсорот - претходните се прочитани
+        self.assertEqual(self.state(self.bob), (own, 2))
+
+        mark_read(self.bob.id, self.room.id, later[0])
+        self.assertEqual(self.state(self.bob), (later[0], 1))
+
+    def test_overlapping_tabs(self):
+        ids = self.send(self.alice, 6)
+
+        # Двата таба почнуваат од ист курсор; вториот го брои само својот нов опсег
+        mark_read(self.bob.id, self.room.id, ids[2])
+        mark_read(self.bob.id, self.room.id, ids[4])
+        mark_read(self.bob.id, self.room.id, ids[3])
+
+        self.assertEqual(self.state(self.bob), (ids[4], 1))
+
+    def test_cursor_never_moves_backwards(self):
+        ids = self.send(self.alice, 4)
+        mark_read(self.bob.id, self.room.id, ids[2])
+
+        self.assertTrue(mark_read(self.bob.id, self.room.id, ids[0]))
+
+        self.assertEqual(self.state(self.bob), (ids[2], 1))
+
+    def test_missing_state_counted_from_scratch(self):
+        ids = self.send(self.alice, 4)
+        RoomReadState.objects.filter(user=self.bob).delete()
+
+        mark_read(self.bob.id, self.room.id, ids[1])
+
+        self.assertEqual(self.state(self.bob), (ids[1], 2))
+
+    def test_message_from_other_room_ignored(self):
+        other = ChatRoom.objects.create(name='Друга', room_type='group', created_by=self.alice)
+        message = Message.objects.create(room=other, sender=self.alice, content='-')
+        self.send(self.alice, 2)
+
+        self.assertFalse(mark_read(self.bob.id, self.room.id, message.id))
+        self.assertEqual(self.state(self.bob), (0, 2))
+
+
+@override_settings(**LOCAL_CHAT_STATE)
+class RoomAccessCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='test')
+        cls.user = User.objects.create_user(username='member', password='test')
+        cls.room = ChatRoom.objects.create(name='Соба', room_type='group', created_by=cls.owner)
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_access_granted_after_add_commits(self):
+        self.assertFalse(has_room_access(self.room.id, self.user.id))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.room.participants.add(self.user)
+            # Пред commit кешираната одлука сè уште важи
+            self.assertFalse(has_room_access(self.room.id, self.user.id))
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(has_room_access(self.room.id, self.user.id))
+
+    def test_access_revoked_after_remove_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.participants.add(self.user)
+        self.assertTrue(has_room_access(self.room.id, self.user.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.participants.remove(self.user)
+
+        self.assertFalse(has_room_access(self.room.id, self.user.id))
+
+    def test_access_revoked_after_clear_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.participants.add(self.user)
+        self.assertTrue(has_room_access(self.room.id, self.user.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.chat_rooms.clear()
+
+        self.assertFalse(has_room_access(self.room.id, self.user.id))
+
+
+@override_settings(**LOCAL_CHAT_STATE)
+class CourseRoomMembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(username='instructor', password='test', user_type='instructor')
+        cls.student = User.objects.create_user(username='student', password='test')
+        cls.guest_instructor = User.objects.create_user(username='guest', password='test', user_type='instructor')
+        cls.staff = User.objects.create_user(username='staff', password='test', is_staff=True)
+        cls.course = Course.objects.create(
+            title='Course', slug='course', description='-', instructor=cls.instructor,
+            category=Category.objects.create(name='Категорија'), difficulty='beginner',
+            what_you_learn='-', status='published'
+        )
+        cls.room = cls.course.chat_room
+
+    def members(self):
+        return set(self.room.participants.values_list('id', flat=True))
+
+    def enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Enrollment.objects.create(student=self.student, course=self.course)
+
+    def test_enrolling_adds_student(self):
+        self.enroll()
+
+        self.assertEqual(self.members(), {self.instructor.id, self.student.id})
+
+    def test_deactivating_enrollment_removes_student(self):
+        enrollment = self.enroll()
+
+        enrollment.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.save(update_fields=['is_active'])
+
+        self.assertEqual(self.members(), {self.instructor.id})
+
+    def test_deleting_enrollment_removes_student(self):
+        enrollment = self.enroll()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.delete()
+
+        self.assertEqual(self.members(), {self.instructor.id})
+
+    def test_progress_save_does_not_sync(self):
+        enrollment = self.enroll()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            enrollment.save(update_fields=['progress_percentage'])
+
+        self.assertEqual(callbacks, [])
+
+    def test_manually_added_instructors_and_staff_stay(self):
+        self.enroll()
+        self.room.participants.add(self.guest_instructor, self.staff)
+        Enrollment.objects.filter(student=self.student).update(is_active=False)
+
+        self.assertEqual(sync_course_rooms([self.course.id]), (0, 1))
+        self.assertEqual(self.members(), {self.instructor.id, self.guest_instructor.id, self.staff.id})
@@ -0,0 +1,129 @@
+# chat/typing_indicators.py
+
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import metrics
+from .encoding import frame_event
+
+TYPING_DEFAULTS = {
+    'TICK_MS': 500,
+    'EXPIRY_MS': 5000,
+}
+
+
+def get_typing_config():
+    config = dict(TYPING_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_TYPING', {}))
+    return config
+
+
+class TypingAggregator:
+    """
+    Per-process состојба за "кој пишува". Фрејмовите само ја менуваат состојбата;
+    на секој tick се праќа една порака по соба со промените (started/stopped).
+    Состојбата е по конекција: корисникот пишува додека пишува барем еден негов таб.
+    """
+
+    def __init__(self, config):
+        self.tick = config['TICK_MS'] / 1000
+        self.expiry = config['EXPIRY_MS'] / 1000
+        self._typing = {}      # room_id -> {user_id: {channel_name: (username, expires_at)}}
+        self._broadcast = {}   # room_id -> {user_id: username} последно објавено
+        self._task = None
+        self._loop = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    def update(self, room_id, user_id, username, is_typing, channel_name):
+        loop = asyncio.get_running_loop()
+        metrics.incr('typing.frames')
+        room = self._typing.setdefault(room_id, {})
+        was_typing = bool(room.get(user_id))
+
+        connections = room.setdefault(user_id, {})
+        if is_typing:
+            connections[channel_name] = (username, loop.time() + self.expiry)
+        else:
+            connections.pop(channel_name, None)
+        if not connections:
+            del room[user_id]
+
+        if was_typing == (user_id in room):
+            # Освежување или друг таб - објавената состојба не се менува
+            metrics.incr('typing.suppressed')
+
+        self._ensure_running()
+
+    def stop(self, room_id, user_id, channel_name):
+        """Конекцијата ја напушта собата; stopped само ако тоа била последната што пишува"""
+        connections = self._typing.get(room_id, {}).get(user_id)
+        if connections and connections.pop(channel_name, None):
+            if not connections:
+                del self._typing[room_id][user_id]
+            self._ensure_running()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._typing or self._broadcast:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            for room_id in list(set(self._typing) | set(self._broadcast)):
+                room = self._typing.get(room_id, {})
+                for user_id, connections in list(room.items()):
+                    for channel_name, (_, expires_at) in list(connections.items()):
+                        if expires_at <= now:
+                            del connections[channel_name]
+                            metrics.incr('typing.expired')
+                    if not connections:
+                        del room[user_id]
+                await self._publish(room_id, room)
+
+    async def _publish(self, room_id, room):
+        current = {
+            user_id: next(iter(connections.values()))[0]
+            for user_id, connections in room.items()
+        }
+        previous = self._broadcast.get(room_id, {})
+
+        started = [
+            {'user_id': user_id, 'username': username}
+            for user_id, username in current.items() if user_id not in previous
+        ]
+        stopped = [
+            {'user_id': user_id, 'username': username}
+            for user_id, username in previous.items() if user_id not in current
+        ]
+
+        if current:
+            self._broadcast[room_id] = current
+        else:
+            self._broadcast.pop(room_id, None)
+            self._typing.pop(room_id, None)
+
+        if not started and not stopped:
+            return
+
+        metrics.incr('typing.broadcasts')
+        await get_channel_layer().group_send(f'chat_{room_id}', frame_event('typing_update', {
+            'type': 'typing',
+            'room_id': room_id,
+            'started': started,
+            'stopped': stopped,
+        }))
+
+
+_aggregator = None
+
+
+def get_typing_aggregator():
+    global _aggregator
+    if _aggregator is None:
+        _aggregator = TypingAggregator(get_typing_config())
+    return _aggregator
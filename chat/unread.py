@@ -0,0 +1,109 @@
+# chat/unread.py
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import ChatRoom, Message, RoomReadState
+
+
+def ensure_read_states(room_ids, user_ids):
+    """Креирај курсори за нови учесници; историјата пред приклучувањето не се брои"""
+    last_ids = dict(ChatRoom.objects.filter(id__in=room_ids).values_list('id', 'last_message_id'))
+    RoomReadState.objects.bulk_create(
+        [
+            RoomReadState(
+                room_id=room_id,
+                user_id=user_id,
+                last_read_message_id=last_ids.get(room_id) or 0
+            )
+            for room_id in last_ids
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True
+    )
+
+
+def remove_read_states(room_ids, user_ids):
+    RoomReadState.objects.filter(room_id__in=room_ids, user_id__in=user_ids).delete()
+
+
+def apply_new_messages(messages):
+    """Зголеми го бројот непрочитани за другите учесници; испраќачот ги има прочитано сите до својата"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message)
+
+    for room_id, room_messages in by_room.items():
+        room_messages.sort(key=lambda message: message.id)
+        sender_ids = {message.sender_id for message in room_messages}
+
+        RoomReadState.objects.filter(room_id=room_id).exclude(user_id__in=sender_ids).update(
+            unread_count=F('unread_count') + len(room_messages)
+        )
+
+        for sender_id in sender_ids:
+            own_last = max(message.id for message in room_messages if message.sender_id == sender_id)
+            unread_after = sum(
+                1 for message in room_messages
+                if message.id > own_last and message.sender_id != sender_id
+            )
+            RoomReadState.objects.filter(
+                room_id=room_id,
+                user_id=sender_id,
+                last_read_message_id__lt=own_last
+            ).update(last_read_message_id=own_last, unread_count=unread_after)
+
+
+def mark_read(user_id, room_id, message_id):
+    """
+    Помести го курсорот до message_id (само нанапред). Бројачот се намалува за
+    пораките помеѓу стариот и новиот курсор - опсег по (room, id), не целата опашка
+    на собата. Курсорот е по id (редослед на запишување), како и apply_new_messages;
+    timestamp-от во историјата може да отстапи само во рамки на еден write-behind пакет.
+    """
+    if not Message.objects.filter(id=message_id, room_id=room_id).exists():
+        return False
+
+    states = RoomReadState.objects.filter(room_id=room_id, user_id=user_id)
+    for _ in range(3):
+        last_read = states.values_list('last_read_message_id', flat=True).first()
+        if last_read is None:
+            break
+        if last_read >= message_id:
+            return True
+        newly_read = Message.objects.filter(
+            room_id=room_id,
+            id__gt=last_read,
+            id__lte=message_id
+        ).exclude(sender_id=user_id).count()
+        # Условно на стариот курсор - паралелно читање од друг таб повторува
+        if states.filter(last_read_message_id=last_read).update(
+            last_read_message_id=message_id,
+            unread_count=Greatest(F('unread_count') - newly_read, 0)
+        ):
+            return True
+
+    # Нема курсор (или постојана трка) - целосно пребројување, како за нов учесник
+    unread = Message.objects.filter(room_id=room_id, id__gt=message_id).exclude(sender_id=user_id).count()
+    updated = states.filter(last_read_message_id__lt=message_id).update(
+        last_read_message_id=message_id,
+        unread_count=unread
+    )
+    if not updated:
+        # Курсорот е веќе понапред или е креиран паралелно - ignore_conflicts го покрива
+        RoomReadState.objects.bulk_create([
+            RoomReadState(
+                room_id=room_id,
+                user_id=user_id,
+                last_read_message_id=message_id,
+                unread_count=unread
+            )
+        ], ignore_conflicts=True)
+    return True
+
+
+def unread_counts(user):
+    """Број непрочитани пораки за сите соби на корисникот со едно барање"""
+    return dict(
+        RoomReadState.objects.filter(user=user, room__is_active=True).values_list('room_id', 'unread_count')
+    )
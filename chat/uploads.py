@@ -0,0 +1,289 @@
+# chat/uploads.py
+
+import asyncio
+import logging
+import os
+import shutil
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from PIL import Image, ImageOps
+
+from . import metrics
+from .encoding import frame_event
+from .models import ChatUpload
+from .persistence import MessageDraft, write_messages
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DEFAULTS = {
+    'MAX_SIZE': 25 * 1024 * 1024,
+    'CHUNK_SIZE': 1024 * 1024,
+    'ALLOWED_EXTENSIONS': [
+        'jpg', 'jpeg', 'png', 'gif', 'webp',
+        'pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'txt', 'zip',
+    ],
+    'THUMBNAIL_SIZE': (320, 320),
+    'WORKERS': 2,
+    # cleanup_chat_uploads: прикачување без нов дел, заглавена обработка и
+    # колку долго се чуваат записите за неуспешните
+    'UPLOAD_TIMEOUT_S': 24 * 3600,
+    'PROCESSING_TIMEOUT_S': 30 * 60,
+    'FAILED_RETENTION_S': 7 * 24 * 3600,
+}
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+
+# Чита од телото на барањето во помали парчиња - ниту еден дел не е цел во меморија
+READ_BLOCK_SIZE = 64 * 1024
+
+_executor = None
+_tasks = set()
+
+
+def get_upload_config():
+    config = dict(UPLOAD_DEFAULTS)
+    config.update(getattr(settings, 'CHAT_UPLOADS', {}))
+    return config
+
+
+def _extension(filename):
+    return os.path.splitext(filename)[1].lstrip('.').lower()
+
+
+def start_upload(room, user, filename, total_size, content_type='', caption=''):
+    """Нова сесија за прикачување по проверка на големината и типот"""
+    config = get_upload_config()
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename:
+        raise ValidationError('Недостасува име на фајлот.')
+    if _extension(filename) not in config['ALLOWED_EXTENSIONS']:
+        raise ValidationError('Овој тип на фајл не е дозволен.')
+    if total_size <= 0 or total_size > config['MAX_SIZE']:
+        raise ValidationError(f'Фајлот мора да биде помал од {config["MAX_SIZE"] // (1024 * 1024)} MB.')
+
+    upload = ChatUpload(
+        room=room,
+        uploader=user,
+        filename=filename,
+        content_type=content_type[:100],
+        caption=caption,
+        total_size=total_size,
+    )
+    upload.file.name = f'chat_files/{upload.id}/{filename}'
+    upload.save()
+    metrics.incr('uploads.started')
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Запиши го делот директно во MEDIA_ROOT на позиција offset. Повторено праќање на
+    истиот дел е безбедно; дел по празнина се одбива. Враќа број на запишани бајти.
+    """
+    if upload.status != 'uploading':
+        raise ValidationError('Прикачувањето е завршено.')
+    if offset > upload.received_size:
+        raise ValidationError('Недостасува претходен дел.')
+    if length > get_upload_config()['CHUNK_SIZE'] or offset + length > upload.total_size:
+        raise ValidationError('Делот е преголем.')
+
+    path = default_storage.path(upload.file.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as destination:
+        destination.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not data:
+                break
+            destination.write(data)
+            written += len(data)
+    return written
+
+
+def record_chunk(upload, offset, written):
+    """Помести го бројачот на примени бајти; True кога е примен целиот фајл"""
+    received = offset + written
+    # updated_at е последната активност - по неа cleanup_uploads ги наоѓа напуштените
+    ChatUpload.objects.filter(id=upload.id, received_size__lt=received).update(
+        received_size=received,
+        updated_at=timezone.now()
+    )
+    upload.received_size = max(upload.received_size, received)
+    if upload.received_size < upload.total_size:
+        return False
+    # Само едно барање го префрла во обработка
+    return bool(ChatUpload.objects.filter(id=upload.id, status='uploading').update(status='processing'))
+
+
+def _inspect(upload):
+    """Метаподатоци за прилогот; за слики проверка со Pillow и thumbnail"""
+    config = get_upload_config()
+    meta = {
+        'name': upload.filename,
+        'size': upload.total_size,
+        'content_type': upload.content_type,
+        'url': default_storage.url(upload.file.name),
+    }
+    if _extension(upload.filename) not in IMAGE_EXTENSIONS:
+        return 'file', meta
+
+    path = default_storage.path(upload.file.name)
+    with Image.open(path) as image:
+        image.verify()
+    with Image.open(path) as image:
+        meta['width'], meta['height'] = image.size
+        thumbnail = ImageOps.exif_transpose(image)
+        thumbnail.thumbnail(tuple(config['THUMBNAIL_SIZE']))
+        if thumbnail.mode not in ('RGB', 'L'):
+            thumbnail = thumbnail.convert('RGB')
+        thumbnail_name = f'chat_files/{upload.id}/thumb.jpg'
+        thumbnail.save(default_storage.path(thumbnail_name), 'JPEG', quality=85)
+    meta['thumbnail_url'] = default_storage.url(thumbnail_name)
+    return 'image', meta
+
+
+def _delete_files(upload_id):
+    """Делумниот фајл и thumbnail-от; пораката на завршено прикачување ги користи, па не за 'done'"""
+    shutil.rmtree(default_storage.path(f'chat_files/{upload_id}'), ignore_errors=True)
+
+
+def remove_message_files(message_id, file_name=None):
+    """
+    Фајловите на избришана порака: директориумот на прикачувањето (со thumbnail),
+    редот ChatUpload и file_attachment надвор од прикачувањата во делови
+    """
+    upload_ids = list(ChatUpload.objects.filter(message_id=message_id).values_list('id', flat=True))
+    for upload_id in upload_ids:
+        _delete_files(upload_id)
+    ChatUpload.objects.filter(id__in=upload_ids).delete()
+    if file_name and default_storage.exists(file_name):
+        default_storage.delete(file_name)
+
+
+def fail_upload(upload_id, error='Фајлот не може да се обработи.'):
+    """'processing' -> 'failed' и бришење на фајловите; False ако прикачувањето е во друг статус"""
+    failed = ChatUpload.objects.filter(id=upload_id, status='processing').update(
+        status='failed',
+        error=error,
+        updated_at=timezone.now()
+    )
+    if failed:
+        _delete_files(upload_id)
+        metrics.incr('uploads.failed')
+    return bool(failed)
+
+
+def process_upload(upload_id):
+    """Во thread pool-от: провери го фајлот, направи thumbnail и креирај ја пораката"""
+    close_old_connections()
+    try:
+        upload = ChatUpload.objects.select_related('uploader').get(id=upload_id)
+        message_type, meta = _inspect(upload)
+        draft = MessageDraft(
+            upload.room_id,
+            upload.uploader,
+            upload.caption or upload.filename,
+            message_type=message_type,
+            file_attachment=upload.file.name,
+            attachment=meta,
+        )
+        # Пораката и 'done' заедно - инаку cleanup би ги избришал фајловите на објавена порака
+        with transaction.atomic():
+            message = write_messages([draft])[0]
+            upload.status = 'done'
+            upload.message = message
+            upload.save(update_fields=['status', 'message', 'updated_at'])
+    except Exception:
+        # Pillow/thumbnail или база - прикачувањето не смее да остане во 'processing'
+        logger.warning('Обработката на прикачениот фајл %s не успеа', upload_id, exc_info=True)
+        fail_upload(upload_id)
+        close_old_connections()
+        return None, None
+
+    metrics.incr('uploads.processed')
+    close_old_connections()
+    return message, draft.as_payload(message.id)
+
+
+def cleanup_uploads(dry_run=False):
+    """
+    Напуштени прикачувања (UPLOAD_TIMEOUT_S без нов дел) се бришат заедно со делумниот
+    фајл; заглавените во 'processing' (на пр. рестарт на процесот) стануваат 'failed';
+    записите за неуспешните се бришат по FAILED_RETENTION_S. Враќа број по категорија.
+    """
+    config = get_upload_config()
+    now = timezone.now()
+    expired = ChatUpload.objects.filter(
+        status='uploading',
+        updated_at__lt=now - timedelta(seconds=config['UPLOAD_TIMEOUT_S'])
+    )
+    stuck = ChatUpload.objects.filter(
+        status='processing',
+        updated_at__lt=now - timedelta(seconds=config['PROCESSING_TIMEOUT_S'])
+    )
+    purged = ChatUpload.objects.filter(
+        status='failed',
+        updated_at__lt=now - timedelta(seconds=config['FAILED_RETENTION_S'])
+    )
+    if dry_run:
+        return {'expired': expired.count(), 'stuck': stuck.count(), 'purged': purged.count()}
+
+    results = {'expired': 0, 'stuck': 0, 'purged': 0}
+    for upload_id in list(expired.values_list('id', flat=True)):
+        # Повторно со истиот филтер - дел што пристигнал во меѓувреме го задржува прикачувањето
+        if expired.filter(id=upload_id).delete()[0]:
+            _delete_files(upload_id)
+            results['expired'] += 1
+    for upload_id in list(stuck.values_list('id', flat=True)):
+        if fail_upload(upload_id, 'Обработката не заврши.'):
+            results['stuck'] += 1
+    for upload_id in list(purged.values_list('id', flat=True)):
+        if purged.filter(id=upload_id).delete()[0]:
+            _delete_files(upload_id)
+            results['purged'] += 1
+    return results
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=get_upload_config()['WORKERS'],
+            thread_name_prefix='chat-upload'
+        )
+    return _executor
+
+
+async def _process_and_broadcast(upload_id):
+    loop = asyncio.get_running_loop()
+    try:
+        message, payload = await loop.run_in_executor(get_executor(), process_upload, upload_id)
+    except RuntimeError:
+        # Pool-от е угаснат (гасење на процесот)
+        logger.warning('Прикачениот фајл %s не е обработен', upload_id, exc_info=True)
+        await sync_to_async(fail_upload)(upload_id, 'Обработката не заврши.')
+        return
+    if message is None:
+        return
+    await get_channel_layer().group_send(f'chat_{message.room_id}', frame_event('chat_message', {
+        'type': 'message',
+        'room_id': message.room_id,
+        'message': payload,
+    }, message_id=message.id))
+
+
+def schedule_processing(upload_id):
+    """Обработката тече во pool-от; пораката се објавува дури кога е готова"""
+    task = asyncio.ensure_future(_process_and_broadcast(upload_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -7,6 +7,11 @@ urlpatterns = [
     path('', views.ChatListView.as_view(), name='list'),
     path('room/<int:room_id>/', views.ChatRoomView.as_view(), name='room'),
     path('room/<int:room_id>/messages/', views.MessageListView.as_view(), name='messages'),
+    path('room/<int:room_id>/online/', views.RoomOnlineUsersView.as_view(), name='online_users'),
+    path('room/<int:room_id>/uploads/', views.UploadStartView.as_view(), name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.UploadChunkView.as_view(), name='upload'),
+    path('search/', views.MessageSearchView.as_view(), name='search'),
     path('create-room/', views.CreateChatRoomView.as_view(), name='create_room'),
     path('join-room/<int:room_id>/', views.JoinChatRoomView.as_view(), name='join_room'),
+    path('metrics/', views.ChatMetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
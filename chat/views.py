@@ -1,12 +1,25 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, View
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
 from django.urls import reverse_lazy
 from django.db.models import Q, Count
-from .models import ChatRoom, Message, UserChatSettings
+from . import metrics
+from .access import authorize_room, has_room_access
+from .history import fetch_messages, message_to_json
+from .membership import sync_course_rooms
+from .presence import get_presence
+from .recent import recent_messages
+from .search import get_search_backend, search_messages
+from .uploads import get_upload_config, record_chunk, schedule_processing, start_upload, write_chunk
+from .unread import unread_counts
+from .models import ChatRoom, ChatUpload, Message, UserChatSettings
 from .forms import ChatRoomForm, MessageForm
 from courses.models import Course
 
@@ -21,9 +34,7 @@ class ChatListView(LoginRequiredMixin, ListView):
         return ChatRoom.objects.filter(
             participants=user,
             is_active=True
-        ).annotate(
-            message_count=Count('messages')
-        ).order_by('-created_at')
+        ).select_related('course').order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -33,6 +44,11 @@ class ChatListView(LoginRequiredMixin, ListView):
         chat_settings, created = UserChatSettings.objects.get_or_create(user=user)
         context['chat_settings'] = chat_settings
 
+        counts = unread_counts(user)
+        for room in context['chat_rooms']:
+            room.unread_count = counts.get(room.id, 0)
+        context['total_unread'] = sum(counts.values())
+
 
         if user.user_type == 'instructor':
             context['available_courses'] = Course.objects.filter(
@@ -54,20 +70,8 @@ class ChatRoomView(LoginRequiredMixin, DetailView):
     def get_object(self):
         room = get_object_or_404(ChatRoom, id=self.kwargs['room_id'])
 
-
-        if not room.participants.filter(id=self.request.user.id).exists():
-
-            if room.room_type == 'course' and room.course:
-                if (self.request.user == room.course.instructor or
-                        room.course.enrollments.filter(
-                            student=self.request.user,
-                            is_active=True
-                        ).exists()):
-                    room.participants.add(self.request.user)
-                else:
-                    raise PermissionError("Немате пристап до оваа чет соба.")
-            else:
-                raise PermissionError("Немате пристап до оваа чет соба.")
+        if not authorize_room(room, self.request.user):
+            raise PermissionError("Немате пристап до оваа чет соба.")
 
         return room
 
@@ -76,12 +80,13 @@ class ChatRoomView(LoginRequiredMixin, DetailView):
         room = self.object
 
 
-        context['messages'] = Message.objects.filter(
-            room=room
-        ).select_related('sender').order_by('-timestamp')[:50][::-1]
+        context['messages'], context['has_more_messages'] = recent_messages(
+            room.id, room.last_message_id, room.message_count, limit=50
+        )
 
 
         context['participants'] = room.participants.all()
+        context['online_user_ids'] = set(get_presence().online_users(room.id))
 
 
         context['message_form'] = MessageForm()
@@ -96,33 +101,74 @@ class MessageListView(LoginRequiredMixin, View):
     """API за земање на пораки (за AJAX)"""
 
     def get(self, request, room_id):
-        room = get_object_or_404(ChatRoom, id=room_id)
-
+        if not has_room_access(room_id, request.user.id):
+            return JsonResponse({'error': 'Немате пристап'}, status=403)
 
-        if not room.participants.filter(id=request.user.id).exists():
+        try:
+            before_id = int(request.GET.get('before_id', 0)) or None
+            after_id = int(request.GET.get('after_id', 0)) or None
+            limit = int(request.GET.get('limit', 20))
+        except ValueError:
+            return JsonResponse({'error': 'Невалиден курсор'}, status=400)
+
+        if before_id or after_id:
+            messages, has_more = fetch_messages(room_id, before_id=before_id, after_id=after_id, limit=limit)
+        else:
+            # Прва страница - најновите пораки од кешот, проверени според прегледот на собата
+            last_message_id, message_count = ChatRoom.objects.filter(id=room_id).values_list(
+                'last_message_id', 'message_count'
+            ).first() or (None, 0)
+            messages, has_more = recent_messages(room_id, last_message_id, message_count, limit=limit)
+
+        return JsonResponse({
+            'messages': [message_to_json(message, request.user.id) for message in messages],
+            'has_more': has_more,
+            'before_id': messages[0]['id'] if messages else before_id,
+            'after_id': messages[-1]['id'] if messages else after_id,
+        })
+
+
+class MessageSearchView(LoginRequiredMixin, View):
+    """API за пребарување пораки во собите на корисникот (?q=, room_id=, before_id=)"""
+
+    def get(self, request):
+        if get_search_backend() is None:
+            return JsonResponse({'error': 'Пребарувањето не е достапно'}, status=503)
+
+        try:
+            room_id = int(request.GET.get('room_id', 0)) or None
+            before_id = int(request.GET.get('before_id', 0)) or None
+            limit = int(request.GET.get('limit', 0)) or None
+        except ValueError:
+            return JsonResponse({'error': 'Невалиден курсор'}, status=400)
+
+        if room_id and not has_room_access(room_id, request.user.id):
             return JsonResponse({'error': 'Немате пристап'}, status=403)
 
-        page = int(request.GET.get('page', 1))
-        limit = 20
-        offset = (page - 1) * limit
+        results, next_cursor = search_messages(
+            request.user,
+            request.GET.get('q', ''),
+            room_id=room_id,
+            before_id=before_id,
+            limit=limit
+        )
+        return JsonResponse({
+            'results': results,
+            'next_cursor': next_cursor,
+        })
+
 
-        messages = Message.objects.filter(
-            room=room
-        ).select_related('sender').order_by('-timestamp')[offset:offset + limit]
+class RoomOnlineUsersView(LoginRequiredMixin, View):
+    """API за корисниците што моментално се онлајн во собата"""
 
-        messages_data = []
-        for message in reversed(messages):
-            messages_data.append({
-                'id': message.id,
-                'content': message.content,
-                'sender': message.sender.username,
-                'sender_name': message.sender.get_full_name() or message.sender.username,
-                'timestamp': message.timestamp.isoformat(),
-                'message_type': message.message_type,
-                'is_own': message.sender == request.user
-            })
+    def get(self, request, room_id):
+        if not has_room_access(room_id, request.user.id):
+            return JsonResponse({'error': 'Немате пристап'}, status=403)
 
-        return JsonResponse({'messages': messages_data})
+        online = get_presence().online_users(room_id)
+        return JsonResponse({
+            'online': [{'user_id': user_id, 'username': username} for user_id, username in online.items()]
+        })
 
 
 class CreateChatRoomView(LoginRequiredMixin, CreateView):
@@ -141,22 +187,11 @@ class CreateChatRoomView(LoginRequiredMixin, CreateView):
         response = super().form_valid(form)
 
 
+        # Избраните учесници ги постави form.save_m2m
         self.object.participants.add(self.request.user)
 
-
-        selected_participants = form.cleaned_data.get('participants')
-        if selected_participants:
-            self.object.participants.add(*selected_participants)
-
-
         if self.object.room_type == 'course' and self.object.course:
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            enrolled_students = User.objects.filter(
-                enrollments__course=self.object.course,
-                enrollments__is_active=True
-            )
-            self.object.participants.add(*enrolled_students)
+            sync_course_rooms([self.object.course_id])
 
         messages.success(
             self.request,
@@ -190,4 +225,93 @@ class JoinChatRoomView(LoginRequiredMixin, View):
         room.participants.add(request.user)
         messages.success(request, f'Успешно се приклучивте во "{room.name}"!')
 
-        return redirect('chat:room', room_id=room.id)
\ No newline at end of file
+        return redirect('chat:room', room_id=room.id)
+
+
+def _upload_json(upload):
+    return {
+        'upload_id': str(upload.id),
+        'status': upload.status,
+        'received_size': upload.received_size,
+        'total_size': upload.total_size,
+        'error': upload.error,
+        'message_id': upload.message_id,
+    }
+
+
+class UploadStartView(LoginRequiredMixin, View):
+    """Започни прикачување на фајл во собата; деловите се праќаат на UploadChunkView"""
+
+    def post(self, request, room_id):
+        if not has_room_access(room_id, request.user.id):
+            return JsonResponse({'error': 'Немате пристап'}, status=403)
+
+        try:
+            total_size = int(request.POST.get('size', 0))
+            upload = start_upload(
+                get_object_or_404(ChatRoom, id=room_id),
+                request.user,
+                request.POST.get('filename', ''),
+                total_size,
+                content_type=request.POST.get('content_type', ''),
+                caption=request.POST.get('caption', '').strip(),
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Невалидна големина'}, status=400)
+        except ValidationError as exc:
+            return JsonResponse({'error': exc.messages[0]}, status=400)
+
+        data = _upload_json(upload)
+        data['chunk_size'] = get_upload_config()['CHUNK_SIZE']
+        return JsonResponse(data, status=201)
+
+
+class UploadChunkView(View):
+    """
+    PUT ?offset=N - дел од фајлот, се запишува директно на диск надвор од event loop-от.
+    GET - статус. Асинхрон view за големите фајлови да не ја држат sync нишката.
+    """
+
+    async def get(self, request, upload_id):
+        upload = await self._get_upload(request, upload_id)
+        if upload is None:
+            return JsonResponse({'error': 'Не е пронајдено'}, status=404)
+        return JsonResponse(_upload_json(upload))
+
+    async def put(self, request, upload_id):
+        upload = await self._get_upload(request, upload_id)
+        if upload is None:
+            return JsonResponse({'error': 'Не е пронајдено'}, status=404)
+
+        try:
+            offset = int(request.GET.get('offset', 0))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Невалиден offset'}, status=400)
+
+        try:
+            written = await asyncio.to_thread(write_chunk, upload, offset, request, length)
+        except ValidationError as exc:
+            return JsonResponse({'error': exc.messages[0]}, status=400)
+
+        if await sync_to_async(record_chunk)(upload, offset, written):
+            upload.status = 'processing'
+            schedule_processing(upload.id)
+        return JsonResponse(_upload_json(upload))
+
+    @staticmethod
+    async def _get_upload(request, upload_id):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return None
+        return await ChatUpload.objects.filter(id=upload_id, uploader=user).afirst()
+
+
+class ChatMetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Бројачи на чет подсистемот за овој процес (само за staff)"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(metrics.snapshot())
@@ -0,0 +1,106 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from courses.models import Category, Course, Enrollment, Lesson, LessonProgress
+from courses.progress import recompute_course_progress, refresh_course_progress
+from online_course_platform.benchmarking import QueryCounter, Timer, isolated_database
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Споредба на пресметката на прогрес по нова лекција: по запишување, агрегат и од бројачите'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--lessons', type=int, default=20)
+        parser.add_argument('--skip-legacy', action='store_true', help='Без постоечката јамка (бавна за големи курсеви)')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            course = self._setup(options['students'], options['lessons'])
+            self.stdout.write(f"{options['students']} студенти, {options['lessons']} лекции")
+
+            paths = [
+                ('агрегат (recompute_course_progress)', lambda: recompute_course_progress(course.id)),
+                ('бројачи (refresh_course_progress)', lambda: refresh_course_progress(course.id)),
+            ]
+            if not options['skip_legacy']:
+                paths.insert(0, ('по запишување (оригинална јамка)', lambda: self._legacy(course)))
+
+            for label, path in paths:
+                # Иста почетна состојба за секоја патека
+                Enrollment.objects.filter(course=course).update(progress_percentage=0, is_completed=False, completed_at=None)
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries), Timer() as timer:
+                    path()
+                self.stdout.write(f'{label:<40} {timer.elapsed:8.3f}s {queries.count:8d} прашања')
+
+            completed = Enrollment.objects.filter(course=course, is_completed=True).count()
+            self.stdout.write(f'Завршени запишувања: {completed}')
+
+    def _setup(self, students, lessons):
+        instructor = User.objects.create_user(username='bench_instructor', password='bench', user_type='instructor')
+        category = Category.objects.create(name='Benchmark')
+        course = Course.objects.create(
+            title='Benchmark', slug='benchmark', description='-', instructor=instructor,
+            category=category, difficulty='beginner', what_you_learn='-', status='draft'
+        )
+        # bulk_create без сигнали - се мери само пресметката
+        lesson_list = Lesson.objects.bulk_create([
+            Lesson(course=course, title=f'Лекција {index}', lesson_type='text', order=index)
+            for index in range(lessons)
+        ])
+        Course.objects.filter(id=course.id).update(lesson_count=lessons)
+        users = User.objects.bulk_create([User(username=f'bench_{index}') for index in range(students)])
+
+        rng = random.Random(1)
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(student=user, course=course, completed_lessons=rng.randint(0, lessons))
+            for user in users
+        ])
+        LessonProgress.objects.bulk_create(
+            [
+                LessonProgress(enrollment=enrollment, lesson=lesson, is_completed=True)
+                for enrollment in enrollments
+                for lesson in lesson_list[:enrollment.completed_lessons]
+            ],
+            batch_size=5000
+        )
+        return course
+
+    @staticmethod
+    def _legacy(course):
+        """
+        Оригиналната јамка од сигналот за нова лекција, со оригиналниот
+        Enrollment.update_progress вметнат - без бројачите од courses.progress
+        """
+        for enrollment in Enrollment.objects.filter(course=course, is_active=True):
+            if enrollment.is_completed:
+                enrollment.is_completed = False
+                enrollment.completed_at = None
+                enrollment.save()
+
+            total_lessons = enrollment.course.lessons.count()
+            if total_lessons == 0:
+                enrollment.progress_percentage = 0.0
+                enrollment.is_completed = False
+                enrollment.completed_at = None
+            else:
+                completed_lessons = LessonProgress.objects.filter(
+                    enrollment=enrollment,
+                    is_completed=True
+                ).count()
+                enrollment.progress_percentage = round((completed_lessons / total_lessons) * 100, 2)
+                if completed_lessons >= total_lessons:
+                    enrollment.is_completed = True
+                    if not enrollment.completed_at:
+                        enrollment.completed_at = timezone.now()
+                else:
+                    enrollment.is_completed = False
+                    enrollment.completed_at = None
+            enrollment.save(update_fields=['progress_percentage', 'is_completed', 'completed_at'])
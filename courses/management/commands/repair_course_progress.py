@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from courses.progress import counter_drift, recompute_course_progress
+
+
+class Command(BaseCommand):
+    help = 'Провери ги бројачите за прогрес (lesson_count, completed_lessons) и поправи ги отстапувањата'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='ID на курс (може повеќе пати)')
+        parser.add_argument('--dry-run', action='store_true', help='Само прикажи ги курсевите со отстапување')
+
+    def handle(self, *args, **options):
+        drifted = counter_drift(options['courses'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Бројачите се точни.'))
+            return
+
+        for course_id in drifted:
+            if options['dry_run']:
+                self.stdout.write(f'Курс {course_id}: бројачите отстапуваат')
+            else:
+                updated = recompute_course_progress(course_id)
+                self.stdout.write(f'Курс {course_id}: поправени {updated} запишувања')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Курсеви со отстапување: {len(drifted)}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Поправени {len(drifted)} курсеви.'))
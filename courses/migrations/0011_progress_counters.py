@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Почетни вредности на бројачите, по едно UPDATE за секоја табела"""
+    Course = apps.get_model('courses', 'Course')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Lesson = apps.get_model('courses', 'Lesson')
+    LessonProgress = apps.get_model('courses', 'LessonProgress')
+
+    lessons = Lesson.objects.filter(course_id=OuterRef('id')).values('course_id').annotate(n=Count('id')).values('n')
+    Course.objects.update(lesson_count=Coalesce(Subquery(lessons, output_field=IntegerField()), Value(0)))
+
+    completed = LessonProgress.objects.filter(
+        enrollment_id=OuterRef('id'),
+        is_completed=True,
+        lesson__course_id=OuterRef('course_id')
+    ).values('enrollment_id').annotate(n=Count('lesson_id', distinct=True)).values('n')
+    Enrollment.objects.update(completed_lessons=Coalesce(Subquery(completed, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_enrollment_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_lessons',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def dedupe_lesson_progress(apps, schema_editor):
+    """
+    Пред unique ограничувањето: по (запишување, лекција) останува еден ред -
+    завршениот со најрано completed_at, инаку најстариот.
+    """
+    LessonProgress = apps.get_model('courses', 'LessonProgress')
+
+    duplicates = LessonProgress.objects.values('enrollment_id', 'lesson_id').annotate(
+        rows=Count('id')
+    ).filter(rows__gt=1)
+    for group in duplicates.iterator():
+        row_ids = list(LessonProgress.objects.filter(
+            enrollment_id=group['enrollment_id'],
+            lesson_id=group['lesson_id']
+        ).order_by('-is_completed', F('completed_at').asc(nulls_last=True), 'id').values_list('id', flat=True))
+        LessonProgress.objects.filter(id__in=row_ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_progress_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_lesson_progress, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lessonprogress',
+            index=models.Index(fields=['enrollment', 'is_completed', 'lesson'], name='courses_lp_enr_done_lesson_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lessonprogress',
+            constraint=models.UniqueConstraint(fields=('enrollment', 'lesson'), name='courses_lp_unique_enr_lesson'),
+        ),
+        # FK индексот е вишок откако постојат двата горни
+        migrations.AlterField(
+            model_name='lessonprogress',
+            name='enrollment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='courses.enrollment'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:52
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    SQLite: FTS5 табела (rowid = course id) за објавените курсеви што ја одржуваат
+    сигналите од courses.signals; remove_diacritics 0 - ѓ/ќ не се г/к. Postgres
+    пребарува со SearchVector без посебна табела.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    Course = apps.get_model('courses', 'Course')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS courses_course_fts USING fts5("
+        "title, description, what_you_learn, requirements, instructor, "
+        "tokenize = 'unicode61 remove_diacritics 0')"
+    )
+    courses = Course.objects.filter(status='published').values_list(
+        'id', 'title', 'description', 'what_you_learn', 'requirements',
+        'instructor__first_name', 'instructor__last_name', 'instructor__username'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO courses_course_fts (rowid, title, description, what_you_learn, requirements, instructor) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            [
+                (*row[:5], f'{first_name} {last_name}'.strip() or username)
+                for *row, first_name, last_name, username in courses
+            ]
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS courses_course_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_lessonprogress_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
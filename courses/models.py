@@ -34,6 +34,8 @@ class Course(models.Model):
     max_students = models.PositiveIntegerField(null=True, blank=True)
     requirements = models.TextField(blank=True)
     what_you_learn = models.TextField()
+    # Денормализиран број лекции; се одржува од сигналите за Lesson (courses.progress)
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -95,50 +97,38 @@ class Enrollment(models.Model):
     is_completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
     progress_percentage = models.FloatField(default=0.0)
+    # Завршени лекции од курсот; се менува со F() при означување (courses.progress)
+    completed_lessons = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ['student', 'course']
 
     def update_progress(self):
-        """Ажурирај го прогресот базиран на завршени лекции"""
-        total_lessons = self.course.lessons.count()
-
-        if total_lessons == 0:
-            self.progress_percentage = 0.0
-            self.is_completed = False
-            self.completed_at = None
-        else:
-            # Пребројте ги завршените лекции
-            completed_lessons = LessonProgress.objects.filter(
-                enrollment=self,
-                is_completed=True
-            ).count()
-
-            # Пресметај процент
-            self.progress_percentage = round((completed_lessons / total_lessons) * 100, 2)
-
-            # 🔥 ВАЖНО: Означи како завршен САМО ако сите лекции се завршени
-            if completed_lessons >= total_lessons:
-                self.is_completed = True
-                if not self.completed_at:
-                    from django.utils import timezone
-                    self.completed_at = timezone.now()
-            else:
-                # Ако не се сите завршени, ресетирај го статусот
-                self.is_completed = False
-                self.completed_at = None
-
-        self.save()
+        """Ажурирај го прогресот од бројачите completed_lessons и course.lesson_count"""
+        from .progress import progress_values
+
+        Enrollment.objects.filter(id=self.id).update(**progress_values())
+        self.refresh_from_db(fields=['completed_lessons', 'progress_percentage', 'is_completed', 'completed_at'])
 
     def __str__(self):
         return f"{self.student.username} - {self.course.title}"
 
 class LessonProgress(models.Model):
-    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE)
+    # Посебен индекс не треба - enrollment е прва колона во индексите подолу
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, db_index=False)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
     is_completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['enrollment', 'lesson'], name='courses_lp_unique_enr_lesson'),
+        ]
+        indexes = [
+            # Завршените лекции на запишување се читаат само од индексот
+            models.Index(fields=['enrollment', 'is_completed', 'lesson'], name='courses_lp_enr_done_lesson_idx'),
+        ]
+
 class Quiz(models.Model):
     # Еден квиз за една лекција. Преку related_name='quiz' пристапуваме во HTML.
     lesson = models.OneToOneField(Lesson, on_delete=models.CASCADE, related_name='quiz')
@@ -0,0 +1,256 @@
+# courses/progress.py
+
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Count, DateTimeField, Exists, F, FloatField, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, Greatest, Round, RowNumber
+from django.db.models.lookups import Exact, GreaterThanOrEqual
+from django.utils import timezone
+
+from .models import Course, Enrollment, Lesson, LessonProgress
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_DEFAULTS = {
+    # True - пресметката оди во позадинска нишка по commit, надвор од барањето
+    'DEFERRED': False,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_progress_config():
+    config = dict(PROGRESS_DEFAULTS)
+    config.update(getattr(settings, 'COURSE_PROGRESS', {}))
+    return config
+
+
+def progress_state(completed_lessons, total_lessons):
+    """(процент, завршен) - истата формула како Enrollment.update_progress"""
+    if total_lessons == 0:
+        return 0.0, False
+    return round((completed_lessons / total_lessons) * 100, 2), completed_lessons >= total_lessons
+
+
+def progress_values(delta=0, now=None):
+    """
+    Изрази за Enrollment UPDATE: completed_lessons + delta и прогресот од него и
+    Course.lesson_count, сè во едно прашање. SET ги гледа старите вредности, па
+    delta мора да влезе и во процентот.
+    """
+    now = now or timezone.now()
+    completed = F('completed_lessons') + delta
+    if delta < 0:
+        completed = Greatest(completed, 0)
+    total = Subquery(Course.objects.filter(id=OuterRef('course_id')).values('lesson_count')[:1])
+    return {
+        'completed_lessons': completed,
+        'progress_percentage': Case(
+            When(Exact(total, 0), then=Value(0.0)),
+            default=Round(Cast(completed, FloatField()) * 100 / total, 2),
+            output_field=FloatField()
+        ),
+        'is_completed': Case(
+            When(Exact(total, 0), then=Value(False)),
+            When(GreaterThanOrEqual(completed, total), then=Value(True)),
+            default=Value(False)
+        ),
+        'completed_at': Case(
+            When(Exact(total, 0), then=Value(None)),
+            When(GreaterThanOrEqual(completed, total), then=Coalesce(F('completed_at'), Value(now))),
+            default=Value(None),
+            output_field=DateTimeField()
+        ),
+    }
+
+
+def set_lesson_completed(enrollment, lesson, completed=True):
+    """
+    Означи/одзначи лекција; бројачот и прогресот на запишувањето се менуваат со
+    едно UPDATE само ако состојбата навистина се сменила. Враќа True ако се сменила.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if completed:
+            LessonProgress.objects.get_or_create(enrollment=enrollment, lesson=lesson)
+        changed = LessonProgress.objects.filter(
+            enrollment=enrollment,
+            lesson=lesson,
+            is_completed=not completed
+        ).update(is_completed=completed, completed_at=now if completed else None)
+        if changed:
+            Enrollment.objects.filter(id=enrollment.id).update(**progress_values(1 if completed else -1, now))
+    return bool(changed)
+
+
+def next_lessons(enrollments):
+    """
+    {course_id: Lesson} - првата незавршена лекција за секое запишување, или првата
+    лекција на курсот ако се сите завршени. Едно прашање за сите запишувања: по курс
+    и статус (завршена/не) се зема лекцијата со најмал order.
+    """
+    enrollment_ids = [enrollment.id for enrollment in enrollments]
+    if not enrollment_ids:
+        return {}
+
+    # Лекцијата е од еден курс, а студентот има едно запишување по курс
+    completed = LessonProgress.objects.filter(
+        enrollment_id__in=enrollment_ids,
+        lesson_id=OuterRef('id'),
+        is_completed=True
+    )
+    lessons = Lesson.objects.filter(
+        course_id__in={enrollment.course_id for enrollment in enrollments}
+    ).annotate(is_done=Exists(completed)).annotate(
+        position=Window(RowNumber(), partition_by=[F('course_id'), F('is_done')], order_by=F('order').asc())
+    ).filter(position=1).order_by()
+
+    result = {}
+    for lesson in lessons:
+        current = result.get(lesson.course_id)
+        if current is None or (current.is_done and not lesson.is_done):
+            result[lesson.course_id] = lesson
+    return result
+
+
+def count_lessons(course_id, delta):
+    """Course.lesson_count += delta атомски, без читање на курсот"""
+    Course.objects.filter(id=course_id).update(lesson_count=Greatest(F('lesson_count') + delta, 0))
+
+
+def uncount_completed_lesson(lesson):
+    """Пред бришење на лекција: намали го бројачот кај запишувањата што ја завршиле"""
+    Enrollment.objects.filter(
+        lessonprogress__lesson=lesson,
+        lessonprogress__is_completed=True
+    ).update(completed_lessons=Greatest(F('completed_lessons') - 1, 0))
+
+
+def refresh_course_progress(course_id):
+    """Прогрес на сите активни запишувања на курсот од бројачите - едно UPDATE"""
+    return Enrollment.objects.filter(course_id=course_id, is_active=True).update(**progress_values())
+
+
+def recompute_course_progress(course_id, batch_size=None):
+    """
+    Поправка на бројачите: lesson_count и завршените лекции се бројат одново (едно
+    агрегатно прашање), па по еден UPDATE за секоја различна нова вредност, само за
+    запишувањата што се промениле. Враќа број на ажурирани запишувања.
+    """
+    batch_size = batch_size or get_progress_config()['BATCH_SIZE']
+    total_lessons = Lesson.objects.filter(course_id=course_id).count()
+    Course.objects.filter(id=course_id).exclude(lesson_count=total_lessons).update(lesson_count=total_lessons)
+    rows = Enrollment.objects.filter(course_id=course_id).annotate(
+        counted_lessons=Count(
+            'lessonprogress__lesson',
+            filter=Q(lessonprogress__is_completed=True, lessonprogress__lesson__course_id=course_id),
+            distinct=True
+        )
+    ).values_list(
+        'id', 'is_active', 'counted_lessons', 'completed_lessons', 'progress_percentage', 'is_completed', 'completed_at'
+    )
+
+    now = timezone.now()
+    groups = defaultdict(list)
+    for enrollment_id, is_active, counted, completed_lessons, percentage, is_completed, completed_at in rows.iterator():
+        values = {}
+        if counted != completed_lessons:
+            values['completed_lessons'] = counted
+        # Неактивните го задржуваат прогресот од кога се отпишале
+        new_percentage, new_completed = progress_state(counted, total_lessons)
+        if is_active and (
+            (new_percentage, new_completed) != (percentage, is_completed) or bool(completed_at) != new_completed
+        ):
+            values.update(progress_percentage=new_percentage, is_completed=new_completed)
+            if not new_completed:
+                values['completed_at'] = None
+            elif not completed_at:
+                values['completed_at'] = now
+        if values:
+            groups[tuple(sorted(values.items()))].append(enrollment_id)
+
+    with transaction.atomic():
+        for values, enrollment_ids in groups.items():
+            for start in range(0, len(enrollment_ids), batch_size):
+                Enrollment.objects.filter(id__in=enrollment_ids[start:start + batch_size]).update(**dict(values))
+    return sum(map(len, groups.values()))
+
+
+def counter_drift(course_ids=None):
+    """
+    ID-а на курсевите чиј lesson_count или completed_lessons на некое запишување не
+    одговара. progress_percentage и is_completed не се проверуваат - тие се изведени
+    од овие два бројачи, а recompute_course_progress ги пресметува одново.
+    """
+    courses = Course.objects.all()
+    enrollments = Enrollment.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+        enrollments = enrollments.filter(course_id__in=course_ids)
+
+    drifted = set(
+        courses.annotate(counted=Count('lessons')).exclude(counted=F('lesson_count')).values_list('id', flat=True)
+    )
+    drifted.update(
+        enrollments.annotate(
+            counted=Count(
+                'lessonprogress__lesson',
+                filter=Q(lessonprogress__is_completed=True, lessonprogress__lesson__course_id=F('course_id')),
+                distinct=True
+            )
+        ).exclude(counted=F('completed_lessons')).values_list('course_id', flat=True).distinct()
+    )
+    return sorted(drifted)
+
+
+class ProgressWorker:
+    """
+    Една позадинска нишка. Курс што веќе чека во редот не се додава повторно, па
+    серија нови лекции завршува со една или две пресметки наместо по една за секоја.
+    """
+
+    def __init__(self):
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='course-progress')
+
+    def submit(self, course_id):
+        with self._lock:
+            if course_id in self._pending:
+                return None
+            self._pending.add(course_id)
+        return self._executor.submit(self._run, course_id)
+
+    def _run(self, course_id):
+        with self._lock:
+            # Промена додека трае пресметката закажува нова
+            self._pending.discard(course_id)
+        close_old_connections()
+        try:
+            refresh_course_progress(course_id)
+        except Exception:
+            logger.exception('Прогресот за курсот %s не е пресметан', course_id)
+        finally:
+            close_old_connections()
+
+
+_worker = None
+
+
+def get_progress_worker():
+    global _worker
+    if _worker is None:
+        _worker = ProgressWorker()
+    return _worker
+
+
+def schedule_course_refresh(course_id):
+    """По commit: во позадинската нишка (DEFERRED) или веднаш во истиот процес"""
+    if get_progress_config()['DEFERRED']:
+        transaction.on_commit(lambda: get_progress_worker().submit(course_id))
+    else:
+        transaction.on_commit(lambda: refresh_course_progress(course_id))
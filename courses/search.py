@@ -0,0 +1,177 @@
+# courses/search.py
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Course
+
+COURSE_SEARCH_DEFAULTS = {
+    # Најмногу толку најрелевантни курсеви (по филтрите) влегуваат во страничењето
+    'MAX_RESULTS': 500,
+    'MAX_TERMS': 8,
+    # bm25 тежини по колона: наслов, опис, што ќе научите, предуслови, инструктор
+    'WEIGHTS': (10.0, 2.0, 3.0, 1.0, 5.0),
+}
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def get_course_search_config():
+    config = dict(COURSE_SEARCH_DEFAULTS)
+    config.update(getattr(settings, 'COURSE_SEARCH', {}))
+    return config
+
+
+def search_terms(query):
+    """Зборовите од барањето (Unicode, па и кирилица); сè друго се игнорира"""
+    return _TERM_RE.findall(query.lower())[:get_course_search_config()['MAX_TERMS']]
+
+
+def instructor_name(user):
+    return f'{user.first_name} {user.last_name}'.strip() or user.username
+
+
+class SqliteCourseSearchBackend:
+    """
+    FTS5 табела courses_course_fts (rowid = course id) со unicode61 токенизација -
+    case folding и за кирилица, без отстранување дијакритици (ќ не е к). Ги содржи
+    објавените курсеви; се одржува од сигналите за Course и User.
+    """
+
+    def index(self, courses):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO courses_course_fts '
+                '(rowid, title, description, what_you_learn, requirements, instructor) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [
+                    (
+                        course.id, course.title, course.description, course.what_you_learn,
+                        course.requirements, instructor_name(course.instructor)
+                    )
+                    for course in courses
+                ]
+            )
+
+    def remove(self, course_ids):
+        placeholders = ', '.join(['%s'] * len(course_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM courses_course_fts WHERE rowid IN ({placeholders})', list(course_ids))
+
+    def search(self, queryset, terms, limit, weights):
+        # Секој збор како префикс, сите мора да се појават; bm25 е помал за подобар погодок.
+        # Филтрите од queryset-от се во истото прашање, па ограничувањето важи по нив
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weight_placeholders = ', '.join(['%s'] * len(weights))
+        filtered_sql, filtered_params = queryset.order_by().values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM courses_course_fts WHERE courses_course_fts MATCH %s '
+                f'AND rowid IN ({filtered_sql}) '
+                f'ORDER BY bm25(courses_course_fts, {weight_placeholders}) LIMIT %s',
+                [match, *filtered_params, *weights, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresCourseSearchBackend:
+    """SearchVector со тежини и SearchRank; векторот се пресметува во прашањето"""
+
+    def index(self, courses):
+        pass
+
+    def remove(self, course_ids):
+        pass
+
+    def search(self, queryset, terms, limit, weights):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        # 'simple' конфигурација - нема речник за македонски, само lowercase
+        vector = (
+            SearchVector('title', weight='A', config='simple')
+            + SearchVector('instructor__first_name', 'instructor__last_name', weight='B', config='simple')
+            + SearchVector('what_you_learn', 'description', weight='C', config='simple')
+            + SearchVector('requirements', weight='D', config='simple')
+        )
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='simple')
+        return list(
+            queryset.annotate(search=vector).filter(search=query).annotate(
+                rank=SearchRank(vector, query)
+            ).order_by('-rank', 'id').values_list('id', flat=True)[:limit]
+        )
+
+
+_BACKENDS = {
+    'sqlite': SqliteCourseSearchBackend,
+    'postgresql': PostgresCourseSearchBackend,
+}
+
+
+def get_course_search_backend():
+    """None за бази без поддржан full-text индекс"""
+    backend_class = _BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def index_courses(courses):
+    """Во индексот се само објавените курсеви; останатите се вадат од него"""
+    backend = get_course_search_backend()
+    if backend is None:
+        return
+    published = [course for course in courses if course.status == 'published']
+    hidden = [course.id for course in courses if course.status != 'published']
+    if published:
+        backend.index(published)
+    if hidden:
+        backend.remove(hidden)
+
+
+def remove_courses(course_ids):
+    backend = get_course_search_backend()
+    if backend is not None and course_ids:
+        backend.remove(course_ids)
+
+
+def reindex_instructor(user):
+    """Променето име на инструктор - курсевите му се индексираат одново"""
+    index_courses(list(Course.objects.filter(instructor=user).select_related('instructor')))
+
+
+def search_courses(queryset, query, by_relevance=True):
+    """
+    Queryset ограничен на курсевите што ги содржат сите зборови од барањето (како
+    префикси); со by_relevance подреден по bm25 / ts_rank. Филтрите треба да се
+    веќе на queryset-от - MAX_RESULTS важи по нив. Бази без full-text индекс
+    паѓаат назад на icontains.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    backend = get_course_search_backend()
+    if backend is None:
+        # Истите полиња како instructor колоната во индексот
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term)
+                | Q(description__icontains=term)
+                | Q(instructor__first_name__icontains=term)
+                | Q(instructor__last_name__icontains=term)
+                | Q(instructor__username__icontains=term)
+            )
+        return queryset
+
+    config = get_course_search_config()
+    course_ids = backend.search(queryset, terms, config['MAX_RESULTS'], config['WEIGHTS'])
+    queryset = queryset.filter(id__in=course_ids)
+    if by_relevance:
+        queryset = queryset.order_by(
+            Case(
+                *[When(id=course_id, then=Value(position)) for position, course_id in enumerate(course_ids)],
+                output_field=IntegerField()
+            )
+        )
+    return queryset
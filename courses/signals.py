@@ -1,8 +1,12 @@
 # courses/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from .models import Course, Enrollment, Lesson
+from .progress import count_lessons, schedule_course_refresh, uncount_completed_lesson
+from .search import index_courses, reindex_instructor, remove_courses
+from chat.membership import course_room_name, schedule_course_sync
 from chat.models import ChatRoom
 
 
@@ -11,7 +15,7 @@ def create_course_chat_room(sender, instance, created, **kwargs):
     """Автоматски креирај чет соба за нов објавен курс"""
     if created and instance.status == 'published':
         chat_room = ChatRoom.objects.create(
-            name=f'Чет за {instance.title}',
+            name=course_room_name(instance),
             room_type='course',
             course=instance,
             created_by=instance.instructor
@@ -19,31 +23,37 @@ def create_course_chat_room(sender, instance, created, **kwargs):
         chat_room.participants.add(instance.instructor)
 
 
+@receiver(post_save, sender=Course)
+def update_course_search_index(sender, instance, **kwargs):
+    """Курсот во full-text индексот (или надвор ако не е објавен), во истата трансакција"""
+    index_courses([instance])
+
+
+@receiver(post_delete, sender=Course)
+def remove_course_from_search_index(sender, instance, **kwargs):
+    remove_courses([instance.id])
+
+
+@receiver(post_save, sender=get_user_model())
+def update_instructor_in_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """Името на инструкторот е дел од индексот; last_login и слични зачувувања се прескокнуваат"""
+    if created or (update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields)):
+        return
+    reindex_instructor(instance)
+
+
 @receiver(post_save, sender=Enrollment)
-def add_student_to_course_chat(sender, instance, created, **kwargs):
-    """Додај студент во чет собата на курсот кога се запишува"""
-    if created and instance.is_active:
-        try:
-            chat_room = instance.course.chat_room
-            chat_room.participants.add(instance.student)
-        except ChatRoom.DoesNotExist:
-            chat_room = ChatRoom.objects.create(
-                name=f'Чет за {instance.course.title}',
-                room_type='course',
-                course=instance.course,
-                created_by=instance.course.instructor
-            )
-            chat_room.participants.add(instance.course.instructor, instance.student)
+def add_student_to_course_chat(sender, instance, created, update_fields=None, **kwargs):
+    """Запишување или промена на is_active - синхронизирај го студентот во курс собата по commit"""
+    if not created and update_fields is not None and 'is_active' not in update_fields:
+        return
+    schedule_course_sync(instance.course_id, instance.student_id)
 
 
 @receiver(post_delete, sender=Enrollment)
 def remove_student_from_course_chat(sender, instance, **kwargs):
     """Отстрани студент од чет собата кога се отпишува"""
-    try:
-        chat_room = instance.course.chat_room
-        chat_room.participants.remove(instance.student)
-    except (ChatRoom.DoesNotExist, ValueError):
-        pass
+    schedule_course_sync(instance.course_id, instance.student_id)
 
 
 @receiver(post_save, sender=Lesson)
@@ -53,21 +63,14 @@ def update_enrollments_on_new_lesson(sender, instance, created, **kwargs):
     и ресетирај го статусот "завршено" ако беше завршен курсот
     """
     if created:
-        course = instance.course
-        enrollments = Enrollment.objects.filter(
-            course=course,
-            is_active=True
-        )
+        count_lessons(instance.course_id, 1)
+        schedule_course_refresh(instance.course_id)
 
-        for enrollment in enrollments:
-            # 🆕 Ако курсот беше завршен, ресетирај го
-            if enrollment.is_completed:
-                enrollment.is_completed = False
-                enrollment.completed_at = None
-                enrollment.save()
 
-            # Ажурирај го прогресот (ова ќе пресмета нов процент)
-            enrollment.update_progress()
+@receiver(pre_delete, sender=Lesson)
+def uncount_deleted_lesson(sender, instance, **kwargs):
+    """Пред каскадата да го избрише LessonProgress - кој ја завршил лекцијата"""
+    uncount_completed_lesson(instance)
 
 
 @receiver(post_delete, sender=Lesson)
@@ -75,11 +78,5 @@ def update_enrollments_on_lesson_delete(sender, instance, **kwargs):
     """
     Кога се брише лекција, ажурирај го прогресот на сите запишани студенти
     """
-    course = instance.course
-    enrollments = Enrollment.objects.filter(
-        course=course,
-        is_active=True
-    )
-
-    for enrollment in enrollments:
-        enrollment.update_progress()
\ No newline at end of file
+    count_lessons(instance.course_id, -1)
+    schedule_course_refresh(instance.course_id)
@@ -1,3 +1,184 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import Category, Course, Enrollment, Lesson, LessonProgress
+from .progress import counter_drift, set_lesson_completed
+
+User = get_user_model()
+
+LESSON_TEXT = 'Ова е текст на лекцијата со доволно зборови за валидацијата да помине.'
+
+
+class LessonProgressIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        instructor = User.objects.create_user(username='instructor', password='test', user_type='instructor')
+        student = User.objects.create_user(username='student', password='test', user_type='student')
+        course = Course.objects.create(
+            title='Курс', description='-', instructor=instructor, category=Category.objects.create(name='Категорија'),
+            difficulty='beginner', what_you_learn='-', status='draft'
+        )
+        cls.lessons = [
+            Lesson.objects.create(course=course, title=f'Лекција {order}', lesson_type='text', content=LESSON_TEXT, order=order)
+            for order in range(3)
+        ]
+        cls.enrollment = Enrollment.objects.create(student=student, course=course)
+
+    def test_duplicate_progress_rejected(self):
+        LessonProgress.objects.create(enrollment=self.enrollment, lesson=self.lessons[0])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LessonProgress.objects.create(enrollment=self.enrollment, lesson=self.lessons[0])
+
+    def test_completing_twice_keeps_one_row(self):
+        self.assertTrue(set_lesson_completed(self.enrollment, self.lessons[0]))
+        self.assertFalse(set_lesson_completed(self.enrollment, self.lessons[0]))
+
+        self.assertEqual(LessonProgress.objects.filter(enrollment=self.enrollment).count(), 1)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 1)
+        self.assertEqual(self.enrollment.progress_percentage, 33.33)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN излезот е специфичен за SQLite')
+    def test_completed_lessons_lookup_uses_covering_index(self):
+        plan = LessonProgress.objects.filter(
+            enrollment=self.enrollment,
+            is_completed=True
+        ).values_list('lesson_id', flat=True).explain()
+
+        self.assertIn('USING COVERING INDEX courses_lp_enr_done_lesson_idx', plan)
+        self.assertNotIn('SCAN', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN излезот е специфичен за SQLite')
+    def test_single_lesson_lookup_uses_index(self):
+        plan = LessonProgress.objects.filter(enrollment=self.enrollment, lesson=self.lessons[0]).explain()
+
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('SCAN', plan)
+
+
+# Прогресот се пресметува во истата нишка - позадинската не ја гледа трансакцијата на тестот
+@override_settings(COURSE_PROGRESS={'DEFERRED': False}, CHAT_ACCESS_CACHE={'SHARED_ALIAS': None})
+class ProgressCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        instructor = User.objects.create_user(username='instructor', password='test', user_type='instructor')
+        student = User.objects.create_user(username='student', password='test', user_type='student')
+        cls.course = Course.objects.create(
+            title='Курс', description='-', instructor=instructor, category=Category.objects.create(name='Категорија'),
+            difficulty='beginner', what_you_learn='-', status='draft'
+        )
+        cls.lessons = [cls.create_lesson(order) for order in range(4)]
+        cls.enrollment = Enrollment.objects.create(student=student, course=cls.course)
+
+    @classmethod
+    def create_lesson(cls, order):
+        return Lesson.objects.create(
+            course=cls.course, title=f'Лекција {order}', lesson_type='text', content=LESSON_TEXT, order=order
+        )
+
+    def setUp(self):
+        for lesson in self.lessons[:2]:
+            set_lesson_completed(self.enrollment, lesson)
+
+    def counters(self):
+        self.course.refresh_from_db(fields=['lesson_count'])
+        self.enrollment.refresh_from_db()
+        self.assertEqual(counter_drift([self.course.id]), [])
+        return self.course.lesson_count, self.enrollment.completed_lessons, self.enrollment.progress_percentage
+
+    def test_completed_lessons_counted(self):
+        self.assertEqual(self.counters(), (4, 2, 50.0))
+
+    def test_adding_lesson(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_lesson(4)
+
+        self.assertEqual(self.counters(), (5, 2, 40.0))
+
+    def test_deleting_completed_lesson(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lessons[0].delete()
+
+        self.assertEqual(self.counters(), (3, 1, 33.33))
+
+    def test_deleting_open_lesson(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lessons[3].delete()
+
+        self.assertEqual(self.counters(), (3, 2, 66.67))
+
+    def test_uncompleting_lesson(self):
+        self.assertTrue(set_lesson_completed(self.enrollment, self.lessons[1], completed=False))
+        self.assertFalse(set_lesson_completed(self.enrollment, self.lessons[1], completed=False))
+
+        self.assertEqual(self.counters(), (4, 1, 25.0))
+
+    def test_drift_detected(self):
+        Enrollment.objects.filter(id=self.enrollment.id).update(completed_lessons=3)
+        Course.objects.filter(id=self.course.id).update(lesson_count=4)
+
+        self.assertEqual(counter_drift([self.course.id]), [self.course.id])
+
+
+# Курсот добива чет соба - без Redis кешот за пристап
+@override_settings(COURSE_SEARCH={'MAX_RESULTS': 3}, CHAT_ACCESS_CACHE={'SHARED_ALIAS': None})
+class CourseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(username='instructor', password='test', user_type='instructor')
+        cls.category = Category.objects.create(name='Категорија')
+        cls.other_category = Category.objects.create(name='Друга')
+
+        # Повеќе од MAX_RESULTS подобри погодоци што не минуваат низ филтрите
+        for index in range(5):
+            cls.create_course(f'Python Python {index}', 'Python за почетници')
+        cls.advanced = cls.create_course('Веб развој', 'Напредни теми со Python', difficulty='advanced')
+        cls.paid = cls.create_course('Алгоритми', 'Задачи во Python', price=20)
+        cls.categorized = cls.create_course('Податоци', 'Анализа со Python', category=cls.other_category)
+
+    @classmethod
+    def create_course(cls, title, description, difficulty='beginner', price=0, category=None, instructor=None):
+        return Course.objects.create(
+            title=title, slug=f'course-{Course.objects.count()}', description=description,
+            instructor=instructor or cls.instructor, category=category or cls.category, difficulty=difficulty,
+            what_you_learn='-', price=price, status='published'
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('courses:list'), {'search': 'python', **params})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['courses'])
+
+    def test_unfiltered_search_capped_by_relevance(self):
+        courses = self.search()
+
+        self.assertEqual(len(courses), 3)
+        self.assertTrue(all(course.title.startswith('Python') for course in courses))
+
+    def test_macedonian_letters_not_folded(self):
+        course = self.create_course('Ќерамика', 'Основи на ѓерамидите')
+
+        self.assertEqual(self.search(search='ќерамика'), [course])
+        self.assertEqual(self.search(search='керамика'), [])
+        self.assertEqual(self.search(search='герамиди'), [])
+
+    def test_instructor_name_matched(self):
+        instructor = User.objects.create_user(
+            username='teacher', password='test', user_type='instructor', first_name='Maria', last_name='Petrova'
+        )
+        course = self.create_course('Хемија', 'Основи', instructor=instructor)
+
+        self.assertEqual(self.search(search='petrova'), [course])
+        # Без full-text индекс (icontains) - истите полиња
+        with mock.patch('courses.search.get_course_search_backend', return_value=None):
+            self.assertEqual(self.search(search='petrova'), [course])
+            self.assertEqual(self.search(search='teacher'), [course])
+
+    def test_filters_applied_before_cap(self):
+        self.assertEqual(self.search(difficulty='advanced'), [self.advanced])
+        self.assertEqual(self.search(price='paid'), [self.paid])
+        self.assertEqual(self.search(category=self.other_category.id), [self.categorized])
@@ -4,12 +4,13 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
 from django.contrib import messages
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Count
-from django.utils import timezone
+from django.db.models import Count
 
 from .models import Course, Category, Lesson, Enrollment, LessonProgress, Quiz, Question, Answer, QuizAttempt, \
     StudentAnswer
 from .forms import CourseForm, LessonForm
+from .progress import set_lesson_completed
+from .search import search_courses
 from .ai_quiz_generator import extract_text_from_pdf, generate_quiz_from_text
 
 
@@ -29,16 +30,6 @@ class CourseListView(ListView):
     def get_queryset(self):
         queryset = Course.objects.filter(status='published').select_related('instructor', 'category')
 
-        # 🔍 Филтрирање по пребарување
-        search_query = self.request.GET.get('search', '').strip()
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(instructor__first_name__icontains=search_query) |
-                Q(instructor__last_name__icontains=search_query)
-            )
-
         # 📁 Филтрирање по категорија
         category_id = self.request.GET.get('category', '').strip()
         if category_id:
@@ -59,20 +50,18 @@ class CourseListView(ListView):
         elif price_filter == 'paid':
             queryset = queryset.filter(price__gt=0)
 
-        # 🔀 Сортирање
-        sort_by = self.request.GET.get('sort', '-created_at').strip()
+        # 🔀 Сортирање; relevance важи само со пребарување, инаку најнови
+        sort_by = self.request.GET.get('sort', 'relevance').strip()
         valid_sorts = ['-created_at', 'created_at', 'price', '-price', 'title', '-title']
         if sort_by in valid_sorts:
             queryset = queryset.order_by(sort_by)
         else:
             queryset = queryset.order_by('-created_at')
 
-        print(f"🔍 Search: {search_query}")
-        print(f"📁 Category: {category_id}")
-        print(f"📊 Difficulty: {difficulty}")
-        print(f"💰 Price: {price_filter}")
-        print(f"🔀 Sort: {sort_by}")
-        print(f"📋 Results: {queryset.count()}")
+        # 🔍 Full-text пребарување (наслов, опис, содржина, инструктор), рангирано по релевантност
+        search_query = self.request.GET.get('search', '').strip()
+        if search_query:
+            queryset = search_courses(queryset, search_query, by_relevance=sort_by not in valid_sorts)
 
         return queryset
 
@@ -83,7 +72,7 @@ class CourseListView(ListView):
         context['selected_category'] = self.request.GET.get('category', '')
         context['selected_difficulty'] = self.request.GET.get('difficulty', '')
         context['selected_price'] = self.request.GET.get('price', '')
-        context['selected_sort'] = self.request.GET.get('sort', '-created_at')
+        context['selected_sort'] = self.request.GET.get('sort', 'relevance')
         return context
 
 
@@ -270,20 +259,8 @@ class LessonDetailView(LoginRequiredMixin, View):
             messages.error(request, 'Морате да се запишете на курсот за да можете да означувате лекции.')
             return redirect('courses:detail', slug=slug)
 
-        # Креирај или ажурирај прогрес
-        progress, created = LessonProgress.objects.get_or_create(
-            enrollment=enrollment,
-            lesson=lesson
-        )
-
-        if not progress.is_completed:
-            progress.is_completed = True
-            progress.completed_at = timezone.now()
-            progress.save()
-
-            # Ажурирај го вкупниот прогрес
-            enrollment.update_progress()
-
+        # Означи ја лекцијата; бројачот и прогресот се ажурираат со едно UPDATE
+        if set_lesson_completed(enrollment, lesson):
             messages.success(request, f'✅ Лекцијата "{lesson.title}" е означена како завршена!')
         else:
             messages.info(request, 'Оваа лекција е веќе означена како завршена.')
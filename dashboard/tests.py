@@ -1,3 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from courses.models import Category, Course, Enrollment, Lesson
+from courses.progress import set_lesson_completed
+
+User = get_user_model()
+
+LESSON_TEXT = 'Ова е текст на лекцијата со доволно зборови за валидацијата да помине.'
+
+
+class MyCoursesViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(username='instructor', password='test', user_type='instructor')
+        cls.student = User.objects.create_user(username='student', password='test', user_type='student')
+        cls.category = Category.objects.create(name='Категорија')
+
+    def setUp(self):
+        self.client.force_login(self.student)
+
+    def enroll(self, index, lessons=3, completed=0):
+        course = Course.objects.create(
+            title=f'Курс {index}', description='-', instructor=self.instructor, category=self.category,
+            difficulty='beginner', what_you_learn='-', status='draft'
+        )
+        lesson_list = [
+            Lesson.objects.create(course=course, title=f'Лекција {order}', lesson_type='text', content=LESSON_TEXT, order=order)
+            for order in range(lessons)
+        ]
+        enrollment = Enrollment.objects.create(student=self.student, course=course)
+        for lesson in lesson_list[:completed]:
+            set_lesson_completed(enrollment, lesson)
+        return course, lesson_list
+
+    def page_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard:my_courses'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_enrollments(self):
+        for index in range(2):
+            self.enroll(index, completed=index)
+        _, few = self.page_queries()
+
+        for index in range(2, 12):
+            self.enroll(index, completed=index % 4)
+        response, many = self.page_queries()
+
+        self.assertEqual(len(response.context['courses']), 12)
+        self.assertEqual(few, many)
+
+    def test_next_lesson_is_first_incomplete_by_order(self):
+        course, lessons = self.enroll(0, lessons=4)
+        enrollment = Enrollment.objects.get(student=self.student, course=course)
+        set_lesson_completed(enrollment, lessons[0])
+        set_lesson_completed(enrollment, lessons[2])
+
+        response, _ = self.page_queries()
+
+        self.assertEqual(response.context['courses'][0].next_lesson, lessons[1])
+
+    def test_completed_course_points_to_first_lesson(self):
+        _, lessons = self.enroll(0, lessons=2, completed=2)
+
+        response, _ = self.page_queries()
+
+        self.assertEqual(response.context['courses'][0].next_lesson, lessons[0])
@@ -3,8 +3,9 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
 from courses.models import Course, Enrollment
 from chat.models import ChatRoom
+from chat.unread import unread_counts
 from django.db.models import Count, Q
-from courses.models import Course, Enrollment, LessonProgress
+from courses.progress import next_lessons
 
 class DashboardHomeView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard/home.html'
@@ -46,10 +47,15 @@ class DashboardHomeView(LoginRequiredMixin, TemplateView):
         ).order_by('-created_at')[:6]
 
 
-        context['active_chat_rooms'] = ChatRoom.objects.filter(
+        context['active_chat_rooms'] = list(ChatRoom.objects.filter(
             participants=user,
             is_active=True
-        ).order_by('-created_at')[:5]
+        ).order_by('-created_at')[:5])
+
+        counts = unread_counts(user)
+        for room in context['active_chat_rooms']:
+            room.unread_count = counts.get(room.id, 0)
+        context['total_unread'] = sum(counts.values())
 
         return context
 
@@ -70,27 +76,17 @@ class MyCoursesView(LoginRequiredMixin, TemplateView):
             ).order_by('-created_at')
         else:
 
-            enrollments = Enrollment.objects.filter(
+            enrollments = list(Enrollment.objects.filter(
                 student=user,
                 is_active=True
-            ).select_related('course', 'course__instructor', 'course__category')
+            ).select_related('course', 'course__instructor', 'course__category'))
 
+            next_by_course = next_lessons(enrollments)
             courses = []
             for enrollment in enrollments:
                 course = enrollment.course
                 course.enrollment = enrollment
-
-                # Најди ја првата незавршена лекција
-                completed_lessons = LessonProgress.objects.filter(
-                    enrollment=enrollment,
-                    is_completed=True
-                ).values_list('lesson_id', flat=True)
-
-                next_lesson = course.lessons.exclude(
-                    id__in=completed_lessons
-                ).order_by('order').first()
-
-                course.next_lesson = next_lesson or course.lessons.first()
+                course.next_lesson = next_by_course.get(course.id)
                 courses.append(course)
 
         context['courses'] = courses
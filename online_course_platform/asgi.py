@@ -14,6 +14,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import chat.routing
+from chat.persistence import lifespan
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'online_course_platform.settings')
 
@@ -24,4 +25,6 @@ application = ProtocolTypeRouter({
             chat.routing.websocket_urlpatterns
         )
     ),
+    # Гасење: write-behind редот се запишува (серверите што праќаат lifespan)
+    "lifespan": lifespan,
 })
@@ -0,0 +1,70 @@
+# online_course_platform/benchmarking.py
+
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """Привремена база за benchmark команди, за да не се допира развојната база"""
+    temp_dir = None
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_name = test_settings.get('NAME')
+
+    if connection.vendor == 'sqlite' and not old_name:
+        # Фајл наместо in-memory база за да се мерат вистински запишувања на диск
+        temp_dir = tempfile.mkdtemp(prefix='bench_')
+        test_settings['NAME'] = os.path.join(temp_dir, 'bench.sqlite3')
+
+    old_config = setup_databases(verbosity, interactive=False, serialized_aliases=[])
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        test_settings['NAME'] = old_name
+        if temp_dir:
+            for name in os.listdir(temp_dir):
+                os.remove(os.path.join(temp_dir, name))
+            os.rmdir(temp_dir)
+
+
+class Timer:
+    """Мери поминато време во секунди"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+
+
+class QueryCounter:
+    """Брои SQL прашања и во нишката на database_sync_to_async"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def percentile(values, pct):
+    """Перцентил со линеарна интерполација; pct од 0 до 100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -83,6 +83,137 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Кеш: local-memory за секој процес и Redis заеднички за сите процеси
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'chat': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+# Кеш за членство во чет соби (room_id, user_id); локалниот tier има краток TTL
+# бидејќи инвалидацијата не стигнува до другите процеси
+CHAT_ACCESS_CACHE = {
+    'LOCAL_ALIAS': 'default',
+    'LOCAL_TIMEOUT': 5,
+    'SHARED_ALIAS': 'chat',
+    'SHARED_TIMEOUT': 300,
+}
+
+# Write-behind запишување на чет пораки (исклучено = секоја порака се запишува веднаш).
+# 'buffered': пораките во редот (до FLUSH_INTERVAL_MS) се губат ако процесот умре; при
+# уредно гасење ги запишува ASGI lifespan-от, но Daphne не праќа lifespan настани
+CHAT_WRITE_BEHIND = {
+    'ENABLED': config('CHAT_WRITE_BEHIND', default=False, cast=bool),
+    'FLUSH_INTERVAL_MS': 50,
+    'BATCH_SIZE': 100,
+    'DURABILITY': 'buffered',  # 'buffered' или 'committed'
+    'ORDERING': 'strict',  # 'strict' или 'relaxed'
+    'MAX_INFLIGHT': 4,
+}
+
+# Потврдите "прочитано до X" се запишуваат најмногу еднаш во овој интервал по конекција
+CHAT_READ_RECEIPT_DEBOUNCE_MS = 1000
+
+# Индикатор за пишување: една агрегирана порака по соба на секој tick,
+# корисникот автоматски престанува да "пишува" по EXPIRY_MS без освежување
+CHAT_TYPING = {
+    'TICK_MS': 500,
+    'EXPIRY_MS': 5000,
+}
+
+# Присуство во чет соби: конекциите се освежуваат на секои HEARTBEAT_S и истекуваат
+# по TTL_S; влез/излез се објавува спакувано на секој TICK_MS
+CHAT_PRESENCE = {
+    'TICK_MS': 1000,
+    'HEARTBEAT_S': 15,
+    'TTL_S': 45,
+}
+
+# Енкодер за broadcast фрејмовите во четот: 'json' или 'orjson' (ако е инсталиран)
+CHAT_JSON_ENCODER = 'json'
+
+# Најмногу соби на една мултиплексирана конекција (ws/chat/)
+CHAT_MULTIPLEX_MAX_ROOMS = 50
+
+# Ограничен излезен ред по WebSocket конекција (бавни клиенти): над EPHEMERAL_LIMIT
+# се фрлаат typing/presence, над MAX_FRAMES пораките се спојуваат во resync ('coalesce')
+# или конекцијата се затвора со resume токен ('disconnect'). Редот се полни кога
+# клиентот има ACK_WINDOW непотврдени фрејмови ({"type": "ack", "received": N});
+# клиентите што не праќаат потврди не се успоруваат
+CHAT_OUTBOUND = {
+    'MAX_FRAMES': 256,
+    'EPHEMERAL_LIMIT': 32,
+    'OVERFLOW': 'coalesce',
+    'ACK_WINDOW': 128,
+}
+
+# Обновување на прекината конекција: последните BUFFER_SIZE пораки по соба се чуваат
+# во Redis (или меморија) за replay; постара празнина се чита од базата
+CHAT_RESUME = {
+    'TOKEN_MAX_AGE_S': 300,
+    'BUFFER_SIZE': 200,
+    'BUFFER_TTL_S': 3600,
+    'MAX_REPLAY': 500,
+}
+
+# Кеш за најновите пораки по соба (ChatRoomView и првата страница од историјата)
+CHAT_RECENT_CACHE = {
+    'ALIAS': 'chat',
+    'SIZE': 50,
+    'TIMEOUT': 600,
+}
+
+# Прикачување фајлови во четот: делови од CHUNK_SIZE се пишуваат директно во
+# MEDIA_ROOT/chat_files, а сликите (thumbnail, димензии) се обработуваат во pool од WORKERS нишки.
+# Напуштените и неуспешните прикачувања ги чисти командата cleanup_chat_uploads
+CHAT_UPLOADS = {
+    'MAX_SIZE': 25 * 1024 * 1024,
+    'CHUNK_SIZE': 1024 * 1024,
+    'THUMBNAIL_SIZE': (320, 320),
+    'WORKERS': 2,
+}
+
+# Пребарување пораки: FTS5 (SQLite) или to_tsvector GIN индекс (Postgres);
+# секој збор од барањето се бара како префикс
+CHAT_SEARCH = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 50,
+    'SNIPPET_WORDS': 12,
+}
+
+# Задржување на пораки: постарите од DEFAULT_DAYS (или ChatRoom.retention_days) ги
+# преместува командата archive_chat_messages во ArchivedMessage; None - без архивирање
+CHAT_RETENTION = {
+    'DEFAULT_DAYS': None,
+    'BATCH_SIZE': 1000,
+}
+
+# Token bucket за нови пораки по корисник и по соба (во Redis-от од channel layer-от
+# или во меморија); RATE е пораки во секунда, BURST најголем налет
+CHAT_RATE_LIMIT = {
+    'USER_RATE': 1.0,
+    'USER_BURST': 10,
+    'ROOM_RATE': 20.0,
+    'ROOM_BURST': 60,
+}
+
+# Прогрес на запишувањата по нова/избришана лекција: едно UPDATE од бројачите
+# по курс, во позадинска нишка по commit (DEFERRED)
+COURSE_PROGRESS = {
+    'DEFERRED': True,
+    'BATCH_SIZE': 500,
+}
+
+# Пребарување на каталогот: FTS5 (SQLite) / SearchVector (Postgres), bm25 рангирање
+COURSE_SEARCH = {
+    'MAX_RESULTS': 500,
+    'MAX_TERMS': 8,
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {